@@ -0,0 +1,50 @@
+import java.nio.file.Paths;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+
+import jdk.jfr.consumer.RecordedEvent;
+import jdk.jfr.consumer.RecordedFrame;
+import jdk.jfr.consumer.RecordedStackTrace;
+import jdk.jfr.consumer.RecordedThread;
+import jdk.jfr.consumer.RecordingFile;
+
+/**
+ * Prints the collapsed stacks ("thread;frame;...;frame count", root first) of the
+ * execution samples of a JFR recording, see task_profiler.py. Stacks cut at the
+ * recorded stack depth start with a "[truncated]" frame. Uses the JFR consumer
+ * API of JDK 11, so it is run from source: java JfrCollapsedStacks.java recording.jfr
+ */
+public class JfrCollapsedStacks {
+  public static void main(String[] args) throws Exception {
+    Map<String, Long> stacks = new HashMap<>();
+
+    try (RecordingFile recording = new RecordingFile(Paths.get(args[0]))) {
+      while (recording.hasMoreEvents()) {
+        RecordedEvent event = recording.readEvent();
+        if (!event.getEventType().getName().equals("jdk.ExecutionSample")) {
+          continue;
+        }
+
+        RecordedThread thread = event.getThread("sampledThread");
+        StringBuilder stack = new StringBuilder(thread == null || thread.getJavaName() == null ?
+                                                "?" : thread.getJavaName());
+        RecordedStackTrace stackTrace = event.getStackTrace();
+        List<RecordedFrame> frames = stackTrace == null ? List.of() : stackTrace.getFrames();
+        if (stackTrace != null && stackTrace.isTruncated()) {
+          // deeper than -XX:FlightRecorderOptions=stackdepth, the root frames are missing
+          stack.append(";[truncated]");
+        }
+        for (int i = frames.size() - 1; i >= 0; i--) {
+          stack.append(';').append(frames.get(i).getMethod().getType().getName())
+               .append('.').append(frames.get(i).getMethod().getName());
+        }
+        stacks.merge(stack.toString(), 1L, Long::sum);
+      }
+    }
+
+    for (Map.Entry<String, Long> entry : stacks.entrySet()) {
+      System.out.println(entry.getKey() + " " + entry.getValue());
+    }
+  }
+}
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import time
+import subprocess
+from collections import namedtuple
+
+# this module will be placed in the same directory as this file by Dockerfile 'COPY'
+import util
+
+"""
+Benchmark of the per test case overhead of preparing the Hadoop environment.
+A "cold" case formats the namenode and starts/stops every daemon
+(util.hadoop_start_up() and util.hadoop_tear_down()), which is what the tests used
+to do for every case. A "warm" case reuses a running environment and only resets it
+with util.HadoopSession.reset(). No job is run, so only the setup cost is measured.
+
+The cost of executing a command as the hadoop user is also measured, either by spawning
+"su" for it (what util.execute_command() used to do) or by writing it to the persistent
+shell util.HADOOP_SHELL, and the latencies of every hdfs/yarn command are printed.
+
+Finally, inputs of 10,000 and 100,000 small files are generated with
+util.hdfs_generate_small_files(), and the seconds spent writing them locally and
+uploading them with a single "hdfs dfs -copyFromLocal -t" are printed separately.
+"""
+if __name__=="__main__":
+    NUM_CASES = 5
+
+    Result = namedtuple("Result", ["mode", "num_cases", "mean_seconds_per_case", "min_seconds", "max_seconds"])
+
+    def summarize(mode, times):
+        return Result(mode, len(times), sum(times) / len(times), min(times), max(times))
+
+    # cold: full start up and tear down per case
+    cold_times = []
+    for case in range(NUM_CASES):
+        start = time.perf_counter()
+        util.hadoop_start_up()
+        util.hadoop_tear_down()
+        cold_times.append(time.perf_counter() - start)
+
+    # warm: start up once, then only reset between cases
+    with util.HadoopSession() as session:
+        for case in range(NUM_CASES):
+            session.reset()
+
+    results = [summarize("cold", cold_times), summarize("warm", session.reset_times)]
+
+    util.print_purple("per case overhead")
+    print(*results, sep='\n')
+    print("speedup: {:.1f}x".format(results[0].mean_seconds_per_case / results[1].mean_seconds_per_case))
+
+    # a command that does nothing, so only the cost of starting it as the hadoop user is measured
+    NUM_COMMANDS = 100
+    spawn_times = []
+    shell_times = []
+    for command in range(NUM_COMMANDS):
+        start = time.perf_counter()
+        subprocess.check_output(["su", "hadoop", "-c", "true"])
+        spawn_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        util.HADOOP_SHELL.run("true")
+        shell_times.append(time.perf_counter() - start)
+
+    command_results = [summarize("su per command", spawn_times), summarize("persistent shell", shell_times)]
+
+    util.print_purple("per command overhead")
+    print(*command_results, sep='\n')
+    print("speedup: {:.1f}x".format(command_results[0].mean_seconds_per_case / command_results[1].mean_seconds_per_case))
+
+    # small file inputs: local writes and a single multithreaded upload
+    SMALL_FILE_COUNTS = [10000, 100000]
+    SMALL_FILE_SIZE = 1024 # bytes
+
+    SmallFilesResult = namedtuple("SmallFilesResult", ["num_files", "file_size", "write_seconds", "upload_seconds",
+                                                       "files_per_second"])
+    small_files_results = []
+    with util.HadoopSession() as session:
+        for num_files in SMALL_FILE_COUNTS:
+            session.reset()
+            write_seconds, upload_seconds = util.hdfs_generate_small_files(num_files, SMALL_FILE_SIZE)
+            assert util.get_webhdfs_client().get_content_summary(util.HDFS_INPUT_DIRECTORY).file_count == num_files
+            small_files_results.append(SmallFilesResult(num_files, SMALL_FILE_SIZE, write_seconds, upload_seconds,
+                                                        num_files / (write_seconds + upload_seconds)))
+
+    util.print_purple("small file inputs")
+    print(*small_files_results, sep='\n')
+
+    util.print_command_latencies()
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+
+"""
+Reads the effective values of Hadoop configuration properties directly from the XML
+resources that org.apache.hadoop.conf.Configuration loads, instead of starting a JVM
+(org.apache.hadoop.hdfs.tools.GetConf) for every property.
+
+Like Configuration, the resources are loaded in order, each one overriding the values
+of the previous ones unless a property was marked <final>. The *-default.xml resources
+are read from the jars in $HADOOP_HOME/share/hadoop (unless the configuration directory,
+which comes first on the classpath, has a copy of its own) and the *-site.xml resources
+from $HADOOP_CONF_DIR. Values set with "-D name=value" override every resource, even
+final properties, deprecated names are replaced by the names that replace them, and
+${name} references are expanded when a value is read, with the same precedence and
+limits as Configuration.substituteVars().
+
+Parsed resources are cached (keyed by the path and the modification time of the file
+they come from) and so are the Configuration objects returned by get_configuration(),
+so reading any number of properties costs a few dictionary lookups each once the
+resources have been parsed.
+
+Only the deprecations of the properties used by the tests in this repository are
+known (see the *_DEPRECATIONS dicts below). compare_values() reports the properties whose value
+differs from the ones Java returns, e.g. because of a missing deprecation.
+
+Running this file verifies the merging rules on a temporary configuration directory,
+or prints the given properties: ./hadoop_configuration.py [-D name=value] [property ...]
+"""
+import os
+import re
+import sys
+import glob
+import time
+import zipfile
+import tempfile
+import functools
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+
+HADOOP_HOME = "/usr/local/hadoop"
+HADOOP_CONF_DIR = os.environ.get("HADOOP_CONF_DIR", HADOOP_HOME + "/etc/hadoop")
+
+# the jars, relative to $HADOOP_HOME/share/hadoop, that contain each default resource
+DEFAULT_RESOURCE_JARS = {
+    "core-default.xml": "common/hadoop-common-*.jar",
+    "hdfs-default.xml": "hdfs/hadoop-hdfs-*.jar",
+    "mapred-default.xml": "mapreduce/hadoop-mapreduce-client-core-*.jar",
+    "yarn-default.xml": "yarn/hadoop-yarn-common-*.jar"
+}
+
+# the resources loaded by GetConf (an HdfsConfiguration)
+GETCONF_RESOURCES = ("core-default.xml", "core-site.xml", "hdfs-default.xml", "hdfs-site.xml")
+
+# the resources loaded by the JobConf of a MapReduce job, in the order they are added
+# (JobConf loads the mapred and yarn resources, HdfsConfiguration is loaded once the
+# job client accesses HDFS)
+JOB_RESOURCES = ("core-default.xml", "core-site.xml",
+                 "mapred-default.xml", "mapred-site.xml", "yarn-default.xml", "yarn-site.xml",
+                 "hdfs-default.xml", "hdfs-site.xml")
+
+# deprecated property name -> the name that replaced it, registered by Configuration,
+# HdfsConfiguration and mapreduce.util.ConfigUtil respectively (the full list is in
+# hadoop-common/src/site/markdown/DeprecatedProperties.md)
+COMMON_DEPRECATIONS = {
+    "fs.default.name": "fs.defaultFS",
+    "dfs.umaskmode": "fs.permissions.umask-mode"
+}
+HDFS_DEPRECATIONS = {
+    "dfs.block.size": "dfs.blocksize",
+    "dfs.permissions": "dfs.permissions.enabled",
+    "dfs.replication.min": "dfs.namenode.replication.min",
+    "io.bytes.per.checksum": "dfs.bytes-per-checksum"
+}
+MAPREDUCE_DEPRECATIONS = {
+    "io.sort.factor": "mapreduce.task.io.sort.factor",
+    "io.sort.mb": "mapreduce.task.io.sort.mb",
+    "io.sort.spill.percent": "mapreduce.map.sort.spill.percent",
+    "mapred.compress.map.output": "mapreduce.map.output.compress",
+    "mapred.inmem.merge.threshold": "mapreduce.reduce.merge.inmem.threshold",
+    "mapred.input.dir": "mapreduce.input.fileinputformat.inputdir",
+    "mapred.job.map.memory.mb": "mapreduce.map.memory.mb",
+    "mapred.job.reduce.input.buffer.percent": "mapreduce.reduce.input.buffer.percent",
+    "mapred.job.reduce.memory.mb": "mapreduce.reduce.memory.mb",
+    "mapred.job.shuffle.input.buffer.percent": "mapreduce.reduce.shuffle.input.buffer.percent",
+    "mapred.job.shuffle.merge.percent": "mapreduce.reduce.shuffle.merge.percent",
+    "mapred.map.child.java.opts": "mapreduce.map.java.opts",
+    "mapred.map.output.compression.codec": "mapreduce.map.output.compress.codec",
+    "mapred.map.tasks": "mapreduce.job.maps",
+    "mapred.max.split.size": "mapreduce.input.fileinputformat.split.maxsize",
+    "mapred.min.split.size": "mapreduce.input.fileinputformat.split.minsize",
+    "mapred.output.dir": "mapreduce.output.fileoutputformat.outputdir",
+    "mapred.reduce.child.java.opts": "mapreduce.reduce.java.opts",
+    "mapred.reduce.parallel.copies": "mapreduce.reduce.shuffle.parallelcopies",
+    "mapred.reduce.slowstart.completed.maps": "mapreduce.job.reduce.slowstart.completedmaps",
+    "mapred.reduce.tasks": "mapreduce.job.reduces",
+    "mapred.task.profile": "mapreduce.task.profile",
+    "mapred.task.profile.maps": "mapreduce.task.profile.maps",
+    "mapred.task.profile.params": "mapreduce.task.profile.params",
+    "mapred.task.profile.reduces": "mapreduce.task.profile.reduces",
+    "mapred.task.timeout": "mapreduce.task.timeout",
+    "min.num.spills.for.combine": "mapreduce.map.combine.minspills"
+}
+GETCONF_DEPRECATIONS = dict(COMMON_DEPRECATIONS, **HDFS_DEPRECATIONS)
+JOB_DEPRECATIONS = dict(GETCONF_DEPRECATIONS, **MAPREDUCE_DEPRECATIONS)
+
+# the Java system properties that the hadoop scripts set and that are referenced by
+# the default resources, e.g. hadoop.tmp.dir is /tmp/hadoop-${user.name}
+DEFAULT_SYSTEM_PROPERTIES = {
+    "user.name": "hadoop",
+    "java.io.tmpdir": "/tmp",
+    "hadoop.home.dir": HADOOP_HOME
+}
+
+# Configuration.MAX_SUBST
+MAX_SUBSTITUTIONS = 20
+
+# the same ${name} references that Configuration.findSubVariable() finds: a name is at
+# least one character long and contains no '}', '$' or ' '
+VARIABLE_PATTERN = re.compile(r'\$\{([^}$ ]+)\}')
+
+# where a property was set with "-D" on the command line
+COMMAND_LINE_SOURCE = "command line"
+
+# source is the resource that set value (the latest one for properties set more than once)
+Property = namedtuple("Property", ["name", "value", "final", "source"])
+
+# a property whose value in Python differs from the value Java returns
+Mismatch = namedtuple("Mismatch", ["name", "value", "java_value", "source"])
+
+
+def find_resource(name, conf_dir=HADOOP_CONF_DIR, hadoop_home=HADOOP_HOME):
+    """
+    Returns the path of the file (or "jar!name" for a jar entry) that the classpath
+    of the hadoop scripts would load the resource name from, or None if there is none.
+    The configuration directory comes first, then the jars of DEFAULT_RESOURCE_JARS.
+    """
+    path = os.path.join(conf_dir, name)
+    if os.path.isfile(path):
+        return path
+
+    return _find_default_resource(name, hadoop_home)
+
+
+@functools.lru_cache(maxsize=None)
+def _find_default_resource(name, hadoop_home):
+    # the jars are only searched once, as they don't change while tests run
+    if name in DEFAULT_RESOURCE_JARS:
+        for jar in sorted(glob.glob(os.path.join(hadoop_home, "share/hadoop", DEFAULT_RESOURCE_JARS[name]))):
+            if jar.endswith(("-tests.jar", "-sources.jar")):
+                continue
+            with zipfile.ZipFile(jar) as archive:
+                if name in archive.namelist():
+                    return jar + "!" + name
+
+    return None
+
+
+def read_resource_bytes(path):
+    """
+    Returns the contents of a path returned by find_resource().
+    """
+    if "!" in path:
+        jar, name = path.split("!", 1)
+        with zipfile.ZipFile(jar) as archive:
+            return archive.read(name)
+
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def parse_properties(xml_bytes):
+    """
+    Returns the (name, value, final) of each <property> of a configuration resource
+    in document order, with the same rules as Configuration.Parser: the name is
+    trimmed, the value is not and a property is final only if <final> is exactly
+    "true". Properties without a name or a value are skipped.
+    """
+    properties = []
+    for element in ElementTree.fromstring(xml_bytes).iter("property"):
+        name = element.get("name")
+        value = element.get("value")
+        final = element.get("final") == "true"
+
+        for child in element:
+            if child.tag == "name" and child.text:
+                name = child.text
+            elif child.tag == "value" and child.text:
+                value = child.text
+            elif child.tag == "final":
+                final = child.text == "true"
+
+        if name is not None and name.strip() and value is not None:
+            properties.append((name.strip(), value, final))
+
+    return properties
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_resource(path, modification_time):
+    return tuple(parse_properties(read_resource_bytes(path)))
+
+
+def load_resource(path):
+    """
+    Cached parse_properties() of the resource at path, which is parsed again only if
+    the file (or jar) it comes from has been modified since.
+    """
+    return _parse_resource(path, os.stat(path.split("!", 1)[0]).st_mtime)
+
+
+def parse_generic_options(args):
+    """
+    Returns the overrides given by "-D name=value" and "-Dname=value" in args (e.g.
+    the arguments of "hadoop jar") as a list of (name, value) pairs in order, and the
+    remaining arguments, like GenericOptionsParser does.
+    """
+    overrides = []
+    remaining_args = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "-D" and i + 1 < len(args):
+            i += 1
+            arg = args[i]
+        elif arg.startswith("-D"):
+            arg = arg[2:]
+        else:
+            remaining_args.append(arg)
+            i += 1
+            continue
+
+        name, _, value = arg.partition("=")
+        overrides.append((name.strip(), value))
+        i += 1
+
+    return overrides, remaining_args
+
+
+class Configuration:
+    """
+    The merged properties of a list of resources and "-D" overrides.
+
+    properties maps each (current) property name to its raw value and sources to
+    the resource that set it. get() returns values with ${name} references expanded,
+    which are cached until the next call to set().
+    """
+    def __init__(self, resources=JOB_RESOURCES, overrides=(), deprecations=JOB_DEPRECATIONS,
+                 conf_dir=HADOOP_CONF_DIR, hadoop_home=HADOOP_HOME, system_properties=DEFAULT_SYSTEM_PROPERTIES):
+        self.deprecations = deprecations
+        self.system_properties = system_properties
+        self.properties = {}
+        self.sources = {}
+        self.final_properties = set()
+        self.resources = []
+        self._expanded = {}
+
+        for name in resources:
+            path = find_resource(name, conf_dir, hadoop_home)
+            if path is not None:
+                self.add_resource(name, load_resource(path))
+                self.resources.append(path)
+
+        for name, value in overrides:
+            self.set(name, value, COMMAND_LINE_SOURCE)
+
+    def add_resource(self, source, properties):
+        """
+        Adds the (name, value, final) properties of a resource, ignoring the ones that
+        would override a final property (Configuration.loadProperty() logs a warning).
+        """
+        for name, value, final in properties:
+            name = self.deprecations.get(name, name)
+            if name not in self.final_properties:
+                self.properties[name] = value
+                self.sources[name] = source
+            if final:
+                self.final_properties.add(name)
+        self._expanded.clear()
+
+    def set(self, name, value, source="programmatically"):
+        """
+        Sets a property like Configuration.set(), which ignores final.
+        """
+        name = self.deprecations.get(name.strip(), name.strip())
+        self.properties[name] = value
+        self.sources[name] = source
+        self._expanded.clear()
+
+    def get_raw(self, name):
+        """
+        The value of a property without expanding references, or None.
+        """
+        name = name.strip()
+        return self.properties.get(self.deprecations.get(name, name))
+
+    def substitute_vars(self, expression):
+        """
+        Expands the ${name} references in expression like Configuration.substituteVars():
+        ${env.NAME}, ${env.NAME:-default} and ${env.NAME-default} are environment variables,
+        other names are looked up in system_properties and then in the properties. An
+        unbound reference is left as it is and so is the whole expression if it refers
+        to itself.
+        """
+        if expression is None:
+            return None
+
+        evaluated = expression
+        for _ in range(MAX_SUBSTITUTIONS):
+            match = VARIABLE_PATTERN.search(evaluated)
+            if match is None:
+                return evaluated
+
+            variable = match.group(1)
+            value = None
+            if variable.startswith("env.") and len(variable) > 4:
+                value = self._getenv(variable[4:])
+            else:
+                value = self.system_properties.get(variable)
+            if value is None:
+                value = self.get_raw(variable)
+            if value is None:
+                return evaluated
+
+            if match.group(0) in value:
+                return expression
+
+            evaluated = evaluated[:match.start()] + value + evaluated[match.end():]
+
+        raise ValueError("Variable substitution depth too large: {} {}".format(MAX_SUBSTITUTIONS, expression))
+
+    @staticmethod
+    def _getenv(variable):
+        """
+        The value of ${env.variable}, with the ":-" and "-" default value syntax of bash.
+        """
+        for i, c in enumerate(variable):
+            if c == ":" and variable[i + 1:i + 2] == "-":
+                value = os.environ.get(variable[:i])
+                return value if value else variable[i + 2:]
+            elif c == "-":
+                value = os.environ.get(variable[:i])
+                return variable[i + 1:] if value is None else value
+        return os.environ.get(variable)
+
+    def get(self, name, default=None):
+        """
+        The expanded value of a property (Configuration.get()), or default if it is not set.
+        """
+        name = name.strip()
+        name = self.deprecations.get(name, name)
+        try:
+            value = self._expanded[name]
+        except KeyError:
+            value = self.substitute_vars(self.properties.get(name))
+            self._expanded[name] = value
+        return default if value is None else value
+
+    def get_trimmed(self, name, default=None):
+        """
+        The expanded value of a property without surrounding whitespace, which is what
+        GetConf prints (Configuration.getTrimmed()).
+        """
+        value = self.get(name)
+        return default if value is None else value.strip()
+
+    def get_int(self, name, default=None):
+        value = self.get_trimmed(name)
+        return default if value is None else int(value, 16 if value.lower().startswith("0x") else 10)
+
+    def get_float(self, name, default=None):
+        value = self.get_trimmed(name)
+        return default if value is None else float(value)
+
+    def get_property(self, name):
+        """
+        Property of name, with the resource that set it.
+        """
+        name = name.strip()
+        name = self.deprecations.get(name, name)
+        return Property(name, self.get_trimmed(name), name in self.final_properties, self.sources.get(name))
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_configuration(resources, overrides, deprecations, conf_dir, hadoop_home, modification_times):
+    return Configuration(resources, overrides, dict(deprecations), conf_dir, hadoop_home)
+
+
+def get_configuration(overrides=(), resources=JOB_RESOURCES, deprecations=JOB_DEPRECATIONS,
+                      conf_dir=HADOOP_CONF_DIR, hadoop_home=HADOOP_HOME):
+    """
+    Cached Configuration with the given "-D" overrides, a dict or a sequence of (name,
+    value) pairs. It is created again only if an XML file in conf_dir has been modified
+    since. The returned object is shared, so it must not be modified with set().
+    """
+    if isinstance(overrides, dict):
+        overrides = overrides.items()
+
+    modification_times = tuple(sorted((entry.name, entry.stat().st_mtime) for entry in os.scandir(conf_dir)
+                                      if entry.name.endswith(".xml"))) if os.path.isdir(conf_dir) else ()
+    return _cached_configuration(tuple(resources), tuple(overrides), tuple(sorted(deprecations.items())),
+                                 conf_dir, hadoop_home, modification_times)
+
+
+def compare_values(configuration, java_values):
+    """
+    Returns a Mismatch for every property in java_values (a dict of property name ->
+    value returned by Java, None if it is not set) whose value in configuration differs.
+    """
+    mismatches = []
+    for name, java_value in java_values.items():
+        value = configuration.get_trimmed(name)
+        if java_value is not None:
+            java_value = java_value.strip()
+        if value != java_value:
+            mismatches.append(Mismatch(name, value, java_value, configuration.get_property(name).source))
+
+    return mismatches
+
+
+def print_mismatches(mismatches):
+    if not mismatches:
+        print("all property values match")
+    for mismatch in mismatches:
+        print("property: {}, value: {}, java value: {}, source: {}".format(*mismatch))
+
+
+def write_resource(path, properties):
+    """
+    Writes a configuration resource with the given (name, value, final) properties.
+    """
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0"?>\n<configuration>\n')
+        for name, value, final in properties:
+            f.write("  <property>\n    <name>{}</name>\n    <value>{}</value>\n".format(name, value))
+            if final:
+                f.write("    <final>true</final>\n")
+            f.write("  </property>\n")
+        f.write("</configuration>\n")
+
+
+def verify():
+    """
+    Checks the merging rules against what Configuration does with the same resources.
+    """
+    with tempfile.TemporaryDirectory() as conf_dir:
+        write_resource(os.path.join(conf_dir, "core-default.xml"), [
+            ("hadoop.tmp.dir", "/tmp/hadoop-${user.name}", False),
+            ("fs.defaultFS", "file:///", False),
+            ("io.file.buffer.size", "4096", True),
+            ("loop", "a${loop}", False),
+            ("unbound", "${nothing.here}/x", False),
+            ("environment", "${env.UNDERSTANDING_HADOOP_UNSET:-fallback}", False)
+        ])
+        write_resource(os.path.join(conf_dir, "core-site.xml"), [
+            ("fs.default.name", "hdfs://localhost:9000", False),
+            ("io.file.buffer.size", "65536", False)
+        ])
+        write_resource(os.path.join(conf_dir, "hdfs-default.xml"), [
+            ("dfs.blocksize", "134217728", False),
+            ("dfs.namenode.name.dir", "file://${hadoop.tmp.dir}/dfs/name", False)
+        ])
+        write_resource(os.path.join(conf_dir, "hdfs-site.xml"), [
+            ("dfs.block.size", " 16777216 ", False)
+        ])
+        write_resource(os.path.join(conf_dir, "mapred-default.xml"), [
+            ("mapreduce.task.io.sort.mb", "100", False),
+            ("mapreduce.map.sort.spill.percent", "0.80", False)
+        ])
+
+        overrides, remaining_args = parse_generic_options(["jar", "wordcount.jar", "-D", "io.sort.mb=10",
+                                                           "-Dmapreduce.map.sort.spill.percent=0.99",
+                                                           "-Dio.file.buffer.size=1", "input", "output"])
+        assert remaining_args == ["jar", "wordcount.jar", "input", "output"]
+        configuration = Configuration(overrides=overrides, conf_dir=conf_dir, hadoop_home=conf_dir)
+
+        assert len(configuration.resources) == 5
+        assert configuration.get("hadoop.tmp.dir") == "/tmp/hadoop-hadoop"
+        assert configuration.get("dfs.namenode.name.dir") == "file:///tmp/hadoop-hadoop/dfs/name"
+        assert configuration.get("fs.defaultFS") == configuration.get("fs.default.name") == "hdfs://localhost:9000"
+        assert configuration.get("dfs.block.size") == " 16777216 " and configuration.get_int("dfs.blocksize") == 16777216
+        assert configuration.get_property("dfs.block.size") == Property("dfs.blocksize", "16777216", False,
+                                                                       "hdfs-site.xml")
+        assert configuration.get_int("io.sort.mb") == 10
+        assert configuration.get_float("mapreduce.map.sort.spill.percent") == 0.99
+        # final properties can't be overridden by later resources, but can on the command line
+        assert configuration.get_property("io.file.buffer.size") == Property("io.file.buffer.size", "1", True,
+                                                                            COMMAND_LINE_SOURCE)
+        assert configuration.get("loop") == "a${loop}"
+        assert configuration.get("unbound") == "${nothing.here}/x"
+        assert configuration.get("environment") == "fallback"
+        assert configuration.get("not.set", "default") == "default"
+        # missing properties are cached too, but not with the default of the first lookup
+        assert configuration.get("not.set", "other") == "other" and configuration.get("not.set") is None
+
+        getconf = Configuration(GETCONF_RESOURCES, deprecations=GETCONF_DEPRECATIONS, conf_dir=conf_dir, hadoop_home=conf_dir)
+        assert getconf.get("io.file.buffer.size") == "4096" and getconf.get("io.sort.mb") is None
+
+        mismatches = compare_values(getconf, {"dfs.block.size": "16777216\n", "io.file.buffer.size": "65536"})
+        assert mismatches == [Mismatch("io.file.buffer.size", "4096", "65536", "core-default.xml")]
+
+        # cached until a resource is modified
+        assert get_configuration(conf_dir=conf_dir, hadoop_home=conf_dir) is get_configuration(conf_dir=conf_dir, hadoop_home=conf_dir)
+        modified = get_configuration({"io.sort.mb": "10"}, conf_dir=conf_dir, hadoop_home=conf_dir)
+        assert modified.get("mapreduce.task.io.sort.mb") == "10"
+        assert get_configuration(conf_dir=conf_dir, hadoop_home=conf_dir).get("io.sort.mb") == "100"
+
+        start = time.perf_counter()
+        num_lookups = 100000
+        for _ in range(num_lookups // 4):
+            configuration.get_trimmed("dfs.block.size")
+            configuration.get_trimmed("mapreduce.task.io.sort.mb")
+            configuration.get_trimmed("hadoop.tmp.dir")
+            configuration.get_trimmed("not.set")
+        elapsed = time.perf_counter() - start
+
+    print("verified the merging of resources, finals, deprecations, overrides and references")
+    print("{:.2f} microseconds per property lookup".format(elapsed / num_lookups * 1e6))
+
+
+if __name__=="__main__":
+    if len(sys.argv) == 1:
+        verify()
+    else:
+        overrides, names = parse_generic_options(sys.argv[1:])
+        configuration = get_configuration(overrides)
+        for name in names:
+            print("property: {}, value: {}, final: {}, source: {}".format(*configuration.get_property(name)))
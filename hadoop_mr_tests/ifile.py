@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+
+"""
+Reader for the IFile format that map tasks use for spill files and map outputs, see
+hadoop-mapreduce-project/hadoop-mapreduce-client/hadoop-mapreduce-client-core/src/main/java/org/apache/hadoop/mapred/IFile.java
+and the description of the layout in map_output_materialized_bytes/run_test.py.
+
+A file holds one IFile "segment" per partition (reducer), one after the other. Each
+segment is a sequence of records
+
+    +-------------------------+-------------------------+-----+-------+
+    | VLong key length        | VLong value length      | key | value |
+    +-------------------------+-------------------------+-----+-------+
+
+followed by two EOF markers (-1 as a VLong, 0xff each) and the CRC32 of everything
+before it in the segment (4 bytes). The matching index file (spillN.out.index or
+file.out.index) holds (start offset, raw length, partition length) as three big
+endian longs per partition, followed by the CRC32 of those entries as a long.
+
+Files are memory mapped and records are returned as memoryview slices of the map,
+so nothing is copied. Only uncompressed, unencrypted files are supported.
+Running with --benchmark checks the reader and times it on a synthetic file.
+
+Usage:
+    ./ifile.py <spill or map output file> [<index file>]
+    ./ifile.py --benchmark [<size in MiB>]
+"""
+import os
+import sys
+import mmap
+import time
+import random
+import zlib
+import struct
+import tempfile
+import contextlib
+from collections import namedtuple
+
+import numpy as np
+
+# this module will be placed in the same directory as this file by Dockerfile "COPY"
+import zero_compress
+
+# bytes after the last record of a segment: two EOF markers and a CRC32
+EOF_MARKER_BYTES = b"\xff\xff"
+CHECKSUM_SIZE = 4
+INDEX_RECORD = struct.Struct(">qqq")
+
+# records in a row with the same key and value lengths after which scan_segment() looks
+# for the end of the run with NumPy, which only pays off for long runs
+REPEATED_LENGTHS = 8
+
+IndexRecord = namedtuple("IndexRecord", ["start_offset", "raw_length", "part_length"])
+
+PartitionStats = namedtuple("PartitionStats", ["partition", "start_offset", "num_bytes", "num_records",
+                                               "key_bytes", "value_bytes", "checksum_ok"])
+
+@contextlib.contextmanager
+def open_ifile(path):
+    """
+    Memory maps the file at path read only and yields it, or yields b"" if the file is empty.
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b""
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as ifile:
+            yield ifile
+
+
+def read_index(path):
+    """
+    Returns the IndexRecords of an index file, after checking its checksum the way
+    SpillRecord.java does. Raises ValueError if the checksum doesn't match.
+    """
+    with open(path, "rb") as file:
+        contents = file.read()
+
+    size = (len(contents) // INDEX_RECORD.size) * INDEX_RECORD.size
+    entries = contents[:size]
+    checksum, = struct.unpack(">q", contents[size:size + 8])
+
+    if zlib.crc32(entries) != checksum:
+        raise ValueError("Checksum error reading spill index: {}".format(path))
+
+    return [IndexRecord(*entry) for entry in INDEX_RECORD.iter_unpack(entries)]
+
+
+def read_vlong(buffer, offset):
+    """
+    Returns (value, offset after it) of the VLong at offset of buffer. Single byte
+    values, by far the most common for key and value lengths, are decoded inline.
+    """
+    first_byte = buffer[offset]
+    if first_byte < 128:
+        return first_byte, offset + 1
+    if first_byte >= 144:
+        return first_byte - 256, offset + 1
+
+    return zero_compress.decode_zero_compressed_int64(buffer, offset)
+
+
+def iter_records(buffer, offset=0):
+    """
+    Yields the (key, value) of every record of the segment that starts at offset of
+    buffer (such as an open_ifile()), as memoryview slices of buffer, until the EOF markers.
+    """
+    view = memoryview(buffer)
+
+    while True:
+        key_length, offset = read_vlong(buffer, offset)
+        value_length, offset = read_vlong(buffer, offset)
+        if key_length == -1 and value_length == -1:
+            return
+
+        value_offset = offset + key_length
+        yield view[offset:value_offset], view[value_offset:value_offset + value_length]
+        offset = value_offset + value_length
+
+
+def count_repeated_records(array, offset, key_length, value_length):
+    """
+    Returns how many consecutive records, starting with the one at offset of array
+    (a uint8 array), have the given single byte key and value lengths. Every such
+    record is 2 + key_length + value_length bytes long, so their lengths are found
+    at a fixed stride and compared with NumPy in chunks of growing size.
+    """
+    record_size = 2 + key_length + value_length
+    count = 0
+    chunk = 64
+
+    while True:
+        start = offset + count * record_size
+        key_lengths = array[start:start + chunk * record_size:record_size]
+        value_lengths = array[start + 1:start + 1 + chunk * record_size:record_size]
+        num_headers = len(value_lengths)
+
+        mismatches = (key_lengths[:num_headers] != key_length) | (value_lengths != value_length)
+        if mismatches.any():
+            return count + int(mismatches.argmax())
+        if num_headers < chunk:
+            return count + num_headers
+
+        count += chunk
+        chunk = min(chunk * 2, 1 << 20)
+
+
+def scan_segment(buffer, offset=0):
+    """
+    Walks over the records of the segment that starts at offset of buffer without
+    creating any object for them. Returns (number of records, key bytes, value bytes,
+    offset of the EOF markers). Runs of records with the same key and value lengths,
+    such as the fixed length words used by the tests, are skipped over with
+    count_repeated_records() once REPEATED_LENGTHS records in a row have the same
+    lengths. Other records with single byte lengths (like the words of a text) take
+    about 0.2 microseconds each, which is 50 to 70 MiB/s for wordcount outputs.
+    """
+    array = np.frombuffer(buffer, dtype=np.uint8)
+    num_records = key_bytes = value_bytes = 0
+    previous_key_length = previous_value_length = None
+    repeated = 0
+
+    while True:
+        # inline version of read_vlong() for the lengths
+        key_length = buffer[offset]
+        value_length = buffer[offset + 1]
+
+        if key_length < 128 and value_length < 128:
+            if key_length == previous_key_length and value_length == previous_value_length:
+                repeated += 1
+                if repeated == REPEATED_LENGTHS:
+                    run = count_repeated_records(array, offset, key_length, value_length)
+                    num_records += run
+                    key_bytes += run * key_length
+                    value_bytes += run * value_length
+                    offset += run * (2 + key_length + value_length)
+                    previous_key_length = None
+                    repeated = 0
+                    continue
+            else:
+                previous_key_length = key_length
+                previous_value_length = value_length
+                repeated = 0
+
+            offset += 2
+        else:
+            previous_key_length = None
+            key_length, offset = read_vlong(buffer, offset)
+            value_length, offset = read_vlong(buffer, offset)
+
+            if key_length == -1 and value_length == -1:
+                return num_records, key_bytes, value_bytes, offset - len(EOF_MARKER_BYTES)
+
+        num_records += 1
+        key_bytes += key_length
+        value_bytes += value_length
+        offset += key_length + value_length
+
+
+def segment_checksum_ok(buffer, start_offset, end_offset):
+    """
+    Returns whether the CRC32 at end_offset of buffer matches the bytes of the
+    segment from start_offset up to it (records and EOF markers).
+    """
+    checksum = int.from_bytes(buffer[end_offset:end_offset + CHECKSUM_SIZE], "big")
+    return zlib.crc32(memoryview(buffer)[start_offset:end_offset]) == checksum
+
+
+def partition_stats(path, index_path=None, verify_checksums=True):
+    """
+    Returns the PartitionStats of every segment of the IFile at path. If index_path
+    (which defaults to path + ".index" if that file exists) is given, each segment is
+    located from its index entry, otherwise segments are assumed to be back to back.
+    num_bytes includes the EOF markers and the checksum, like the "Map output
+    materialized bytes" counter. checksum_ok is None if verify_checksums is False.
+    """
+    if index_path is None and os.path.exists(path + ".index"):
+        index_path = path + ".index"
+    index = read_index(index_path) if index_path is not None else None
+
+    stats = []
+    with open_ifile(path) as ifile:
+        start_offset = 0
+
+        while (index is None and start_offset < len(ifile)) or (index is not None and len(stats) < len(index)):
+            if index is not None:
+                start_offset = index[len(stats)].start_offset
+
+            num_records, key_bytes, value_bytes, eof_offset = scan_segment(ifile, start_offset)
+            end_offset = eof_offset + len(EOF_MARKER_BYTES)
+            checksum_ok = segment_checksum_ok(ifile, start_offset, end_offset) if verify_checksums else None
+
+            stats.append(PartitionStats(len(stats), start_offset, end_offset + CHECKSUM_SIZE - start_offset,
+                                        num_records, key_bytes, value_bytes, checksum_ok))
+            start_offset = end_offset + CHECKSUM_SIZE
+
+    return stats
+
+
+def print_partition_stats(stats):
+    """
+    Prints one line per PartitionStats and the totals.
+    """
+    print("{:>9} {:>12} {:>12} {:>12} {:>12} {:>12} {:>9}".format(
+        "partition", "offset", "bytes", "records", "key bytes", "value bytes", "checksum"))
+    for partition in stats:
+        print("{:9} {:12} {:12} {:12} {:12} {:12} {:>9}".format(*partition[:6], str(partition.checksum_ok)))
+
+    print("{:>9} {:12} {:12} {:12} {:12} {:12}".format("total", "",
+          *[sum(partition[field] for partition in stats) for field in range(2, 6)]))
+
+
+def write_ifile(path, partitions):
+    """
+    Writes an IFile (and its index file, path + ".index") with one segment per
+    element of partitions, each a list of (key, value) bytes, the way IFile.Writer
+    and SpillRecord.writeToFile do. Used to test the reader.
+    """
+    index = []
+    with open(path, "wb") as file:
+        for records in partitions:
+            segment = bytearray()
+            for key, value in records:
+                segment += zero_compress.encode_zero_compressed_int64(len(key))
+                segment += zero_compress.encode_zero_compressed_int64(len(value))
+                segment += key
+                segment += value
+            segment += EOF_MARKER_BYTES
+
+            index.append(IndexRecord(file.tell(), len(segment), len(segment) + CHECKSUM_SIZE))
+            file.write(segment)
+            file.write(zlib.crc32(segment).to_bytes(CHECKSUM_SIZE, "big"))
+
+    with open(path + ".index", "wb") as index_file:
+        entries = b"".join(INDEX_RECORD.pack(*entry) for entry in index)
+        index_file.write(entries)
+        index_file.write(struct.pack(">q", zlib.crc32(entries)))
+
+
+def verify():
+    """
+    Checks the reader against the spill file shown in map_output_materialized_bytes/run_test.py
+    (10 records of ("rr", 1) in a single partition) and against files written by write_ifile().
+    """
+    spill = (b"\x03\x04\x02rr\x00\x00\x00\x01" * 10) + b"\xff\xff\xb4\x0c\x71\x8e"
+    assert scan_segment(spill) == (10, 30, 40, 90)
+    assert segment_checksum_ok(spill, 0, 92)
+
+    partitions = [[(b"\x02rr", b"\x00\x00\x00\x01")] * 3, [], [(b"k" * 300, b"v" * 70000), (b"", b"")],
+                  [(b"k" * random.choice([1, 2, 127, 128]), b"v" * random.choice([4, 4, 4, 200])) for _ in range(10000)]]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "spill0.out")
+        write_ifile(path, partitions)
+
+        stats = partition_stats(path)
+        assert [partition.num_records for partition in stats] == [len(records) for records in partitions]
+        assert [partition.start_offset + partition.num_bytes for partition in stats] == \
+               [entry.start_offset + entry.part_length for entry in read_index(path + ".index")]
+        assert all(partition.checksum_ok for partition in stats)
+
+        with open_ifile(path) as ifile:
+            for partition, records in zip(stats, partitions):
+                assert [(bytes(key), bytes(value)) for key, value in iter_records(ifile, partition.start_offset)] == records
+
+    print("verified")
+
+
+def benchmark(size_in_MiB, num_partitions=4):
+    """
+    Writes size_in_MiB IFiles of wordcount-like records (Text keys, IntWritable values
+    of 1) split into num_partitions segments and times partition_stats() on them: one
+    with keys of 8 characters, whose runs of equal lengths are skipped with NumPy, and
+    one with keys of 3 to 12 characters, whose records are walked one by one.
+    """
+    # Text is a VInt length followed by the characters, IntWritable is 4 big endian bytes
+    def record(word_length):
+        return bytes([word_length + 1, 4, word_length]) + b"w" * word_length + (1).to_bytes(4, "big")
+
+    word_lengths = [random.randint(3, 12) for _ in range(4096)]
+    files = [("8 character keys", record(8), 1),
+             ("3 to 12 character keys", b"".join(record(word_length) for word_length in word_lengths), len(word_lengths))]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, records, num_records in files:
+            path = os.path.join(directory, "file.out")
+            repeats = (size_in_MiB << 20) // len(records) // num_partitions
+            with open(path, "wb") as file:
+                segment = records * repeats + EOF_MARKER_BYTES
+                checksum = zlib.crc32(segment).to_bytes(CHECKSUM_SIZE, "big")
+                for _ in range(num_partitions):
+                    file.write(segment)
+                    file.write(checksum)
+
+            start = time.perf_counter()
+            stats = partition_stats(path)
+            elapsed = time.perf_counter() - start
+
+            assert all(partition.num_records == repeats * num_records and partition.checksum_ok for partition in stats)
+            print("{}: {} MiB, {} records scanned in {:.2f} s ({:.1f} MiB/s)".format(
+                name, size_in_MiB, sum(partition.num_records for partition in stats), elapsed, size_in_MiB / elapsed))
+
+
+if __name__=="__main__":
+    if len(sys.argv) < 2:
+        print("usage: {} <spill or map output file> [<index file>]".format(sys.argv[0]))
+        print("       {} --benchmark [<size in MiB>]".format(sys.argv[0]))
+        sys.exit(1)
+
+    if sys.argv[1] == "--benchmark":
+        verify()
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 256)
+        sys.exit(0)
+
+    print_partition_stats(partition_stats(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+"""
+Generators that synthesize word count inputs as a stream of large byte chunks
+instead of building every word in memory and writing it one at a time. Each
+generator uses constant memory regardless of the size of the input it describes,
+so the same code can be used to produce inputs of a few KiB or many GiB.
+
+Running this file benchmarks the generators against the way util.py used to
+write its input files (see benchmark() below), and "./input_generator.py small_files
+10000 100000" benchmarks write_small_files() (see benchmark_small_files() below).
+"""
+import os
+import sys
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# approximate number of bytes yielded at a time by the generators below
+CHUNK_SIZE = 1 << 20
+
+def cycled_word_chunks(words, num_words, chunk_size=CHUNK_SIZE):
+    """
+    Yields the contents of a file with num_words lines where the i-th line is
+    words[i % len(words)], as chunks of about chunk_size bytes. For example,
+    b"".join(cycled_word_chunks(["a", "b"], 3)) == b"a\\nb\\na\\n".
+    The block of repeated words is built only once and yielded repeatedly.
+    Nothing is yielded if num_words is 0, and ValueError is raised if words is
+    empty while num_words isn't.
+    """
+    if num_words == 0:
+        return
+    if not words:
+        raise ValueError("no words to cycle through for {} words".format(num_words))
+
+    cycle = "".join(word + "\n" for word in words).encode()
+    cycles_per_chunk = max(1, chunk_size // len(cycle))
+    chunk = cycle * cycles_per_chunk
+
+    num_cycles, remaining_words = divmod(num_words, len(words))
+    num_chunks, remaining_cycles = divmod(num_cycles, cycles_per_chunk)
+
+    for _ in range(num_chunks):
+        yield chunk
+
+    if remaining_cycles:
+        yield cycle * remaining_cycles
+
+    if remaining_words:
+        yield "".join(word + "\n" for word in words[:remaining_words]).encode()
+
+
+def sized_word_chunks(num_bytes, word_size, character="w", chunk_size=CHUNK_SIZE):
+    """
+    Yields exactly num_bytes bytes made of lines that are word_size bytes long
+    (word_size - 1 characters followed by "\\n"). If num_bytes is not a multiple of
+    word_size, the last line is shortened so that the total size is exact.
+    """
+    num_words, remainder = divmod(num_bytes, word_size)
+    yield from cycled_word_chunks([character * (word_size - 1)], num_words, chunk_size)
+
+    if remainder:
+        yield (character * (remainder - 1) + "\n").encode()
+
+
+def word_list_chunks(words, chunk_size=CHUNK_SIZE):
+    """
+    Yields "\\n".join(words) encoded as chunks of about chunk_size bytes. words can
+    be any iterable of strings, including a generator, so the words never have to
+    be held in memory all at once.
+    """
+    batch = []
+    batch_num_bytes = 0
+    first_batch = True
+
+    for word in words:
+        encoded_word = word.encode()
+        batch.append(encoded_word)
+        batch_num_bytes += len(encoded_word) + 1
+
+        if batch_num_bytes >= chunk_size:
+            # every batch but the first needs a separator from the previous one
+            yield b"\n".join(batch) if first_batch else b"\n" + b"\n".join(batch)
+            batch = []
+            batch_num_bytes = 0
+            first_batch = False
+
+    if batch:
+        yield b"\n".join(batch) if first_batch else b"\n" + b"\n".join(batch)
+
+
+def write_chunks(path, chunks):
+    """
+    Writes every chunk yielded by chunks to the file at path and returns the
+    number of bytes written.
+    """
+    num_bytes = 0
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            num_bytes += len(chunk)
+
+    return num_bytes
+
+
+def write_buffer(path, buffer):
+    """
+    Creates (or truncates) the file at path and writes buffer, a bytes object or a
+    memoryview, to it with os.write, which doesn't hold the GIL while writing.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(buffer)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def write_small_files(directory, num_files, file_size, word_size=100, num_threads=8):
+    """
+    Writes num_files files named input_file_<i>, each file_size bytes of lines that
+    are word_size bytes long (see sized_word_chunks()), into directory. The contents
+    are the same for every file, so they are built once and every file is a single
+    os.write of that buffer; the files are created by num_threads threads, as most
+    of the time is spent in the open/write/close system calls rather than in Python.
+    Returns the paths of the files.
+    """
+    buffer = b"".join(sized_word_chunks(file_size, min(word_size, file_size)))
+    paths = [os.path.join(directory, "input_file_{}".format(i)) for i in range(num_files)]
+
+    def write_files(paths):
+        for path in paths:
+            write_buffer(path, buffer)
+
+    # each thread writes every num_threads-th file rather than one future per file,
+    # whose overhead is close to the cost of writing a small file
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        slices = [executor.submit(write_files, paths[i::num_threads]) for i in range(num_threads)]
+        for files in slices:
+            files.result()
+
+    return paths
+
+
+def benchmark(size_in_MiB):
+    """
+    Compares the throughput, in MiB/s, of writing a size_in_MiB file with the
+    generators above against the loops util.py used before they existed:
+    building a list of words and writing them one by one, and writing a joined
+    list of words one character at a time.
+    """
+    WORD_SIZE = 1000 # characters, as in util.hdfs_generate_word_files
+    num_bytes = size_in_MiB * 1024 * 1024
+    num_words = num_bytes // WORD_SIZE
+
+    def list_of_words(path):
+        with open(path, "w") as f:
+            words = [("w" * (WORD_SIZE - 1)) + '\n' for w in range(num_words)]
+            for word in words:
+                f.write(word)
+
+    def character_by_character(path):
+        with open(path, "w") as f:
+            words = "\n".join(["w" * (WORD_SIZE - 1) for w in range(num_words)])
+            for word in words:
+                f.write(word)
+
+    methods = [
+        ("list of words (old)", list_of_words),
+        ("character by character (old)", character_by_character),
+        ("sized_word_chunks", lambda path: write_chunks(path, sized_word_chunks(num_bytes, WORD_SIZE))),
+        ("word_list_chunks", lambda path: write_chunks(path, word_list_chunks("w" * (WORD_SIZE - 1) for w in range(num_words))))
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "input_file")
+
+        for name, method in methods:
+            start = time.perf_counter()
+            method(path)
+            elapsed = time.perf_counter() - start
+
+            print("{:30} {:10.1f} MiB/s ({:.2f} s)".format(name, (os.path.getsize(path) / (1024 * 1024)) / elapsed, elapsed))
+
+
+def benchmark_small_files(num_files, file_size=1024):
+    """
+    Compares the time it takes to write num_files files of file_size bytes with
+    write_small_files(), with 1 and 8 threads, against building the list of words
+    of each file and writing them one by one, as util.hdfs_generate_word_files()
+    used to do.
+    """
+    WORD_SIZE = 100 # characters
+
+    def list_of_words(directory):
+        for i in range(num_files):
+            with open(os.path.join(directory, "input_file_{}".format(i)), "w") as f:
+                words = [("w" * (WORD_SIZE - 1)) + '\n' for w in range(file_size // WORD_SIZE)]
+                for word in words:
+                    f.write(word)
+
+    methods = [
+        ("list of words (old)", list_of_words),
+        ("write_small_files, 1 thread", lambda directory: write_small_files(directory, num_files, file_size, WORD_SIZE, 1)),
+        ("write_small_files, 8 threads", lambda directory: write_small_files(directory, num_files, file_size, WORD_SIZE, 8))
+    ]
+
+    for name, method in methods:
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            method(directory)
+            elapsed = time.perf_counter() - start
+
+            print("{} files, {:30} {:10.0f} files/s ({:.2f} s)".format(num_files, name, num_files / elapsed, elapsed))
+
+
+if __name__=="__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "small_files":
+        for num_files in map(int, sys.argv[2:] or [10000, 100000]):
+            benchmark_small_files(num_files)
+    else:
+        benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+
+"""
+Reads the counters of a finished MapReduce job from its job history file (.jhist),
+instead of scraping the lines that "hadoop jar" prints to stdout.
+
+When a job finishes, its ApplicationMaster copies the history file to
+mapreduce.jobhistory.intermediate-done-dir/<user>, where it stays until a
+JobHistoryServer moves it to mapreduce.jobhistory.done-dir. The file starts with
+a line that is either "Avro-Json" or "Avro-Binary" (mapreduce.jobhistory.jhist.format,
+binary by default) followed by a line with the Avro schema of the events, then the
+events themselves: one JSON object per line, or Avro binary encoded records one
+after the other. Both are decoded with the schema in the file (see compile_decoder()
+and compile_json_decoder() below), so no Avro library is needed.
+
+The JOB_FINISHED event has the total, map and reduce values of every counter of the
+job. If the history file can't be found, the counters are requested from the REST API
+of the JobHistoryServer (if it is running), which has the same values, but no display names.
+
+Counters are returned as a dict of counter name -> Counter, and counters_table() turns
+the counters of many jobs into a NumPy structured array, one row per job and one
+column per counter.
+
+Usage (without a file, the decoding of history files is verified):
+    ./job_history.py [<file.jhist>]
+"""
+import sys
+import json
+import time
+import struct
+import subprocess
+import urllib.request
+import urllib.error
+from collections import namedtuple, OrderedDict
+
+import numpy as np
+
+# these modules will be placed in the same directory as this file by Dockerfile 'COPY'
+import util
+import hadoop_configuration
+
+# first line of a history file, see org.apache.hadoop.mapreduce.jobhistory.EventWriter
+JSON_VERSION = b"Avro-Json"
+BINARY_VERSION = b"Avro-Binary"
+
+# base url of the JobHistoryServer REST API
+JOB_HISTORY_SERVER_URL = "http://localhost:19888/ws/v1/history/mapreduce"
+
+# group is the name of the counter group, e.g. org.apache.hadoop.mapreduce.TaskCounter,
+# name is the name of the counter in its group, e.g. MAP_OUTPUT_BYTES, and display_name
+# is what "hadoop jar" prints, e.g. "Map output bytes"
+Counter = namedtuple("Counter", ["group", "name", "display_name", "total", "map", "reduce"])
+
+
+def _read_long(data, pos):
+    """
+    Reads an Avro int or long (zig-zag encoded variable length integer).
+    """
+    b = data[pos]
+    pos += 1
+    n = b & 0x7f
+    shift = 7
+    while b & 0x80:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        shift += 7
+    return (n >> 1) ^ -(n & 1), pos
+
+
+def _read_bytes(data, pos):
+    length, pos = _read_long(data, pos)
+    return bytes(data[pos:pos + length]), pos + length
+
+
+def _read_string(data, pos):
+    length, pos = _read_long(data, pos)
+    return str(data[pos:pos + length], "utf-8"), pos + length
+
+
+PRIMITIVE_DECODERS = {
+    "null": lambda data, pos: (None, pos),
+    "boolean": lambda data, pos: (data[pos] != 0, pos + 1),
+    "int": _read_long,
+    "long": _read_long,
+    "float": lambda data, pos: (struct.unpack_from("<f", data, pos)[0], pos + 4),
+    "double": lambda data, pos: (struct.unpack_from("<d", data, pos)[0], pos + 8),
+    "bytes": _read_bytes,
+    "string": _read_string
+}
+
+
+def _full_name(name, namespace):
+    return name if "." in name or not namespace else namespace + "." + name
+
+
+def compile_decoder(schema, names=None, namespace=None):
+    """
+    Returns a function decode(data, pos) -> (value, pos) that decodes a value of
+    the given Avro schema (parsed JSON) from the binary encoding in data. Records
+    are decoded to dicts, enums to their symbol and unions to the value of their
+    branch. names maps the full names of the named types defined so far to their
+    decoder, so that the schema can refer to them by name.
+    """
+    if names is None:
+        names = {}
+
+    if isinstance(schema, str):
+        if schema in PRIMITIVE_DECODERS:
+            return PRIMITIVE_DECODERS[schema]
+        full_name = _full_name(schema, namespace)
+        # the type may still be being defined (a recursive type), so look it up when decoding
+        return lambda data, pos: names[full_name](data, pos)
+
+    if isinstance(schema, list):
+        branches = [compile_decoder(branch, names, namespace) for branch in schema]
+
+        def decode_union(data, pos):
+            index, pos = _read_long(data, pos)
+            return branches[index](data, pos)
+        return decode_union
+
+    schema_type = schema["type"]
+    if schema_type == "record" or schema_type == "error":
+        full_name = _full_name(schema["name"], schema.get("namespace", namespace))
+        namespace = full_name.rpartition(".")[0] or None
+        fields = []
+
+        def decode_record(data, pos):
+            record = {}
+            for name, decode in fields:
+                record[name], pos = decode(data, pos)
+            return record, pos
+        names[full_name] = decode_record
+        fields.extend((field["name"], compile_decoder(field["type"], names, namespace)) for field in schema["fields"])
+        return decode_record
+
+    if schema_type == "enum":
+        symbols = schema["symbols"]
+
+        def decode_enum(data, pos):
+            index, pos = _read_long(data, pos)
+            return symbols[index], pos
+        names[_full_name(schema["name"], schema.get("namespace", namespace))] = decode_enum
+        return decode_enum
+
+    if schema_type == "fixed":
+        size = schema["size"]
+
+        def decode_fixed(data, pos):
+            return bytes(data[pos:pos + size]), pos + size
+        names[_full_name(schema["name"], schema.get("namespace", namespace))] = decode_fixed
+        return decode_fixed
+
+    if schema_type == "array" or schema_type == "map":
+        decode_item = compile_decoder(schema["items"] if schema_type == "array" else schema["values"], names, namespace)
+        is_map = schema_type == "map"
+
+        def decode_blocks(data, pos):
+            items = {} if is_map else []
+            while True:
+                count, pos = _read_long(data, pos)
+                if count == 0:
+                    return items, pos
+                if count < 0:
+                    # a negative count is followed by the size of the block in bytes
+                    count = -count
+                    _, pos = _read_long(data, pos)
+                for _ in range(count):
+                    if is_map:
+                        key, pos = _read_string(data, pos)
+                        items[key], pos = decode_item(data, pos)
+                    else:
+                        item, pos = decode_item(data, pos)
+                        items.append(item)
+        return decode_blocks
+
+    return PRIMITIVE_DECODERS[schema_type]
+
+
+def compile_json_decoder(schema, names=None, namespace=None):
+    """
+    Returns a function that converts a value of the given Avro schema, as parsed from
+    its JSON encoding, to the same value compile_decoder() returns. This only differs
+    for unions, which the JSON encoding wraps in {"<branch type name>": value}.
+    """
+    if names is None:
+        names = {}
+
+    identity = lambda value: value
+
+    if isinstance(schema, str):
+        if schema in PRIMITIVE_DECODERS:
+            return identity
+        full_name = _full_name(schema, namespace)
+        return lambda value: names[full_name](value)
+
+    if isinstance(schema, list):
+        branches = {}
+        for branch in schema:
+            # named types are wrapped in their full name, other types in their type name
+            if isinstance(branch, str):
+                branch_name = branch if branch in PRIMITIVE_DECODERS else _full_name(branch, namespace)
+            elif "name" in branch:
+                branch_name = _full_name(branch["name"], branch.get("namespace", namespace))
+            else:
+                branch_name = branch["type"]
+            branches[branch_name] = compile_json_decoder(branch, names, namespace)
+
+        def decode_union(value):
+            if value is None:
+                return None
+            (branch_name, branch_value), = value.items()
+            return branches[branch_name](branch_value)
+        return decode_union
+
+    schema_type = schema["type"]
+    if schema_type == "record" or schema_type == "error":
+        full_name = _full_name(schema["name"], schema.get("namespace", namespace))
+        namespace = full_name.rpartition(".")[0] or None
+        fields = []
+
+        def decode_record(value):
+            return {name: decode(value[name]) for name, decode in fields}
+        names[full_name] = decode_record
+        fields.extend((field["name"], compile_json_decoder(field["type"], names, namespace)) for field in schema["fields"])
+        return decode_record
+
+    if schema_type in ("enum", "fixed"):
+        names[_full_name(schema["name"], schema.get("namespace", namespace))] = identity
+        return identity
+
+    if schema_type == "array":
+        decode_item = compile_json_decoder(schema["items"], names, namespace)
+        return lambda value: [decode_item(item) for item in value]
+
+    if schema_type == "map":
+        decode_item = compile_json_decoder(schema["values"], names, namespace)
+        return lambda value: {key: decode_item(item) for key, item in value.items()}
+
+    return identity
+
+
+def iter_events(data, event_types=None):
+    """
+    Yields the events of the contents of a history file as dicts with a "type" (e.g.
+    "JOB_FINISHED") and an "event" (the fields of the event). If event_types is given,
+    only the events of these types are yielded; the lines of other events of a JSON
+    history file are then skipped without being parsed.
+    """
+    version, schema, events = data.split(b"\n", 2)
+    schema = json.loads(schema.decode())
+
+    if version == BINARY_VERSION:
+        decode = compile_decoder(schema)
+        events = memoryview(events)
+        pos = 0
+        while pos < len(events):
+            event, pos = decode(events, pos)
+            if event_types is None or event["type"] in event_types:
+                yield event
+    elif version == JSON_VERSION:
+        decode = compile_json_decoder(schema)
+        prefixes = None if event_types is None else tuple('{{"type":"{}"'.format(event_type).encode() for event_type in event_types)
+        for line in events.split(b"\n"):
+            if line and (prefixes is None or line.startswith(prefixes)):
+                yield decode(json.loads(line.decode()))
+    else:
+        raise ValueError("unknown job history file version: {}".format(version))
+
+
+def counters_from_job_finished(job_finished):
+    """
+    Returns the counters of the fields of a JOB_FINISHED event, see Counter.
+    """
+    # (group, name) -> [display name, total, map, reduce], counters without map or reduce values are 0 there
+    values = OrderedDict()
+    for i, kind in enumerate(("totalCounters", "mapCounters", "reduceCounters")):
+        for group in job_finished[kind]["groups"]:
+            for count in group["counts"]:
+                fields = values.setdefault((group["name"], count["name"]), [count["displayName"], 0, 0, 0])
+                fields[1 + i] = count["value"]
+
+    return _counters_by_name(Counter(group, name, *fields) for (group, name), fields in values.items())
+
+
+def _counters_by_name(counters):
+    """
+    dict of counter name -> Counter, in which a counter whose name is already used by
+    a counter of another group is named "<group>.<name>" instead.
+    """
+    by_name = OrderedDict()
+    for counter in counters:
+        by_name[counter.group + "." + counter.name if counter.name in by_name else counter.name] = counter
+    return by_name
+
+
+def read_counters(data):
+    """
+    Returns the counters of the job whose history file has the given contents.
+    """
+    for event in iter_events(data, {"JOB_FINISHED"}):
+        return counters_from_job_finished(event["event"])
+
+    raise ValueError("the job history file has no JOB_FINISHED event, the job didn't succeed")
+
+
+def job_id_from_application_id(application_id):
+    """
+    The id of the MapReduce job run by an application, e.g. application_1562939123456_0001
+    runs job_1562939123456_0001.
+    """
+    return application_id.replace("application_", "job_", 1)
+
+
+def hdfs_read_history_file(job_id, user="hadoop"):
+    """
+    Returns the contents of the history file of a job, looking for it in the
+    intermediate done directory and then in the done directory of the JobHistoryServer,
+    or None if it isn't in either.
+    """
+    configuration = hadoop_configuration.get_configuration()
+    patterns = [configuration.get("mapreduce.jobhistory.intermediate-done-dir") + "/" + user + "/" + job_id + "-*.jhist",
+                # done/<year>/<month>/<day>/<serial number>/
+                configuration.get("mapreduce.jobhistory.done-dir") + "/*/*/*/*/" + job_id + "-*.jhist"]
+
+    for pattern in patterns:
+        try:
+            return util.execute_command(util.HDFS + " dfs -cat '" + pattern + "'", stderr=subprocess.DEVNULL)
+        except subprocess.CalledProcessError:
+            continue
+
+    return None
+
+
+def rest_get_counters(job_id):
+    """
+    Returns the counters of a job from the REST API of the JobHistoryServer.
+    """
+    with urllib.request.urlopen(JOB_HISTORY_SERVER_URL + "/jobs/" + job_id + "/counters") as response:
+        groups = json.loads(response.read().decode())["jobCounters"]["counterGroup"]
+
+    return _counters_by_name(Counter(group["counterGroupName"], counter["name"], "", counter["totalCounterValue"],
+                                     counter["mapCounterValue"], counter["reduceCounterValue"])
+                             for group in groups for counter in group["counter"])
+
+
+def get_job_counters(job_id, timeout=30, delay=1):
+    """
+    Returns the counters of a finished job, from its history file or, if there is
+    none, from the JobHistoryServer. The ApplicationMaster may still be copying the
+    history file when the job is reported as finished, so this waits up to timeout
+    seconds for it to appear.
+    """
+    deadline = time.perf_counter() + timeout
+    while True:
+        data = hdfs_read_history_file(job_id)
+        if data is not None:
+            return read_counters(data)
+
+        try:
+            return rest_get_counters(job_id)
+        except (urllib.error.URLError, ConnectionError):
+            pass
+
+        if time.perf_counter() > deadline:
+            raise TimeoutError("no job history for {}".format(job_id))
+        time.sleep(delay)
+
+
+def counters_table(counters_by_job_id, kind="total"):
+    """
+    Returns a NumPy structured array with one row per job (a dict of job id -> counters)
+    and one column (of int64) per counter, holding their total, map or reduce values
+    according to kind. Counters that a job doesn't have are set to -1.
+    """
+    names = []
+    for counters in counters_by_job_id.values():
+        names.extend(name for name in counters if name not in names)
+
+    table = np.zeros(len(counters_by_job_id), dtype=[("job_id", "U40")] + [(name, "i8") for name in names])
+    for name in names:
+        table[name] = -1
+    for i, (job_id, counters) in enumerate(counters_by_job_id.items()):
+        table["job_id"][i] = job_id
+        for name, counter in counters.items():
+            table[name][i] = getattr(counter, kind)
+
+    return table
+
+
+def save_counters_table(table, path):
+    """
+    Saves a table returned by counters_table() to a compressed .npz file.
+    """
+    np.savez_compressed(path, counters=table)
+
+
+def load_counters_table(path):
+    with np.load(path) as table:
+        return table["counters"]
+
+
+def print_counters(counters):
+    for name, counter in counters.items():
+        print("{}: {} (total {}, map {}, reduce {})".format(counter.display_name or name, name, counter.total, counter.map, counter.reduce))
+
+
+def _encode_long(n):
+    n = (n << 1) ^ (n >> 63)
+    encoded = bytearray()
+    while n > 0x7f:
+        encoded.append((n & 0x7f) | 0x80)
+        n >>= 7
+    encoded.append(n)
+    return bytes(encoded)
+
+
+def _encode(schema, value, names):
+    """
+    Binary encoding of a value of schema (records, enums, arrays, unions of null and
+    another type, strings and integers), used by verify() to write a history file.
+    """
+    if isinstance(schema, str):
+        if schema in ("int", "long"):
+            return _encode_long(value)
+        if schema == "string":
+            return _encode_long(len(value.encode())) + value.encode()
+        if schema == "null":
+            return b""
+        return _encode(names[schema], value, names)
+    if isinstance(schema, list):
+        index = schema.index("null") if value is None else next(i for i, branch in enumerate(schema) if branch != "null"
+                                                                   and (not isinstance(branch, dict) or branch.get("name") == value[0]))
+        return _encode_long(index) + _encode(schema[index], value if value is None else value[1], names)
+    if schema["type"] == "record":
+        names[schema["name"]] = schema
+        return b"".join(_encode(field["type"], value[field["name"]], names) for field in schema["fields"])
+    if schema["type"] == "enum":
+        names[schema["name"]] = schema
+        return _encode_long(schema["symbols"].index(value))
+    if schema["type"] == "array":
+        # one block with a negative count and a size, then an empty block
+        items = b"".join(_encode(schema["items"], item, names) for item in value)
+        return (_encode_long(-len(value)) + _encode_long(len(items)) + items if value else b"") + _encode_long(0)
+    raise ValueError(schema)
+
+
+def _encode_json(schema, value):
+    """
+    JSON encoding of a value written by _encode(), with the same branch naming as EventWriter.
+    """
+    if isinstance(schema, list):
+        if value is None:
+            return None
+        branch = next(branch for branch in schema if branch != "null" and (not isinstance(branch, dict) or branch.get("name") == value[0]))
+        name = "org.apache.hadoop.mapreduce.jobhistory." + (branch if isinstance(branch, str) else branch["name"])
+        return {name: _encode_json(branch, value[1])}
+    if isinstance(schema, dict) and schema["type"] == "record":
+        return OrderedDict((field["name"], _encode_json(field["type"], value[field["name"]])) for field in schema["fields"])
+    if isinstance(schema, dict) and schema["type"] == "array":
+        return [_encode_json(schema["items"], item) for item in value]
+    return value
+
+
+def verify():
+    """
+    Writes a binary and a JSON history file with the same events, whose schema has the
+    structure of Events.avpr, and checks that both are read back the same.
+    """
+    counter = {"type": "record", "name": "JhCounter", "fields": [{"name": "name", "type": "string"},
+                                                                  {"name": "displayName", "type": "string"},
+                                                                  {"name": "value", "type": "long"}]}
+    group = {"type": "record", "name": "JhCounterGroup", "fields": [{"name": "name", "type": "string"},
+                                                                     {"name": "displayName", "type": "string"},
+                                                                     {"name": "counts", "type": {"type": "array", "items": counter}}]}
+    counters = {"type": "record", "name": "JhCounters", "fields": [{"name": "name", "type": "string"},
+                                                                    {"name": "groups", "type": {"type": "array", "items": group}}]}
+    job_finished = {"type": "record", "name": "JobFinished", "fields": [{"name": "jobid", "type": "string"},
+                                                                         {"name": "finishTime", "type": "long"},
+                                                                         {"name": "totalCounters", "type": counters},
+                                                                         {"name": "mapCounters", "type": "JhCounters"},
+                                                                         {"name": "reduceCounters", "type": "JhCounters"}]}
+    task_started = {"type": "record", "name": "TaskStarted", "fields": [{"name": "taskid", "type": "string"},
+                                                                         {"name": "startTime", "type": "long"},
+                                                                         {"name": "counters", "type": ["null", "JhCounters"]}]}
+    schema = {"type": "record", "name": "Event", "namespace": "org.apache.hadoop.mapreduce.jobhistory",
+              "fields": [{"name": "type", "type": {"type": "enum", "name": "EventType", "symbols": ["JOB_FINISHED", "TASK_STARTED"]}},
+                         {"name": "event", "type": [job_finished, task_started]}]}
+
+    def jh_counters(map_output_bytes, materialized_bytes):
+        counts = [{"name": "MAP_OUTPUT_BYTES", "displayName": "Map output bytes", "value": map_output_bytes},
+                  {"name": "MAP_OUTPUT_MATERIALIZED_BYTES", "displayName": "Map output materialized bytes", "value": materialized_bytes}]
+        if map_output_bytes:
+            counts.append({"name": "BYTES_READ", "displayName": "Bytes Read", "value": -(1 << 40)})
+        groups = [{"name": "org.apache.hadoop.mapreduce.TaskCounter", "displayName": "Map-Reduce Framework", "counts": counts},
+                  {"name": "org.apache.hadoop.mapreduce.lib.input.FileInputFormatCounter", "displayName": "File Input Format Counters",
+                   "counts": [{"name": "BYTES_READ", "displayName": "Bytes Read", "value": 123}]}]
+        return {"name": "COUNTERS", "groups": groups}
+
+    events = [{"type": "TASK_STARTED", "event": ("TaskStarted", {"taskid": "task_1_0001_m_000000", "startTime": 1562939123456,
+                                                                 "counters": None})},
+              {"type": "TASK_STARTED", "event": ("TaskStarted", {"taskid": "task_1_0001_r_000000", "startTime": 1562939123457,
+                                                                 "counters": ("JhCounters", jh_counters(0, 0))})},
+              {"type": "JOB_FINISHED", "event": ("JobFinished", {"jobid": "job_1_0001", "finishTime": 1562939129999,
+                                                                 "totalCounters": jh_counters(60000, 80006),
+                                                                 "mapCounters": jh_counters(60000, 80006),
+                                                                 "reduceCounters": jh_counters(0, 0)})}]
+
+    header = json.dumps(schema).encode() + b"\n"
+    binary = BINARY_VERSION + b"\n" + header + b"".join(_encode(schema, event, {"JhCounters": counters}) for event in events)
+    json_lines = JSON_VERSION + b"\n" + header + b"".join(json.dumps(_encode_json(schema, event), separators=(",", ":")).encode() + b"\n"
+                                                        for event in events)
+
+    for data in (binary, json_lines):
+        decoded = list(iter_events(data))
+        assert [event["type"] for event in decoded] == ["TASK_STARTED", "TASK_STARTED", "JOB_FINISHED"]
+        assert decoded[0]["event"]["counters"] is None
+        assert decoded[1]["event"]["counters"]["groups"][1]["counts"][0]["value"] == 123
+        assert decoded[2]["event"]["totalCounters"]["groups"][0]["counts"][2]["value"] == -(1 << 40)
+
+        counters = read_counters(data)
+        assert list(counters) == ["MAP_OUTPUT_BYTES", "MAP_OUTPUT_MATERIALIZED_BYTES", "BYTES_READ",
+                                  "org.apache.hadoop.mapreduce.lib.input.FileInputFormatCounter.BYTES_READ"]
+        assert counters["MAP_OUTPUT_MATERIALIZED_BYTES"] == Counter("org.apache.hadoop.mapreduce.TaskCounter",
+                                                                    "MAP_OUTPUT_MATERIALIZED_BYTES",
+                                                                    "Map output materialized bytes", 80006, 80006, 0)
+
+    table = counters_table(OrderedDict([("job_1_0001", read_counters(binary)),
+                                        ("job_1_0002", {"MAP_OUTPUT_BYTES": Counter("", "MAP_OUTPUT_BYTES", "", 5, 5, 0)})]))
+    assert list(table["job_id"]) == ["job_1_0001", "job_1_0002"]
+    assert list(table["MAP_OUTPUT_BYTES"]) == [60000, 5] and list(table["MAP_OUTPUT_MATERIALIZED_BYTES"]) == [80006, -1]
+
+    print("verified reading binary and JSON history files")
+
+
+if __name__=="__main__":
+    if len(sys.argv) == 1:
+        verify()
+    else:
+        with open(sys.argv[1], "rb") as f:
+            print_counters(read_counters(f.read()))
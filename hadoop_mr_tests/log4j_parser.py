@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+"""
+Fast parsing of log4j output produced by Hadoop, assuming the date format set in
+hadoop/etc/log4j.properties is as follows:
+# Pattern format: Date LogLevel LoggerName LogMessage
+log4j.appender.RFA.layout.ConversionPattern=%d{ISO8601} %p %c: %m%n
+
+Example lines (task logs also include the name of the thread):
+2019-06-16 23:15:21,554 INFO [main] org.apache.hadoop.mapred.Merger: passNo: 2 numSegments: 3 factor: 3
+2019-07-03 21:27:37,886 WARN util.NativeCodeLoader: Unable to load native-hadoop library for your platform...
+
+Each line is matched once against a precompiled pattern that extracts both the
+timestamp and the logger name and only matches the wanted loggers, so lines are
+filtered while they are being parsed. Timestamps are converted to integer
+milliseconds since the epoch (treating them as UTC) and the conversion of the
+"YYYY-MM-DD HH:MM:SS" part, which is shared by many consecutive lines, is cached.
+
+The output of "yarn logs" is the concatenation of the log files of every container,
+each of which is already in chronological order, so merge_yarn_log() can produce the
+lines of the whole application in order by lazily merging these sections instead of
+loading and sorting all of them.
+
+Running this file benchmarks sort_file() and merge_yarn_log() against util.sort_log4j_by_timestamp()
+as it was originally implemented on a synthetic log (see benchmark() below).
+"""
+import re
+import sys
+import mmap
+import time
+import heapq
+import calendar
+import tempfile
+import functools
+from collections import namedtuple
+
+# groups: "YYYY-MM-DD HH:MM:SS", milliseconds, logger name
+LOG4J_LINE_FORMAT = r'(\d{{4}}-\d{{2}}-\d{{2}} \d{{2}}:\d{{2}}:\d{{2}}),(\d{{3}}) [A-Z]+ (?:\[[^\]]*\] )?({logger}): '
+
+# timestamp is in milliseconds since the epoch
+Log4jRecord = namedtuple("Log4jRecord", ["timestamp", "logger", "line"])
+
+@functools.lru_cache(maxsize=None)
+def compile_line_pattern(logger_prefixes=None):
+    """
+    Returns a compiled pattern that matches the start of the lines logged by loggers
+    whose name starts with one of logger_prefixes (a tuple of strings), or by any
+    logger if logger_prefixes is None. Filtering by logger is part of the pattern so
+    that it happens while the line is parsed.
+    """
+    if logger_prefixes is None:
+        logger = r'[^\s:]+'
+    else:
+        logger = "(?:{})".format("|".join(map(re.escape, logger_prefixes))) + r'[^\s:]*'
+
+    return re.compile(LOG4J_LINE_FORMAT.format(logger=logger))
+
+
+@functools.lru_cache(maxsize=4096)
+def second_to_milliseconds(second):
+    """
+    Converts a "YYYY-MM-DD HH:MM:SS" string to milliseconds since the epoch.
+    """
+    return calendar.timegm(time.strptime(second, "%Y-%m-%d %H:%M:%S")) * 1000
+
+
+def logger_prefixes_as_tuple(logger_prefixes):
+    """
+    Converts a single logger prefix or a sequence of them to a tuple (None stays None).
+    """
+    if logger_prefixes is None or isinstance(logger_prefixes, tuple):
+        return logger_prefixes
+
+    return (logger_prefixes,) if isinstance(logger_prefixes, str) else tuple(logger_prefixes)
+
+
+def parse_line(line):
+    """
+    Returns the Log4jRecord of a line, or None if the line isn't prefixed with a date
+    (e.g. lines of a stack trace or the headers written by "yarn logs").
+    """
+    match = compile_line_pattern().match(line)
+    if match is None:
+        return None
+
+    second, milliseconds, logger = match.groups()
+    return Log4jRecord(second_to_milliseconds(second) + int(milliseconds), logger, line)
+
+
+def iter_records(lines, logger_prefixes=None):
+    """
+    Yields the Log4jRecord of every line in lines (any iterable of strings, such as
+    an open file) that is prefixed with a date and, if logger_prefixes (a string or
+    sequence of strings) is given, whose logger name starts with one of logger_prefixes.
+    """
+    match_line = compile_line_pattern(logger_prefixes_as_tuple(logger_prefixes)).match
+
+    for line in lines:
+        match = match_line(line)
+        if match is None:
+            continue
+
+        second, milliseconds, logger = match.groups()
+        yield Log4jRecord(second_to_milliseconds(second) + int(milliseconds), logger, line)
+
+
+def read_records(path, logger_prefixes=None):
+    """
+    Streams the Log4jRecords of the log file at path, see iter_records().
+    """
+    with open(path, 'r', errors='replace') as log_file:
+        yield from iter_records(log_file, logger_prefixes)
+
+
+def sort_lines(lines, logger_prefixes=None):
+    """
+    Returns the lines that are prefixed with a date (and logged by one of
+    logger_prefixes, if given) sorted by timestamp. Lines with the same timestamp
+    keep their relative order.
+    """
+    records = sorted(iter_records(lines, logger_prefixes), key=lambda record: record.timestamp)
+    return [record.line for record in records]
+
+
+def sort_file(path, logger_prefixes=None):
+    """
+    Same as sort_lines() for the lines of the log file at path, which is read in a single pass.
+    """
+    with open(path, 'r', errors='replace') as log_file:
+        return sort_lines(log_file, logger_prefixes)
+
+
+def index_yarn_log_sections(log_file):
+    """
+    Given the output of "yarn logs" as an mmap (or bytes), returns the (start, end)
+    byte offsets of the contents of each log file it contains. Every log file is
+    printed by yarn as follows:
+
+    Container: container_1562894051760_0001_01_000002 on e3538724a1e9_38347
+    LogAggregationType: AGGREGATED
+    ===================================================================
+    LogType:syslog
+    LogLastModifiedTime:Fri Jul 12 01:14:37 +0000 2019
+    LogLength:25612
+    LogContents:
+    ...
+    End of LogType:syslog
+
+    If there are no such headers, the whole file is considered a single log file.
+    """
+    START_MARKER = b"\nLogContents:\n"
+    END_MARKER = b"\nEnd of LogType:"
+
+    sections = []
+    position = log_file.find(START_MARKER)
+
+    while position != -1:
+        start = position + len(START_MARKER)
+        end = log_file.find(END_MARKER, start)
+        end = len(log_file) if end == -1 else end + 1
+
+        sections.append((start, end))
+        position = log_file.find(START_MARKER, end - 1)
+
+    return sections if sections else [(0, len(log_file))]
+
+
+def yarn_log_section_container(log_file, start):
+    """
+    Returns the id of the container whose log file contents start at byte offset
+    start of log_file (see index_yarn_log_sections()), or "" if there is no
+    "Container: <id> on <node>" header before it.
+    """
+    header = log_file.rfind(b"Container: ", 0, start)
+    if header == -1:
+        return ""
+
+    line = log_file[header:log_file.find(b"\n", header)].decode(errors='replace')
+    return line[len("Container: "):].split(" on ")[0]
+
+
+def iter_section_lines(log_file, start, end):
+    """
+    Yields the lines between the byte offsets start and end of log_file (an mmap or bytes)
+    decoded as strings, without reading the rest of the file.
+    """
+    while start < end:
+        line_end = log_file.find(b"\n", start, end)
+        line_end = end if line_end == -1 else line_end + 1
+
+        yield log_file[start:line_end].decode(errors='replace')
+        start = line_end
+
+
+def merge_yarn_log(path, logger_prefixes=None):
+    """
+    Lazily yields the Log4jRecords (see iter_records()) of the output of "yarn logs"
+    at path in chronological order. The log file of each container is located
+    without being parsed, then the records of all of them are merged with a heap,
+    so only one pending record per log file is held in memory and the first records
+    are available as soon as the log files are located. This assumes the lines
+    within each log file are in chronological order, which is how log4j writes them.
+    """
+    with open(path, 'rb') as file:
+        if file.seek(0, 2) == 0:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log_file:
+            sections = [iter_records(iter_section_lines(log_file, start, end), logger_prefixes)
+                            for start, end in index_yarn_log_sections(log_file)]
+
+            yield from heapq.merge(*sections, key=lambda record: record.timestamp)
+
+
+def write_synthetic_log(path, size_in_MiB, num_containers=8):
+    """
+    Writes a log file of about size_in_MiB that looks like the output of "yarn logs":
+    the time ordered logs of num_containers containers one after the other, each
+    preceded by a header of lines that aren't prefixed with a date.
+    """
+    LOGGERS = ["org.apache.hadoop.mapred.MapTask", "org.apache.hadoop.mapred.Merger",
+               "org.apache.hadoop.mapreduce.task.reduce.Fetcher", "org.apache.hadoop.yarn.event.AsyncDispatcher",
+               "org.apache.hadoop.hdfs.DFSClient"]
+    START = 1560726921000 # 2019-06-16 23:15:21,000
+
+    num_bytes_per_container = (size_in_MiB << 20) // num_containers
+
+    with open(path, 'w') as log_file:
+        for container in range(num_containers):
+            log_file.write("Container: container_1560726921000_0001_01_{:06} on localhost_42349\n"
+                           "LogAggregationType: AGGREGATED\nLogType:syslog\nLogContents:\n".format(container + 1))
+
+            num_bytes = 0
+            line_number = 0
+            while num_bytes < num_bytes_per_container:
+                # containers run concurrently, so their timestamps overlap
+                timestamp = START + container * 7 + line_number * 3
+                line = "{},{:03} INFO [main] {}: synthetic message number {} of container {}\n".format(
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(timestamp // 1000)), timestamp % 1000,
+                    LOGGERS[line_number % len(LOGGERS)], line_number, container)
+                log_file.write(line)
+                num_bytes += len(line)
+                line_number += 1
+
+            log_file.write("\nEnd of LogType:syslog\n\n")
+
+
+def benchmark(size_in_MiB):
+    """
+    Times sorting the lines logged by "org.apache.hadoop.mapred" loggers of a
+    synthetic size_in_MiB log, first the way the tests originally did it (collect the
+    matching lines, then util.sort_log4j_by_timestamp() with per line datetime parsing
+    and an isoformat() sort key), then with sort_file() and merge_yarn_log().
+    """
+    import util
+
+    with tempfile.NamedTemporaryFile(suffix=".log") as log_file:
+        write_synthetic_log(log_file.name, size_in_MiB)
+
+        start = time.perf_counter()
+        with open(log_file.name, 'r') as file:
+            lines = [line for line in file if "org.apache.hadoop.mapred" in line]
+        lines_by_timestamp = sorted([(util.log4j_get_iso8601_datetime(line), line) for line in lines if util.is_log4j_output_prefixed_with_date(line)],
+                                    key=lambda line: line[0])
+        old_sorted_lines = [line[1] for line in lines_by_timestamp]
+        old_elapsed = time.perf_counter() - start
+        del lines, lines_by_timestamp
+
+        start = time.perf_counter()
+        new_sorted_lines = sort_file(log_file.name, "org.apache.hadoop.mapred")
+        new_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        merged_lines = [record.line for record in merge_yarn_log(log_file.name, "org.apache.hadoop.mapred")]
+        merge_elapsed = time.perf_counter() - start
+
+        assert old_sorted_lines == new_sorted_lines == merged_lines
+
+        print("{} MiB log, {} matching lines".format(size_in_MiB, len(new_sorted_lines)))
+        print("{:40} {:8.2f} s".format("util.sort_log4j_by_timestamp (old)", old_elapsed))
+        print("{:40} {:8.2f} s".format("log4j_parser.sort_file", new_elapsed))
+        print("{:40} {:8.2f} s".format("log4j_parser.merge_yarn_log", merge_elapsed))
+
+
+if __name__=="__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1024)
@@ -5,7 +5,26 @@ Testing mergeParts() in
 hadoop-mapreduce-project/hadoop-mapreduce-client/hadoop-mapreduce-client-core/src/main/java/org/apache/hadoop/mapred/MapTask.java.
 mergeParts() is called at the end of a map task once all map output has been spilled onto disk
 in a single or multiple spill files. The variable "factor" refers to the value set for the property, "mapreduce.task.io.sort.factor".
+
+Besides the simulations that print each pass, merge_schedule() returns the passes as data,
+num_merge_passes() and merged_units() compute the number of passes and the amount of data
+read by all passes in closed form, and tabulate() computes both for whole grids of factors
+and numbers of segments with NumPy. simulate_merge_costs() follows the segments themselves,
+by size, to report the bytes read and written by each pass. Running this file with --verify
+cross-checks them against the simulation, and with --benchmark times them.
 """
+import time
+import argparse
+import heapq
+import functools
+from collections import namedtuple
+
+import numpy as np
+
+MergePass = namedtuple("MergePass", ["pass_number", "num_segments", "pass_factor", "remaining_num_segments"])
+
+PassCost = namedtuple("PassCost", ["pass_number", "num_segments", "pass_factor", "num_merged_segments",
+                                   "bytes_read", "bytes_written", "remaining_num_segments"])
 
 def get_pass_factor(factor, pass_number, num_segments):
     """
@@ -21,39 +40,202 @@ def get_pass_factor(factor, pass_number, num_segments):
     return mod + 1
 
 
-def simulate_merges_using_variable_pass_factor(factor, initial_num_segments):
+def merge_schedule(factor, initial_num_segments):
     """
-    Adopted from the source code in
-    hadoop-mapreduce-project/hadoop-mapreduce-client/hadoop-mapreduce-client-core/src/main/java/org/apache/hadoop/mapred/Merger.java.
-    Logs from Map Reduce jobs will show similar information printed in this function, however
-    we can "fake" the merges here and avoid running lengthy Map Reduce jobs while still being
-    able to observe how mapreduce.task.io.sort.factor affects the number of segments being merged
-    at a time and the total number of passes done to merge all spill files into a single
-    file.
+    Returns the passes of simulate_merges_using_variable_pass_factor(factor, initial_num_segments)
+    as a list of MergePass instead of printing them.
     """
-    print("simulate_merges_using_variable_pass_factor({}, {})".format(factor, initial_num_segments))
+    if factor < 2:
+        raise ValueError("factor must be at least 2, got {}".format(factor))
+
+    schedule = []
     pass_number = 1
     remaining_num_segments = initial_num_segments
 
     while True:
         current_num_segments = remaining_num_segments
-        pass_factor = get_pass_factor(factor,
-                                        pass_number,
-                                        remaining_num_segments)
+        pass_factor = get_pass_factor(factor, pass_number, remaining_num_segments)
         remaining_num_segments -= pass_factor - 1
 
-        print("pass: {}, current_num_segments: {}, pass_factor: {}, remaining_num_segments: {}".format(
-            pass_number,
-            current_num_segments,
-            pass_factor,
-            remaining_num_segments if remaining_num_segments > 0 else 1 
-        ))
-
+        schedule.append(MergePass(pass_number, current_num_segments, pass_factor, max(remaining_num_segments, 1)))
         pass_number += 1
 
         if remaining_num_segments <= 1:
+            return schedule
+
+
+@functools.lru_cache(maxsize=None)
+def cached_merge_schedule(factor, initial_num_segments):
+    """
+    Memoized merge_schedule() that returns a tuple of MergePass.
+    """
+    return tuple(merge_schedule(factor, initial_num_segments))
+
+
+def num_merge_passes(factor, num_segments):
+    """
+    Closed form of len(merge_schedule(factor, num_segments)). The first pass merges just
+    enough segments that every following pass merges exactly factor of them, and each
+    pass replaces the segments it merges by one, so ceil((num_segments - 1) / (factor - 1))
+    passes are needed (with at least one pass, as in the simulation).
+    """
+    return max(1, -(-(num_segments - 1) // (factor - 1)))
+
+
+def merged_units(factor, num_segments):
+    """
+    Closed form of the total size of the segments read by all passes when merging
+    num_segments segments of size 1, i.e. how many times the data is read (and written)
+    in units of a segment. Merger.java always merges the smallest segments, so the merges
+    form an f-ary Huffman tree of equal weights, where the smaller first pass plays the
+    role of the zero weight "dummy" leaves. Such a tree with m = num_segments + dummies
+    leaves is complete: with f^k <= m < f^(k+1), x = (m - f^k) / (f - 1) nodes of depth k
+    are merges, leaving f^k - x segments at depth k and x * f at depth k + 1 (the dummies
+    being among the deepest), and the result is the sum of the depths of the real segments.
+    """
+    if num_segments <= 1:
+        return 0
+
+    num_dummies = (factor - 1 - (num_segments - 1) % (factor - 1)) % (factor - 1)
+    num_leaves = num_segments + num_dummies
+
+    depth, power = 0, 1
+    while power * factor <= num_leaves:
+        depth, power = depth + 1, power * factor
+
+    num_deeper_merges = (num_leaves - power) // (factor - 1)
+    dummies_depth = depth + 1 if num_deeper_merges > 0 else depth
+
+    return depth * (power - num_deeper_merges) + (depth + 1) * num_deeper_merges * factor - dummies_depth * num_dummies
+
+
+def tabulate(factors, segment_counts):
+    """
+    NumPy version of num_merge_passes() and merged_units() for every combination of
+    factors and segment_counts (each a sequence or array of integers). Returns two
+    arrays of shape (len(factors), len(segment_counts)): the number of passes and the
+    merged units.
+    """
+    factors = np.asarray(factors, dtype=np.int64)[:, None]
+    segment_counts = np.asarray(segment_counts, dtype=np.int64)[None, :]
+    factors, segment_counts = np.broadcast_arrays(factors, segment_counts)
+
+    num_passes = np.maximum(1, -(-(segment_counts - 1) // (factors - 1)))
+
+    num_dummies = (factors - 1 - (segment_counts - 1) % (factors - 1)) % (factors - 1)
+    num_leaves = segment_counts + num_dummies
+
+    depth = np.zeros_like(num_leaves)
+    power = np.ones_like(num_leaves)
+    while True:
+        deeper = power * factors <= num_leaves
+        if not deeper.any():
+            break
+        depth += deeper
+        power = np.where(deeper, power * factors, power)
+
+    num_deeper_merges = (num_leaves - power) // (factors - 1)
+    dummies_depth = depth + (num_deeper_merges > 0)
+
+    units = depth * (power - num_deeper_merges) + (depth + 1) * num_deeper_merges * factors - dummies_depth * num_dummies
+    units[segment_counts <= 1] = 0
+
+    return num_passes, units
+
+
+def simulate_merge_costs(factor, segment_sizes, write_final_pass=True, segment_overhead=0):
+    """
+    Simulates the passes of Merger.MergeQueue.merge() on disk segments (such as the spills
+    of a map task for a partition) of the given sizes in bytes and returns a PassCost
+    for each pass. As in Merger.java, each pass takes the get_pass_factor() smallest
+    segments (the segments are kept sorted by size, here in a heap), segments without
+    records are dropped when they are taken, intermediate passes write their output as a
+    new segment that is inserted back among the others, and the last pass is the one
+    that starts with no more segments than its pass factor.
+
+    segment_overhead is the number of bytes of a segment that aren't records (6 for the EOF
+    markers and checksum of an uncompressed IFile); a segment of at most that size has no
+    records and a merged segment contains it once. The last pass only reads its segments,
+    unless write_final_pass is True, as in MapTask.mergeParts() which writes it to file.out.
+    """
+    segments = list(segment_sizes)
+    heapq.heapify(segments)
+
+    costs = []
+    num_segments = len(segments)
+    pass_number = 1
+
+    while segments:
+        pass_factor = get_pass_factor(factor, pass_number, num_segments)
+        current_num_segments = num_segments
+
+        merged = []
+        while len(merged) < pass_factor and segments:
+            segment = heapq.heappop(segments)
+            if segment <= segment_overhead:
+                num_segments -= 1
+            else:
+                merged.append(segment)
+
+        bytes_read = sum(merged)
+        merged_size = bytes_read - max(len(merged) - 1, 0) * segment_overhead
+
+        if num_segments <= pass_factor:
+            costs.append(PassCost(pass_number, current_num_segments, pass_factor, len(merged),
+                                  bytes_read, merged_size if write_final_pass else 0, 0))
             break
 
+        heapq.heappush(segments, merged_size)
+        num_segments = len(segments)
+        costs.append(PassCost(pass_number, current_num_segments, pass_factor, len(merged),
+                              bytes_read, merged_size, num_segments))
+        pass_number += 1
+
+    return costs
+
+
+def print_merge_costs(costs):
+    """
+    Prints the PassCosts returned by simulate_merge_costs() and their totals.
+    """
+    print("{:>6} {:>10} {:>8} {:>8} {:>16} {:>16} {:>16}".format(
+        "pass", "segments", "factor", "merged", "bytes read", "bytes written", "I/O bytes"))
+    for cost in costs:
+        print("{:6} {:10} {:8} {:8} {:16} {:16} {:16}".format(
+            cost.pass_number, cost.num_segments, cost.pass_factor, cost.num_merged_segments,
+            cost.bytes_read, cost.bytes_written, cost.bytes_read + cost.bytes_written))
+
+    bytes_read = sum(cost.bytes_read for cost in costs)
+    bytes_written = sum(cost.bytes_written for cost in costs)
+    print("{:>6} {:10} {:8} {:8} {:16} {:16} {:16}".format("total", "", "", "", bytes_read, bytes_written, bytes_read + bytes_written))
+
+
+def simulate_merged_units(factor, num_segments):
+    """
+    Returns the total size of the segments read when merging num_segments segments of
+    size 1 according to simulate_merge_costs() (0 if there is nothing to merge).
+    """
+    if num_segments <= 1:
+        return 0
+
+    return sum(cost.bytes_read for cost in simulate_merge_costs(factor, [1] * num_segments))
+
+
+def simulate_merges_using_variable_pass_factor(factor, initial_num_segments):
+    """
+    Adopted from the source code in
+    hadoop-mapreduce-project/hadoop-mapreduce-client/hadoop-mapreduce-client-core/src/main/java/org/apache/hadoop/mapred/Merger.java.
+    Logs from Map Reduce jobs will show similar information printed in this function, however
+    we can "fake" the merges here and avoid running lengthy Map Reduce jobs while still being
+    able to observe how mapreduce.task.io.sort.factor affects the number of segments being merged
+    at a time and the total number of passes done to merge all spill files into a single
+    file.
+    """
+    print("simulate_merges_using_variable_pass_factor({}, {})".format(factor, initial_num_segments))
+
+    for merge_pass in merge_schedule(factor, initial_num_segments):
+        print("pass: {}, current_num_segments: {}, pass_factor: {}, remaining_num_segments: {}".format(*merge_pass))
+
 def simulate_merges_using_fixed_pass_factor(factor, initial_num_segments):
     """
     Does the same thing as simulate_merges_using_variable_pass_factor(factor, initial_num_segments) above
@@ -82,10 +264,87 @@ def simulate_merges_using_fixed_pass_factor(factor, initial_num_segments):
         if remaining_num_segments == 1:
             break
 
+def verify(max_factor=40, max_num_segments=600):
+    """
+    Cross-checks num_merge_passes(), merged_units() and tabulate() against merge_schedule()
+    and simulate_merged_units() for every factor and number of segments up to the given maximums.
+    """
+    factors = range(2, max_factor + 1)
+    segment_counts = range(0, max_num_segments + 1)
+    num_passes_table, units_table = tabulate(factors, segment_counts)
+
+    for row, factor in enumerate(factors):
+        for column, num_segments in enumerate(segment_counts):
+            num_passes = num_merge_passes(factor, num_segments)
+            units = merged_units(factor, num_segments)
+
+            assert num_passes == len(merge_schedule(factor, num_segments)) == num_passes_table[row, column], (factor, num_segments)
+            assert units == simulate_merged_units(factor, num_segments) == units_table[row, column], (factor, num_segments)
+
+            if num_segments > 1:
+                costs = simulate_merge_costs(factor, [1] * num_segments)
+                assert [cost.num_segments for cost in costs] == [merge_pass.num_segments for merge_pass in merge_schedule(factor, num_segments)]
+
+    print("verified {} combinations of factor and number of segments".format(len(factors) * len(segment_counts)))
+
+
+def benchmark(num_factors=1000, num_segment_counts=1000):
+    """
+    Times computing the number of passes of num_factors x num_segment_counts combinations
+    with the simulation, the closed form and tabulate().
+    """
+    factors = range(2, num_factors + 2)
+    segment_counts = range(1, num_segment_counts + 1)
+
+    # the simulation is too slow to run on every combination, so it is timed on a sample of the factors
+    sampled_factors = factors[::max(1, len(factors) // 10)]
+    start = time.perf_counter()
+    for factor in sampled_factors:
+        for num_segments in segment_counts:
+            len(merge_schedule(factor, num_segments))
+    schedule_elapsed = (time.perf_counter() - start) * len(factors) / len(sampled_factors)
+
+    start = time.perf_counter()
+    for factor in factors:
+        for num_segments in segment_counts:
+            num_merge_passes(factor, num_segments)
+            merged_units(factor, num_segments)
+    closed_form_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tabulate(factors, segment_counts)
+    tabulate_elapsed = time.perf_counter() - start
+
+    print("{} combinations".format(len(factors) * len(segment_counts)))
+    print("{:40} {:8.3f} s (extrapolated)".format("merge_schedule", schedule_elapsed))
+    print("{:40} {:8.3f} s".format("num_merge_passes + merged_units", closed_form_elapsed))
+    print("{:40} {:8.3f} s".format("tabulate", tabulate_elapsed))
+
+    # byte weighted simulation of the spills of a map task that spilled many times
+    segment_sizes = np.random.randint(1, 100 << 20, size=50000).tolist()
+    start = time.perf_counter()
+    costs = simulate_merge_costs(10, segment_sizes, segment_overhead=6)
+    print("{:40} {:8.3f} s ({} segments, {} passes, {} bytes of I/O)".format(
+        "simulate_merge_costs", time.perf_counter() - start, len(segment_sizes), len(costs),
+        sum(cost.bytes_read + cost.bytes_written for cost in costs)))
+
+
 if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="simulations of the merge passes of mergeParts()")
+    parser.add_argument("--verify", action="store_true", help="cross-check the closed forms against the simulation")
+    parser.add_argument("--benchmark", action="store_true", help="time the closed forms and simulations")
+    args = parser.parse_args()
+
     simulate_merges_using_variable_pass_factor(5, 23)
     simulate_merges_using_fixed_pass_factor(5, 23)
 
+    print_merge_costs(simulate_merge_costs(5, [3 << 20, 1 << 20, 6, 2 << 20, 8 << 20, 1 << 20, 4 << 20, 5 << 20], segment_overhead=6))
+
+    if args.verify:
+        verify()
+    if args.benchmark:
+        benchmark()
+
     """
     simulate_merges_using_variable_pass_factor(5, 23)
     pass: 1, current_num_segments: 23, pass_factor: 3, remaining_num_segments: 21
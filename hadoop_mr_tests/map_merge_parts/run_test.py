@@ -1,12 +1,15 @@
 
+import sys
 import subprocess
-import time
-import math
 import pass_factor
 from collections import namedtuple
 
-# this module will be placed in the same directory as this file by Dockerfile 'COPY'
+# these modules will be placed in the same directory as this file by Dockerfile 'COPY'
 import util
+import log4j_parser
+import merge_events
+import task_profiler
+import map_output_buffer
 
 """
 Test to determine how map tasks merge spill files. This test generates an
@@ -23,18 +26,15 @@ def generate_input_that_results_in_n_spills(desired_num_spills, mapreduce_task_i
     files to be written by a single map task. Note that if you generate an input file that is larger than the block size,
     multiple mappers may be run.
     """
-    # the number of bytes each key value pair will use in the map output buffer,
-    # which includes metadata
-    META_NUM_BYTES = 16
-    KEY_LEN_NUM_BYTES = 1
+    # serialized key ("r" and its length) and value, see map_output_materialized_bytes/run_test.py
     KEY_NUM_BYTES = 2
-    VALUE_LEN_NUM_BYTES = 1
     VALUE_NUM_BYTES = 4
-    KV_NUM_BYTES_IN_OUTPUT_BUFFER = META_NUM_BYTES + KEY_LEN_NUM_BYTES + KEY_NUM_BYTES + VALUE_LEN_NUM_BYTES + VALUE_NUM_BYTES
 
-    num_single_char_words = math.ceil(((mapreduce_task_io_sort_mb << 20) *
-                                mapreduce_map_sort_spill_percent *
-                                desired_num_spills) // KV_NUM_BYTES_IN_OUTPUT_BUFFER)
+    # simulate the map output buffer to find the range of input sizes that result in
+    # the desired number of spills, and pick the middle of it
+    start, stop = map_output_buffer.num_records_for_spills(desired_num_spills, KEY_NUM_BYTES, VALUE_NUM_BYTES,
+                                                           mapreduce_task_io_sort_mb, mapreduce_map_sort_spill_percent)
+    num_single_char_words = (start + stop) // 2
 
     return [['r' for i in range(num_single_char_words)]]
 
@@ -110,6 +110,10 @@ if __name__=="__main__":
     # set the test
     test = T2
 
+    # set to "jfr" (or "hprof") to profile the map and reduce tasks with a sampling profiler
+    # (see task_profiler.py), whose collapsed stacks are written to /home/hadoop/profiles
+    profiler = None
+
     # -----------------------------------------------------------------------------------
     util.hadoop_start_up()
     util.hdfs_generate_custom_word_files(generate_input_that_results_in_n_spills(test,
@@ -119,22 +123,29 @@ if __name__=="__main__":
     util.execute_command(("/usr/local/hadoop/bin/hadoop jar "
                             "/usr/local/hadoop/share/hadoop/mapreduce/hadoop-mapreduce-examples-3.3.0-SNAPSHOT.jar "
                             "wordcount {} input output").format(
-                                " ".join(["-D {}={}".format(property, value) for property, value in MAPREDUCE_PROPERTIES.items()])
+                                " ".join(["-D {}={}".format(property, value) for property, value in MAPREDUCE_PROPERTIES.items()] +
+                                          ([task_profiler.profile_options(profiler)] if profiler else []))
                                 ), stderr=subprocess.STDOUT)
 
-    time.sleep(5)
-
-    # write logs to file
-    LOG_FILE_PATH = util.yarn_write_logs_to_file(util.yarn_get_application_id())
-
-    logs = []
-
-    with open(LOG_FILE_PATH, 'r') as file:
-        for line in file:
-            if "org.apache.hadoop.mapred" in line:
-                logs.append(line)
-
-    sorted_logs = util.sort_log4j_by_timestamp(logs)
+    # wait until yarn has aggregated the logs of the job, then write them to file
+    application_id = util.yarn_get_latest_application_id()
+    if application_id is None:
+        util.print_red("no application was submitted to YARN, there are no logs to read")
+        util.hadoop_tear_down()
+        sys.exit(1)
+    util.yarn_wait_for_logs(application_id)
+    LOG_FILE_PATH = util.yarn_write_logs_to_file(application_id)
+
+    if profiler:
+        task_profiler.convert_profiles(task_profiler.yarn_fetch_profiles(application_id, profiler))
+
+    # save the spill, shuffle and merge events of the job as a table for later analysis
+    events = merge_events.read_yarn_log_events(LOG_FILE_PATH)
+    merge_events.save_events(events, "/home/hadoop/merge_events.npz")
+    merge_events.print_summary(events)
+
+    # merge the logs of "org.apache.hadoop.mapred*" loggers of every container by timestamp
+    sorted_logs = [record.line for record in log4j_parser.merge_yarn_log(LOG_FILE_PATH, "org.apache.hadoop.mapred")]
     util.hadoop_tear_down()
     # -----------------------------------------------------------------------------------
 
@@ -0,0 +1,648 @@
+#!/usr/bin/env python3
+
+"""
+Simulates the map side sort buffer, MapOutputBuffer in
+hadoop-mapreduce-project/hadoop-mapreduce-client/hadoop-mapreduce-client-core/src/main/java/org/apache/hadoop/mapred/MapTask.java,
+to find out exactly how many spill files a map task writes and what is in them.
+
+Instead of dividing the bytes of the map output by the soft limit, the simulation
+keeps the same indices into the circular kvbuffer that MapOutputBuffer does:
+
+    - every record takes 16 bytes of metadata (kvmeta) growing down from the
+      equator, and its serialized key and value growing up from the equator
+    - a spill starts in collect() once the used bytes (metadata included) reach
+      mapreduce.map.sort.spill.percent of mapreduce.task.io.sort.mb, the equator
+      is then moved into the free space and collection carries on while the
+      spill thread writes the spill
+    - a write blocks (and starts a spill, if one isn't running) when it would run
+      into the metadata or the bytes being spilled
+    - a key that would wrap around the end of the buffer is moved to its start
+      (shiftBufferedKey), and a record that doesn't fit in an empty buffer is
+      written to its own spill file (spillSingleRecord)
+
+Records are given as arrays of serialized key lengths, serialized value lengths
+(e.g. 2 + 128 bytes for a 128 character Text, 4 bytes for an IntWritable) and
+partitions. Between the points where MapOutputBuffer takes its lock, records are
+consumed a batch at a time with cumulative sums, so 10^8 records take seconds.
+
+The keys and values are each treated as a single write to the buffer, whereas
+serializers write a few bytes at a time (e.g. the length of a Text and then its
+bytes). This only matters for records that end up right at the point where a
+write blocks. Spills take no time unless collect_bytes_per_second and
+spill_bytes_per_second are given, in which case the spill thread writes spills
+concurrently with collection and the timeline of spills is modeled too.
+
+Usage:
+    ./map_output_buffer.py [<number of records for the benchmark>]
+"""
+import sys
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# these modules will be placed in the same directory as this file by Dockerfile 'COPY'
+import ifile
+import zero_compress
+
+NMETA = 4                   # ints of metadata per record: value start, key start, partition and value length
+METASIZE = NMETA * 4        # bytes of metadata per record
+
+# the EOF markers and checksum that end every partition (IFile segment) of a spill file
+IFILE_SEGMENT_OVERHEAD = len(ifile.EOF_MARKER_BYTES) + ifile.CHECKSUM_SIZE
+
+BATCH_SIZE = 1 << 20
+
+# a spill file, when it was started and when the spill thread finished writing it
+Spill = namedtuple("Spill", ["spill", "first_record", "num_records", "bytes", "start_time", "end_time"])
+
+MapOutputBufferResult = namedtuple("MapOutputBufferResult", [
+    "num_records",
+    "map_output_bytes",             # "Map output bytes" counter
+    "num_spills",
+    "spills",                       # list of Spill
+    "spill_partition_records",      # records of each partition of each spill file, shape (num_spills, num_partitions)
+    "spill_partition_bytes",        # bytes of each partition (IFile segment) of each spill file
+    "partition_bytes",              # bytes of each partition of the final map output
+    "materialized_bytes",           # "Map output materialized bytes" counter
+    "collect_seconds",              # time spent collecting records, when collect_bytes_per_second is given
+    "blocked_seconds",              # time spent waiting for the spill thread or spilling in the map thread
+])
+
+class _MapBufferTooSmall(Exception):
+    """
+    MapBufferTooSmallException, raised when a record doesn't fit in an empty buffer.
+    """
+    pass
+
+
+class MapOutputBuffer:
+    """
+    The state of a MapOutputBuffer. Attributes are named after the fields of the Java
+    class, and methods that port a Java method have the same name in snake case.
+    """
+    def __init__(self, num_partitions, io_sort_mb=100, spill_percent=0.8,
+                 collect_bytes_per_second=None, spill_bytes_per_second=None):
+        if spill_percent > 1.0 or spill_percent <= 0.0:
+            raise ValueError("Invalid \"mapreduce.map.sort.spill.percent\": {}".format(spill_percent))
+        if (io_sort_mb & 0x7FF) != io_sort_mb:
+            raise ValueError("Invalid \"mapreduce.task.io.sort.mb\": {}".format(io_sort_mb))
+
+        self.partitions = num_partitions
+        max_mem_usage = io_sort_mb << 20
+        self.length = max_mem_usage - max_mem_usage % METASIZE
+        self.capacity = self.length // 4
+        self.bufvoid = self.length
+
+        self.set_equator(0)
+        self.bufstart = self.bufend = self.bufindex = self.bufmark = self.equator
+        self.kvstart = self.kvend = self.kvindex
+
+        # (int)(kvbuffer.length * spillper) is computed with float precision
+        self.soft_limit = int(np.float32(self.length) * np.float32(spill_percent))
+        self.buffer_remaining = self.soft_limit
+        self.spill_in_progress = False
+
+        # counters
+        self.num_records = 0
+        self.map_output_bytes = 0
+
+        # spill files and their partitions
+        self.spills = []
+        self.spill_partition_records = []
+        self.spill_partition_bytes = []
+        self._spill_first_record = 0
+        self._pending_records = np.zeros(num_partitions, dtype=np.int64)
+        self._pending_bytes = np.zeros(num_partitions, dtype=np.int64)
+
+        # time
+        self.collect_bytes_per_second = collect_bytes_per_second
+        self.spill_bytes_per_second = spill_bytes_per_second
+        self.collected_bytes = 0
+        self.blocked_seconds = 0.0
+        self._spill_end_time = 0.0
+        self._spill_end_bytes = None
+
+        self._set_batch(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    def distance_to(self, i, j, mod=None):
+        """
+        Distance between two indices in the circular buffer.
+        """
+        return j - i if i <= j else (self.length if mod is None else mod) - i + j
+
+    def set_equator(self, pos):
+        """
+        Sets the point from which metadata and serialization data expand.
+        """
+        self.equator = pos
+        aligned = pos - (pos % METASIZE)
+        self.kvindex = ((aligned - METASIZE + self.length) % self.length) // 4
+
+    def reset_spill(self):
+        """
+        Reclaims the space of a finished spill.
+        """
+        e = self.equator
+        self.bufstart = self.bufend = e
+        aligned = e - (e % METASIZE)
+        self.kvstart = self.kvend = ((aligned - METASIZE + self.length) % self.length) // 4
+
+    def _spill_needs_reset(self):
+        return (4 * self.kvend + METASIZE) % self.length != self.equator - (self.equator % METASIZE)
+
+    def clock(self):
+        """
+        Seconds since the first record was collected.
+        """
+        collect_seconds = self.collected_bytes / self.collect_bytes_per_second if self.collect_bytes_per_second else 0.0
+        return collect_seconds + self.blocked_seconds
+
+    def _set_batch(self, key_lengths, value_lengths, partitions):
+        self._k = key_lengths
+        self._v = value_lengths
+        self._p = partitions
+        self._batch_start = self.num_records
+
+        serialized_bytes = key_lengths + value_lengths
+        self._cumser = np.concatenate([[0], np.cumsum(serialized_bytes)])
+        self._cumcost = np.concatenate([[0], np.cumsum(serialized_bytes + METASIZE)])
+        self._ifile_bytes = (zero_compress.zero_compressed_sizes(key_lengths) +
+                             zero_compress.zero_compressed_sizes(value_lengths) + serialized_bytes)
+
+    def _close_spill(self, end_record, synchronous):
+        """
+        Makes a spill file of the records from the end of the previous spill up to
+        end_record. A spill started by start_spill() is written by the spill thread,
+        other spills are written by the map thread, which blocks collection.
+        """
+        local_start = max(self._spill_first_record - self._batch_start, 0)
+        local_end = end_record - self._batch_start
+        partitions = self._p[local_start:local_end]
+
+        partition_records = self._pending_records + np.bincount(partitions, minlength=self.partitions)
+        partition_bytes = self._pending_bytes + np.bincount(partitions, weights=self._ifile_bytes[local_start:local_end],
+                                                            minlength=self.partitions).astype(np.int64)
+        self._pending_records = np.zeros(self.partitions, dtype=np.int64)
+        self._pending_bytes = np.zeros(self.partitions, dtype=np.int64)
+
+        num_bytes = int(partition_bytes.sum()) + IFILE_SEGMENT_OVERHEAD * self.partitions
+        start_time = self.clock()
+        duration = num_bytes / self.spill_bytes_per_second if self.spill_bytes_per_second else 0.0
+
+        if synchronous:
+            self.blocked_seconds += duration
+        else:
+            self.spill_in_progress = True
+            self._spill_end_time = start_time + duration
+            if duration == 0.0:
+                self._spill_end_bytes = self.collected_bytes
+            elif self.collect_bytes_per_second:
+                self._spill_end_bytes = self.collected_bytes + math.ceil(duration * self.collect_bytes_per_second)
+            else:
+                self._spill_end_bytes = None
+
+        self.spills.append(Spill(len(self.spills), self._spill_first_record, end_record - self._spill_first_record,
+                                 num_bytes, start_time, start_time + duration))
+        self.spill_partition_records.append(partition_records)
+        self.spill_partition_bytes.append(partition_bytes)
+        self._spill_first_record = end_record
+
+    def start_spill(self):
+        """
+        Hands the collected records over to the spill thread.
+        """
+        self.kvend = (self.kvindex + NMETA) % self.capacity
+        self.bufend = self.bufmark
+        self._close_spill(self.num_records, synchronous=False)
+
+    def _finish_spill(self):
+        """
+        What the spill thread does once it has written a spill.
+        """
+        if self.bufend < self.bufstart:
+            self.bufvoid = self.length
+        self.kvstart = self.kvend
+        self.bufstart = self.bufend
+        self.spill_in_progress = False
+
+    def _finish_spill_if_done(self):
+        if self.spill_in_progress and self._spill_end_bytes is not None and self.collected_bytes >= self._spill_end_bytes:
+            self._finish_spill()
+
+    def _wait_for_spill(self):
+        self.blocked_seconds += max(self._spill_end_time - self.clock(), 0.0)
+        self._finish_spill()
+
+    def _write(self, length):
+        """
+        Buffer.write(), a write of length bytes at bufindex.
+        """
+        self.buffer_remaining -= length
+        if self.buffer_remaining <= 0:
+            while True:
+                self._finish_spill_if_done()
+
+                kvbidx = 4 * self.kvindex
+                kvbend = 4 * self.kvend
+                distkvi = self.distance_to(self.bufindex, kvbidx)
+                distkve = self.distance_to(self.bufindex, kvbend)
+
+                if distkvi <= distkve:
+                    blockwrite = distkvi <= length + 2 * METASIZE
+                else:
+                    blockwrite = distkve <= length or self.distance_to(self.bufend, kvbidx) < 2 * METASIZE
+
+                if not blockwrite:
+                    break
+
+                if not self.spill_in_progress:
+                    if self._spill_needs_reset():
+                        self.reset_spill()
+                        self.buffer_remaining = min(distkvi - 2 * METASIZE,
+                                                    self.soft_limit - self.distance_to(kvbidx, self.bufindex)) - length
+                        continue
+
+                    if self.kvindex != self.kvend:
+                        self.start_spill()
+                        self.set_equator(self.bufmark)
+                    else:
+                        self.set_equator(0)
+                        self.bufstart = self.bufend = self.bufindex = self.equator
+                        self.kvstart = self.kvend = self.kvindex
+                        self.bufvoid = self.length
+                        raise _MapBufferTooSmall()
+
+                self._wait_for_spill()
+
+        if self.bufindex + length > self.bufvoid:
+            length -= self.bufvoid - self.bufindex
+            self.bufindex = 0
+        self.bufindex += length
+
+    def shift_buffered_key(self):
+        """
+        Makes a key that wrapped around the end of the buffer contiguous.
+        """
+        headbytelen = self.bufvoid - self.bufmark
+        self.bufvoid = self.bufmark
+        avail = min(self.distance_to(0, 4 * self.kvindex), self.distance_to(0, 4 * self.kvend))
+        if self.bufindex + headbytelen < avail:
+            self.bufindex += headbytelen
+            self.buffer_remaining -= self.length - self.bufvoid
+        else:
+            tail = self.bufindex
+            self.bufindex = 0
+            self._write(headbytelen)
+            self._write(tail)
+
+    def _collect_record(self, index):
+        """
+        collect(), for record index of the current batch.
+        """
+        key_length = int(self._k[index])
+        value_length = int(self._v[index])
+
+        self._finish_spill_if_done()
+        self.buffer_remaining -= METASIZE
+        if self.buffer_remaining <= 0 and not self.spill_in_progress:
+            kvbidx = 4 * self.kvindex
+            b_used = self.distance_to(kvbidx, self.bufindex)
+            if self._spill_needs_reset():
+                self.reset_spill()
+                self.buffer_remaining = min(self.distance_to(self.bufindex, kvbidx) - 2 * METASIZE,
+                                            self.soft_limit - b_used) - METASIZE
+            elif b_used >= self.soft_limit and self.kvindex != self.kvend:
+                self.start_spill()
+                avg_rec = self.map_output_bytes // self.num_records
+                # leave at least half the split buffer for serialization data
+                distkvi = self.distance_to(self.bufindex, kvbidx)
+                new_pos = (self.bufindex + max(2 * METASIZE - 1,
+                                               min(distkvi // 2, distkvi // (METASIZE + avg_rec) * METASIZE))) % self.length
+                self.set_equator(new_pos)
+                self.bufmark = self.bufindex = new_pos
+                self.buffer_remaining = min(self.distance_to(self.bufend, new_pos),
+                                            self.distance_to(new_pos, 4 * self.kvend),
+                                            self.soft_limit) - 2 * METASIZE
+            self._finish_spill_if_done()
+
+        try:
+            keystart = self.bufindex
+            self._write(key_length)
+            if self.bufindex < keystart:
+                self.shift_buffered_key()
+                keystart = 0
+            self._write(value_length)
+            self._write(0)
+            self.bufmark = self.bufindex
+
+            self.map_output_bytes += self.distance_to(keystart, self.bufmark, self.bufvoid)
+            self.kvindex = (self.kvindex - NMETA + self.capacity) % self.capacity
+            self.num_records += 1
+        except _MapBufferTooSmall:
+            # spillSingleRecord
+            self.map_output_bytes += int(self._ifile_bytes[index])
+            self.num_records += 1
+            self._close_spill(self.num_records, synchronous=True)
+
+        self.collected_bytes += key_length + value_length
+
+    def _lock_free_records(self, i):
+        """
+        Returns how many records from index i of the current batch can be collected
+        without any of the checks made under the lock changing the state of the buffer,
+        a spill finishing or a key wrapping around the end of the buffer.
+        """
+        cumser = self._cumser
+        cumcost = self._cumcost
+        limit = len(self._k) - i
+
+        # the spill thread resets bufvoid when it finishes
+        if self.spill_in_progress:
+            if self._spill_end_bytes is None:
+                pass
+            else:
+                q = np.searchsorted(cumser, cumser[i] + self._spill_end_bytes - self.collected_bytes, "left")
+                limit = min(limit, q - i)
+
+        wrap = self.bufvoid - self.bufindex
+        if self.buffer_remaining > 0:
+            # records that leave bufferRemaining > 0 never take the lock
+            q = np.searchsorted(cumcost, cumcost[i] + self.buffer_remaining, "left")
+            limit = min(limit, q - 1 - i)
+
+            # stop before the record at bufvoid if its key wraps, or after it if only its value does
+            q = np.searchsorted(cumser, cumser[i] + wrap, "right")
+            if q < len(cumser):
+                j = q - 1
+                start = cumser[j] - cumser[i]
+                if start < wrap < start + self._k[j] or (start == wrap and self._k[j] > 0):
+                    limit = min(limit, j - i)
+                else:
+                    limit = min(limit, j - i + 1)
+
+            return max(limit, 0)
+
+        # every collect and write takes the lock, but nothing happens until a spill
+        # starts or is reset, or until a write blocks
+        kvbidx = 4 * self.kvindex
+        if not self.spill_in_progress:
+            b_used = self.distance_to(kvbidx, self.bufindex)
+            if self._spill_needs_reset() or self.kvindex == self.kvend or b_used >= self.soft_limit:
+                return 0
+            q = np.searchsorted(cumcost, cumcost[i] + self.soft_limit - b_used, "left")
+            limit = min(limit, q - i)
+
+        distkvi = self.distance_to(self.bufindex, kvbidx)
+        distkve = self.distance_to(self.bufindex, 4 * self.kvend)
+        q = np.searchsorted(cumcost, cumcost[i] + distkvi - METASIZE, "left")
+        limit = min(limit, q - 1 - i)
+        if distkvi > distkve:
+            q = np.searchsorted(cumser, cumser[i] + distkve, "left")
+            limit = min(limit, q - 1 - i, (self.distance_to(self.bufend, kvbidx) - 2 * METASIZE) // METASIZE + 1)
+
+        # stop before any write wraps around bufvoid
+        q = np.searchsorted(cumser, cumser[i] + wrap, "right")
+        limit = min(limit, q - 1 - i)
+
+        return max(limit, 0)
+
+    def _collect_lock_free(self, i, num_records):
+        serialized_bytes = int(self._cumser[i + num_records] - self._cumser[i])
+        self.buffer_remaining -= int(self._cumcost[i + num_records] - self._cumcost[i])
+
+        pos = self.bufindex + serialized_bytes
+        self.bufindex = self.bufmark = pos if pos <= self.bufvoid else pos - self.bufvoid
+        self.kvindex = (self.kvindex - NMETA * num_records) % self.capacity
+
+        self.num_records += num_records
+        self.map_output_bytes += serialized_bytes
+        self.collected_bytes += serialized_bytes
+
+    def collect_batch(self, key_lengths, value_lengths, partitions, vectorized=True):
+        """
+        Collects records with the given serialized key lengths, serialized value
+        lengths and partitions. If vectorized is False, every record goes through
+        the port of collect(), which is slow but useful to check the fast path.
+        """
+        key_lengths = np.asarray(key_lengths, dtype=np.int64)
+        value_lengths = np.broadcast_to(np.asarray(value_lengths, dtype=np.int64), key_lengths.shape)
+        partitions = np.broadcast_to(np.asarray(partitions, dtype=np.int64), key_lengths.shape)
+        if len(partitions) and (partitions.min() < 0 or partitions.max() >= self.partitions):
+            raise ValueError("Illegal partition in {}".format(partitions))
+
+        self._set_batch(key_lengths, value_lengths, partitions)
+
+        i = 0
+        while i < len(key_lengths):
+            self._finish_spill_if_done()
+            num_records = self._lock_free_records(i) if vectorized else 0
+            if num_records:
+                self._collect_lock_free(i, num_records)
+                i += num_records
+            else:
+                self._collect_record(i)
+                i += 1
+
+        # the records since the last spill wait for the next one
+        local_start = max(self._spill_first_record - self._batch_start, 0)
+        remaining = partitions[local_start:]
+        self._pending_records += np.bincount(remaining, minlength=self.partitions)
+        self._pending_bytes += np.bincount(remaining, weights=self._ifile_bytes[local_start:],
+                                           minlength=self.partitions).astype(np.int64)
+        self._set_batch(self._k[:0], self._v[:0], self._p[:0])
+
+    def flush(self):
+        """
+        Waits for the spill thread and spills the remaining records.
+        """
+        if self.spill_in_progress:
+            self._wait_for_spill()
+        if self._spill_needs_reset():
+            self.reset_spill()
+        if self.kvindex != self.kvend:
+            self.kvend = (self.kvindex + NMETA) % self.capacity
+            self.bufend = self.bufmark
+            self._close_spill(self.num_records, synchronous=True)
+
+    def result(self):
+        """
+        Returns a MapOutputBufferResult of what has been collected and spilled.
+        """
+        shape = (len(self.spills), self.partitions)
+        spill_partition_records = np.array(self.spill_partition_records, dtype=np.int64).reshape(shape)
+        spill_record_bytes = np.array(self.spill_partition_bytes, dtype=np.int64).reshape(shape)
+        partition_bytes = spill_record_bytes.sum(axis=0) + IFILE_SEGMENT_OVERHEAD
+
+        return MapOutputBufferResult(self.num_records,
+                                     self.map_output_bytes,
+                                     len(self.spills),
+                                     list(self.spills),
+                                     spill_partition_records,
+                                     spill_record_bytes + IFILE_SEGMENT_OVERHEAD,
+                                     partition_bytes,
+                                     int(partition_bytes.sum()),
+                                     self.clock() - self.blocked_seconds,
+                                     self.blocked_seconds)
+
+
+def simulate_map_output_buffer(batches, num_partitions, io_sort_mb=100, spill_percent=0.8,
+                               collect_bytes_per_second=None, spill_bytes_per_second=None, vectorized=True):
+    """
+    Runs a map task's output, an iterable of (key lengths, value lengths, partitions)
+    batches, through a MapOutputBuffer and returns a MapOutputBufferResult. Spills are
+    instantaneous unless spill_bytes_per_second is given, and collecting records
+    takes no time unless collect_bytes_per_second (of serialized keys and values) is.
+    """
+    buffer = MapOutputBuffer(num_partitions, io_sort_mb, spill_percent, collect_bytes_per_second, spill_bytes_per_second)
+    for key_lengths, value_lengths, partitions in batches:
+        buffer.collect_batch(key_lengths, value_lengths, partitions, vectorized)
+    buffer.flush()
+
+    return buffer.result()
+
+
+def constant_record_batches(num_records, key_length, value_length, num_partitions=1, batch_size=BATCH_SIZE):
+    """
+    Batches of num_records records of the same size, assigned to partitions in turn,
+    like the words of the inputs that the tests generate.
+    """
+    for start in range(0, num_records, batch_size):
+        end = min(start + batch_size, num_records)
+        yield (np.full(end - start, key_length, dtype=np.int64),
+               np.full(end - start, value_length, dtype=np.int64),
+               np.arange(start, end, dtype=np.int64) % num_partitions)
+
+
+def num_spills(num_records, key_length, value_length, io_sort_mb, spill_percent, num_partitions=1):
+    """
+    Number of spill files written by a map task that outputs num_records records of the same size.
+    """
+    return simulate_map_output_buffer(constant_record_batches(num_records, key_length, value_length, num_partitions),
+                                      num_partitions, io_sort_mb, spill_percent).num_spills
+
+
+def num_records_for_spills(desired_num_spills, key_length, value_length, io_sort_mb, spill_percent):
+    """
+    Returns the range (start, stop) of the numbers of records of the same size that
+    make a map task write desired_num_spills spill files.
+    """
+    def first_with_more_spills(target):
+        # smallest number of records that results in more than target spills
+        low, high = 0, 1
+        while num_spills(high, key_length, value_length, io_sort_mb, spill_percent) <= target:
+            low, high = high, high * 2
+        while high - low > 1:
+            middle = (low + high) // 2
+            if num_spills(middle, key_length, value_length, io_sort_mb, spill_percent) <= target:
+                low = middle
+            else:
+                high = middle
+        return high
+
+    return first_with_more_spills(desired_num_spills - 1), first_with_more_spills(desired_num_spills)
+
+
+def print_spills(result):
+    """
+    Prints the spill files of a MapOutputBufferResult and the records of each partition.
+    """
+    print("{} records, {} map output bytes, {} materialized bytes, {} spills".format(
+        result.num_records, result.map_output_bytes, result.materialized_bytes, result.num_spills))
+    print("{:>6} {:>12} {:>10} {:>12} {:>10} {:>10}  {}".format(
+        "spill", "first record", "records", "bytes", "start", "end", "records per partition"))
+    for spill, partition_records in zip(result.spills, result.spill_partition_records):
+        print("{:6} {:12} {:10} {:12} {:10.3f} {:10.3f}  {}".format(
+            spill.spill, spill.first_record, spill.num_records, spill.bytes, spill.start_time, spill.end_time,
+            " ".join(str(records) for records in partition_records)))
+
+
+def verify():
+    """
+    Checks that the vectorized simulation gives the same spills as the record by
+    record port of collect(), and that it reproduces the spill counts and
+    materialized bytes that map_output_materialized_bytes/run_test.py measured.
+    """
+    # num_reducers, num_chars_per_word, num_words, materialized bytes, spills
+    measured = [(1, 1, 10000, 80006, 1), (1, 1, 50000, 400006, 3), (1, 128, 10000, 1370006, 3), (1, 128, 50000, 6850006, 15),
+                (2, 1, 10000, 80012, 1), (2, 1, 50000, 400012, 3), (2, 128, 10000, 1370012, 3), (2, 128, 50000, 6850012, 15)]
+    for num_reducers, num_chars, num_words, materialized_bytes, expected_num_spills in measured:
+        key_length = zero_compress.size_of_zero_compressed_int64(num_chars) + num_chars
+        result = simulate_map_output_buffer(constant_record_batches(num_words, key_length, 4, num_reducers),
+                                            num_reducers, io_sort_mb=1, spill_percent=0.5)
+        assert (result.num_spills, result.materialized_bytes) == (expected_num_spills, materialized_bytes), \
+            (num_reducers, num_chars, num_words, result.num_spills, result.materialized_bytes)
+
+    random_state = np.random.RandomState(0)
+    configurations = [
+        # io_sort_mb, spill_percent, max key length, max value length, collect and spill bytes per second
+        (1, 0.5, 40, 40, None, None),
+        (1, 0.8, 3000, 10, None, None),
+        (1, 1.0, 200, 2000, None, None),
+        (1, 0.05, 20, 20, None, None),
+        (1, 0.8, 20, 1 << 20, None, None),        # records that don't fit in the buffer
+        (1, 0.8, 100, 100, 1e6, 4e5),             # spills slower than collection, writes block
+        (1, 0.5, 100, 500, 1e6, 5e6),
+        (2, 0.7, 1000, 50, None, 1e6),            # no collection time, every spill blocks
+    ]
+    for io_sort_mb, spill_percent, max_key_length, max_value_length, collect_rate, spill_rate in configurations:
+        num_records = 20000
+        key_lengths = random_state.randint(0, max_key_length + 1, num_records)
+        value_lengths = random_state.randint(0, max_value_length + 1, num_records)
+        if max_value_length > (1 << 19):
+            value_lengths = np.where(random_state.rand(num_records) < 0.001, value_lengths, value_lengths % 50)
+        partitions = random_state.randint(0, 5, num_records)
+        batches = [(key_lengths[start:start + 7000], value_lengths[start:start + 7000], partitions[start:start + 7000])
+                   for start in range(0, num_records, 7000)]
+
+        results = [simulate_map_output_buffer(batches, 5, io_sort_mb, spill_percent, collect_rate, spill_rate, vectorized)
+                   for vectorized in [False, True]]
+        for result in results:
+            assert result.num_records == num_records
+            assert result.spill_partition_records.sum() == num_records
+            assert result.partition_bytes.sum() == result.materialized_bytes
+            assert result.materialized_bytes == (zero_compress.zero_compressed_sizes(key_lengths).sum() +
+                                                 zero_compress.zero_compressed_sizes(value_lengths).sum() +
+                                                 key_lengths.sum() + value_lengths.sum() + 5 * IFILE_SEGMENT_OVERHEAD)
+
+        scalar, vectorized = results
+        assert scalar.spills == vectorized.spills, (io_sort_mb, spill_percent, max_key_length, max_value_length)
+        assert scalar.map_output_bytes == vectorized.map_output_bytes
+        assert np.array_equal(scalar.spill_partition_bytes, vectorized.spill_partition_bytes)
+        assert scalar.blocked_seconds == vectorized.blocked_seconds
+
+    print("verified {} measured results and {} configurations".format(len(measured), len(configurations)))
+
+
+def benchmark(num_records):
+    """
+    Times the simulation of a map task with the default buffer (100 MiB, spilling at
+    80%) that outputs num_records records with random key and value lengths to 10
+    reducers, and compares the number of spills with dividing the bytes in the
+    buffer by the soft limit.
+    """
+    def batches():
+        random_state = np.random.RandomState(0)
+        for start in range(0, num_records, BATCH_SIZE):
+            size = min(BATCH_SIZE, num_records - start)
+            yield (random_state.randint(2, 40, size), random_state.randint(1, 12, size), random_state.randint(0, 10, size))
+
+    start = time.perf_counter()
+    result = simulate_map_output_buffer(batches(), 10)
+    elapsed = time.perf_counter() - start
+
+    buffer_bytes = result.map_output_bytes + METASIZE * result.num_records
+    print("{} records in {:.2f} s ({:.1f} million records/s)".format(num_records, elapsed, num_records / elapsed / 1e6))
+    print("{} spills, {} by dividing {} bytes by the soft limit".format(
+        result.num_spills, math.ceil(buffer_bytes / int((100 << 20) * 0.8)), buffer_bytes))
+
+
+if __name__=="__main__":
+    verify()
+
+    # a small buffer, with spills slower than collection
+    print_spills(simulate_map_output_buffer(constant_record_batches(100000, 20, 4, 3), 3, io_sort_mb=1, spill_percent=0.8,
+                                            collect_bytes_per_second=10 << 20, spill_bytes_per_second=5 << 20))
+
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000000)
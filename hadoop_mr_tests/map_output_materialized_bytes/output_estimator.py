@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+"""
+Estimates "Map output bytes", "Map output materialized bytes" (for each reducer)
+and the number of spill files of a map task whose keys and values don't all have
+the same size, without going through the records one at a time.
+
+The sizes of the keys and of the values are given as histograms: the serialized
+sizes that occur and how many records have each of them. Histograms can be made
+from uniform or Zipf distributions of sizes, from samples of sizes, or from an
+input file of wordcount, in which case the words are also assigned to reducers
+by the HashPartitioner exactly as Hadoop would. How records are assigned to
+reducers is otherwise given as weights, either for all keys or for each key size.
+
+Usage:
+    ./output_estimator.py [<wordcount input file> <number of reducers>]
+"""
+import sys
+import math
+import mmap
+import time
+import functools
+import tempfile
+from collections import namedtuple, Counter
+
+import numpy as np
+
+# these modules will be placed in the same directory as this file by Dockerfile 'COPY'
+import map_output_buffer
+import zero_compress
+
+# sizes (serialized bytes) and the number of records with each size
+Histogram = namedtuple("Histogram", ["sizes", "counts"])
+
+OutputEstimate = namedtuple("OutputEstimate", [
+    "num_records",
+    "map_output_bytes",
+    "partition_materialized_bytes",     # materialized bytes of the partition of each reducer
+    "materialized_bytes",
+    "num_spill_files",
+])
+
+# characters that separate the words of a line in wordcount (the defaults of java.util.StringTokenizer)
+WORD_DELIMITERS = b" \t\n\r\f"
+
+CHUNK_SIZE = 8 << 20
+
+def text_sizes(num_bytes):
+    """
+    Serialized sizes of Text keys of num_bytes bytes (an int or an array): the zero
+    compressed length followed by the bytes.
+    """
+    return zero_compress.zero_compressed_sizes(num_bytes) + num_bytes
+
+
+def _apportion(num_records, weights):
+    """
+    Splits num_records into integer counts proportional to weights that add up to
+    num_records, giving the remainders to the largest fractional parts.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    expected = num_records * weights / weights.sum()
+    counts = np.floor(expected).astype(np.int64)
+    remainder = num_records - int(counts.sum())
+    counts[np.argsort(counts - expected, kind="mergesort")[:remainder]] += 1
+
+    return counts
+
+
+def constant_histogram(num_records, size):
+    """
+    num_records records of the same size.
+    """
+    return Histogram(np.array([size], dtype=np.int64), np.array([num_records], dtype=np.int64))
+
+
+def uniform_histogram(num_records, min_size, max_size):
+    """
+    num_records records with sizes spread evenly from min_size to max_size inclusive.
+    """
+    sizes = np.arange(min_size, max_size + 1, dtype=np.int64)
+    return Histogram(sizes, _apportion(num_records, np.ones(len(sizes))))
+
+
+def zipf_histogram(num_records, min_size, max_size, exponent=1.0):
+    """
+    num_records records with sizes from min_size to max_size inclusive, where the
+    number of records with the k-th smallest size is proportional to 1 / k^exponent.
+    """
+    sizes = np.arange(min_size, max_size + 1, dtype=np.int64)
+    ranks = np.arange(1, len(sizes) + 1, dtype=np.float64)
+    return Histogram(sizes, _apportion(num_records, ranks ** -exponent))
+
+
+def sampled_histogram(samples, num_records=None):
+    """
+    Histogram of an array of sampled sizes, scaled to num_records records if given.
+    """
+    sizes, counts = np.unique(np.asarray(samples, dtype=np.int64), return_counts=True)
+    if num_records is not None:
+        counts = _apportion(num_records, counts)
+
+    return Histogram(sizes, counts.astype(np.int64))
+
+
+@functools.lru_cache(maxsize=4)
+def _powers_of_31(max_exponent):
+    """
+    Returns 31^k and 31^-k modulo 2^32 (31 is odd, so it has an inverse) for k from
+    0 to max_exponent, as uint32 arrays.
+    """
+    inverse = 31
+    for _ in range(5):
+        inverse = (inverse * (2 - 31 * inverse)) & 0xffffffff
+
+    powers = np.cumprod(np.concatenate([[1], np.full(max_exponent, 31)]).astype(np.uint32), dtype=np.uint32)
+    inverse_powers = np.cumprod(np.concatenate([[1], np.full(max_exponent, inverse)]).astype(np.uint32), dtype=np.uint32)
+
+    return powers, inverse_powers
+
+
+def _word_lengths_and_hashes(data):
+    """
+    Returns the length and the Text.hashCode() of each word in data, a uint8 array,
+    as WritableComparator.hashBytes() computes it: 31 * hash + byte for each (signed)
+    byte, starting from 1, with 32 bit overflow.
+    """
+    is_word = np.ones(len(data), dtype=bool)
+    for delimiter in WORD_DELIMITERS:
+        is_word &= data != delimiter
+
+    starts = np.flatnonzero(is_word & ~np.concatenate([[False], is_word[:-1]]))
+    ends = np.flatnonzero(is_word & ~np.concatenate([is_word[1:], [False]])) + 1
+    lengths = ends - starts
+    if len(lengths) == 0:
+        return lengths, lengths.astype(np.uint32)
+
+    # the hash of the bytes from start to end is 31^length + sum of byte * 31^(end - 1 - position),
+    # that is 31^(end - 1) times the difference of two prefix sums of byte * 31^-position
+    powers, inverse_powers = _powers_of_31(CHUNK_SIZE)
+    signed_bytes = data.view(np.int8).astype(np.uint32)
+    prefix_sums = np.concatenate([[0], np.cumsum(signed_bytes * inverse_powers[:len(data)], dtype=np.uint32)]).astype(np.uint32)
+
+    return lengths, powers[lengths] + powers[ends - 1] * (prefix_sums[ends] - prefix_sums[starts])
+
+
+def hash_partitions(hashes, num_reducers):
+    """
+    HashPartitioner: (key.hashCode() & Integer.MAX_VALUE) % numReduceTasks.
+    """
+    return ((np.asarray(hashes, dtype=np.uint32) & np.uint32(0x7fffffff)) % np.uint32(num_reducers)).astype(np.int64)
+
+
+def wordcount_key_histogram(path, num_reducers=1):
+    """
+    Reads a wordcount input file and returns the histogram of the sizes of the Text
+    keys that its map tasks output, one per word, and how many keys of each size
+    the HashPartitioner sends to each reducer (an array of shape (sizes, num_reducers)).
+    The file is read in chunks of CHUNK_SIZE bytes that end at a delimiter.
+    """
+    counts = np.zeros((0, num_reducers), dtype=np.int64)
+
+    with open(path, "rb") as file:
+        if file.seek(0, 2) == 0:
+            return Histogram(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)), counts
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as input_file:
+            data = np.frombuffer(input_file, dtype=np.uint8)
+            start = 0
+            while start < len(data):
+                end = min(start + CHUNK_SIZE, len(data))
+                if end < len(data):
+                    # don't cut a word in two, unless it's longer than a chunk
+                    last_delimiter = max(input_file.rfind(bytes([delimiter]), start, end) for delimiter in WORD_DELIMITERS)
+                    end = last_delimiter + 1 if last_delimiter >= start else end
+
+                lengths, hashes = _word_lengths_and_hashes(data[start:end])
+                chunk_counts = np.bincount(lengths * num_reducers + hash_partitions(hashes, num_reducers)) \
+                    if len(lengths) else np.zeros(0, dtype=np.int64)
+                chunk_counts = np.concatenate([chunk_counts, np.zeros(-len(chunk_counts) % num_reducers, dtype=np.int64)])
+                chunk_counts = chunk_counts.reshape(-1, num_reducers)
+
+                if len(chunk_counts) > len(counts):
+                    counts = np.concatenate([counts, np.zeros((len(chunk_counts) - len(counts), num_reducers), dtype=np.int64)])
+                counts[:len(chunk_counts)] += chunk_counts
+                start = end
+
+            del data
+
+    lengths = np.flatnonzero(counts.sum(axis=1))
+    counts = counts[lengths]
+    return Histogram(text_sizes(lengths), counts.sum(axis=1)), counts
+
+
+def _partition_weights(key_histogram, num_reducers, partition_weights):
+    """
+    Returns the fraction of the keys of each size that goes to each reducer, an array
+    of shape (sizes, num_reducers). partition_weights is None (keys are spread evenly),
+    one weight per reducer, or one row of weights per key size.
+    """
+    if partition_weights is None:
+        partition_weights = np.ones(num_reducers)
+
+    weights = np.asarray(partition_weights, dtype=np.float64)
+    if weights.ndim == 1:
+        weights = np.tile(weights, (len(key_histogram.sizes), 1))
+    if weights.shape != (len(key_histogram.sizes), num_reducers):
+        raise ValueError("expected partition weights of shape ({}, {}), got {}".format(
+            len(key_histogram.sizes), num_reducers, weights.shape))
+
+    totals = weights.sum(axis=1, keepdims=True)
+    return np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+
+def estimate_map_output_bytes(key_histogram, value_histogram):
+    """
+    "Map output bytes": the serialized keys and values of every record.
+    """
+    return int(key_histogram.sizes.dot(key_histogram.counts) + value_histogram.sizes.dot(value_histogram.counts))
+
+
+def estimate_partition_materialized_bytes(key_histogram, value_histogram, num_reducers, partition_weights=None):
+    """
+    Bytes of the partition of each reducer in the map output: the zero compressed
+    key and value lengths, the key and the value of each of its records, and the end
+    of file markers and checksum of the partition. Values are assumed to be independent
+    of keys, so a reducer gets the average value with each of its records. The result
+    is exact when the counts of partition_weights are given, as from wordcount_key_histogram().
+    """
+    weights = _partition_weights(key_histogram, num_reducers, partition_weights)
+    key_record_bytes = zero_compress.zero_compressed_sizes(key_histogram.sizes) + key_histogram.sizes
+    value_record_bytes = zero_compress.zero_compressed_sizes(value_histogram.sizes) + value_histogram.sizes
+
+    num_records = key_histogram.counts.sum()
+    reducer_records = key_histogram.counts.dot(weights)
+    reducer_key_bytes = (key_histogram.counts * key_record_bytes).dot(weights)
+    average_value_bytes = value_record_bytes.dot(value_histogram.counts) / num_records if num_records else 0.0
+
+    partition_bytes = reducer_key_bytes + reducer_records * average_value_bytes
+    return np.rint(partition_bytes).astype(np.int64) + map_output_buffer.IFILE_SEGMENT_OVERHEAD
+
+
+def histogram_record_batches(key_histogram, value_histogram, batch_size=map_output_buffer.BATCH_SIZE):
+    """
+    Batches of (key sizes, value sizes, partitions) with exactly the sizes of the
+    histograms, in a scrambled order: record r gets the size at position
+    (r * stride) % num_records of the sorted sizes, for a stride that is coprime
+    with num_records, so every position is used once.
+    """
+    num_records = int(key_histogram.counts.sum())
+    if int(value_histogram.counts.sum()) != num_records:
+        raise ValueError("the key and value histograms have {} and {} records".format(
+            num_records, int(value_histogram.counts.sum())))
+
+    def stride(multiplier):
+        candidate = max(int(num_records * multiplier), 1)
+        while math.gcd(candidate, num_records) != 1:
+            candidate += 1
+        return candidate
+
+    key_stride, value_stride = stride(0.6180339887), stride(0.7548776662)
+    key_ends, value_ends = np.cumsum(key_histogram.counts), np.cumsum(value_histogram.counts)
+
+    for start in range(0, num_records, batch_size):
+        records = np.arange(start, min(start + batch_size, num_records), dtype=np.int64)
+        yield (key_histogram.sizes[np.searchsorted(key_ends, records * key_stride % num_records, "right")],
+               value_histogram.sizes[np.searchsorted(value_ends, records * value_stride % num_records, "right")],
+               np.zeros(len(records), dtype=np.int64))
+
+
+def estimate_num_spill_files(key_histogram, value_histogram, io_sort_mb, spill_percent):
+    """
+    Number of spill files, from a simulation of the map output buffer (see
+    map_output_buffer.py) with records of the sizes of the histograms. Partitions
+    don't change when spills happen, so all records are put in one.
+    """
+    return map_output_buffer.simulate_map_output_buffer(histogram_record_batches(key_histogram, value_histogram),
+                                                        1, io_sort_mb, spill_percent).num_spills
+
+
+def estimate_output(key_histogram, value_histogram, num_reducers, io_sort_mb, spill_percent, partition_weights=None):
+    """
+    Returns an OutputEstimate of a map task whose key and value sizes are described
+    by the histograms, see the functions above.
+    """
+    partition_bytes = estimate_partition_materialized_bytes(key_histogram, value_histogram, num_reducers, partition_weights)
+
+    return OutputEstimate(int(key_histogram.counts.sum()),
+                          estimate_map_output_bytes(key_histogram, value_histogram),
+                          partition_bytes,
+                          int(partition_bytes.sum()),
+                          estimate_num_spill_files(key_histogram, value_histogram, io_sort_mb, spill_percent))
+
+
+def verify():
+    """
+    Checks the estimates against the results measured by run_test.py, and against
+    computing them record by record for the other histograms and a wordcount input.
+    """
+    INT_WRITABLE_SIZE = 4
+
+    # num_reducers, num_chars_per_word, num_words, map output bytes, materialized bytes, spills
+    measured = [(1, 1, 10000, 60000, 80006, 1), (1, 1, 50000, 300000, 400006, 3),
+                (1, 128, 10000, 1340000, 1370006, 3), (1, 128, 50000, 6700000, 6850006, 15),
+                (2, 1, 10000, 60000, 80012, 1), (2, 1, 50000, 300000, 400012, 3),
+                (2, 128, 10000, 1340000, 1370012, 3), (2, 128, 50000, 6700000, 6850012, 15)]
+    for num_reducers, num_chars, num_words, map_output_bytes, materialized_bytes, num_spill_files in measured:
+        estimate = estimate_output(constant_histogram(num_words, text_sizes(num_chars)),
+                                   constant_histogram(num_words, INT_WRITABLE_SIZE), num_reducers, 1, 0.5)
+        assert (estimate.map_output_bytes, estimate.materialized_bytes, estimate.num_spill_files) == \
+            (map_output_bytes, materialized_bytes, num_spill_files), (num_reducers, num_chars, num_words, estimate)
+
+    # histograms against the records they describe
+    random_state = np.random.RandomState(0)
+    for key_histogram, value_histogram in [(uniform_histogram(100003, 2, 300), zipf_histogram(100003, 1, 5000, 1.2)),
+                                           (zipf_histogram(77777, 2, 20, 0.5), sampled_histogram(random_state.randint(1, 200, 500), 77777))]:
+        assert key_histogram.counts.sum() == value_histogram.counts.sum()
+        key_sizes, value_sizes, _ = [np.concatenate(arrays) for arrays in zip(*histogram_record_batches(key_histogram, value_histogram, 30000))]
+        assert np.array_equal(np.sort(key_sizes), np.repeat(key_histogram.sizes, key_histogram.counts))
+        assert np.array_equal(np.sort(value_sizes), np.repeat(value_histogram.sizes, value_histogram.counts))
+
+        # materialized bytes of a reducer that gets every third record of each key size
+        record_bytes = zero_compress.zero_compressed_sizes(key_sizes) + key_sizes + \
+                       zero_compress.zero_compressed_sizes(value_sizes) + value_sizes
+        assert estimate_map_output_bytes(key_histogram, value_histogram) == key_sizes.sum() + value_sizes.sum()
+        partition_bytes = estimate_partition_materialized_bytes(key_histogram, value_histogram, 3, [1, 1, 1])
+        assert abs(partition_bytes.sum() - (record_bytes.sum() + 3 * map_output_buffer.IFILE_SEGMENT_OVERHEAD)) <= 3
+
+        simulated = map_output_buffer.simulate_map_output_buffer([(key_sizes, value_sizes, np.zeros(len(key_sizes), dtype=np.int64))], 1, 1, 0.8)
+        assert estimate_num_spill_files(key_histogram, value_histogram, 1, 0.8) == simulated.num_spills
+
+    # wordcount input, with words that span chunks, multi-byte characters and long words
+    words = ["a", "b", "rr", "hadoop", "ü" * 3, "x" * 1000, "日本語"] + \
+            ["".join(chr(97 + c) for c in random_state.randint(0, 26, n)) for n in random_state.randint(1, 40, 3000)]
+    text = "\n".join(" ".join(words[i] for i in random_state.randint(0, len(words), 7)) for _ in range(5000)) + "\t\r\n"
+
+    def java_hash(word):
+        hash_code = 1
+        for byte in word.encode():
+            hash_code = (31 * hash_code + (byte - 256 if byte > 127 else byte)) & 0xffffffff
+        return hash_code
+
+    assert java_hash("a") == 128 and java_hash("b") == 129
+
+    global CHUNK_SIZE
+    chunk_size, CHUNK_SIZE = CHUNK_SIZE, 4096
+    try:
+        with tempfile.NamedTemporaryFile() as input_file:
+            input_file.write(text.encode())
+            input_file.flush()
+            histogram, partition_counts = wordcount_key_histogram(input_file.name, 3)
+    finally:
+        CHUNK_SIZE = chunk_size
+
+    expected = Counter((int(text_sizes(len(word.encode()))), java_hash(word) % (1 << 31) % 3) for word in text.split())
+    assert {(int(size), partition): int(count) for size, row in zip(histogram.sizes, partition_counts)
+            for partition, count in enumerate(row) if count} == dict(expected)
+
+    value_histogram = constant_histogram(int(histogram.counts.sum()), INT_WRITABLE_SIZE)
+    partition_bytes = estimate_partition_materialized_bytes(histogram, value_histogram, 3, partition_counts)
+    for partition in range(3):
+        assert partition_bytes[partition] == sum(count * (int(text_sizes(size)) + 1 + INT_WRITABLE_SIZE) for (size, p), count in expected.items()
+                                                 if p == partition) + map_output_buffer.IFILE_SEGMENT_OVERHEAD
+
+    print("verified {} measured results, histograms and a wordcount input of {} words".format(len(measured), len(text.split())))
+
+
+def benchmark(num_records):
+    """
+    Times reading a 64 MiB wordcount input, and estimating the output of a map task
+    with num_records records whose key sizes follow a Zipf distribution.
+    """
+    random_state = np.random.RandomState(0)
+    words = [b"x" * n for n in range(1, 30)]
+    with tempfile.NamedTemporaryFile() as input_file:
+        while input_file.tell() < 64 << 20:
+            input_file.write(b" ".join(words[i] for i in random_state.randint(0, len(words), 100000)) + b"\n")
+        input_file.flush()
+
+        start = time.perf_counter()
+        histogram, _ = wordcount_key_histogram(input_file.name, 10)
+        elapsed = time.perf_counter() - start
+        print("read {} words of a 64 MiB wordcount input in {:.2f} s ({:.0f} MiB/s)".format(
+            int(histogram.counts.sum()), elapsed, 64 / elapsed))
+
+    start = time.perf_counter()
+    estimate = estimate_output(zipf_histogram(num_records, 2, 64), constant_histogram(num_records, 4), 10, 100, 0.8)
+    print("estimated {} in {:.2f} s".format(estimate, time.perf_counter() - start))
+
+
+if __name__=="__main__":
+    if len(sys.argv) > 2:
+        num_reducers = int(sys.argv[2])
+        histogram, partition_counts = wordcount_key_histogram(sys.argv[1], num_reducers)
+        print(estimate_output(histogram, constant_histogram(int(histogram.counts.sum()), 4), num_reducers, 100, 0.8, partition_counts))
+    else:
+        verify()
+        benchmark(10000000)
@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 import subprocess
-import time
-import math
+import itertools
 from collections import namedtuple
 
 # this module will be placed in the same directory as this file by Dockerfile 'COPY'
 import util
 import zero_compress
+import map_output_buffer
+import job_history
 
 """
 Test to determine the number number of spill files and map output materialized bytes
@@ -35,7 +36,8 @@ sum of all the values in the second row of the table below.
 +--------------------+----------------------------------------------------+------------------------------------------------------+------------------------------------------------------------------------------------------------------------------------+
 
 When (key, value) pairs are written to a spill file from the map output buffer, only [KEY_LEN, VALUE_LEN, KEY_VALUE]
-is written. At this point, KEY_VALUE_METADATA is not needed.
+is written. At this point, KEY_VALUE_METADATA is not needed. ifile.py reads spill files and map outputs
+in this layout and reports the number of records and bytes of each partition.
 
 Binary of spill file generated from a MapTask running wordcount on an input file with the
 the following contents: rr\nrr\nrr\nrr\nrr\nrr\nrr\nrr\nrr\nrr\n
@@ -84,20 +86,16 @@ Result(num_reducers=2, num_chars_per_word=128, num_words=10000, map_output_bytes
 Result(num_reducers=2, num_chars_per_word=128, num_words=50000, map_output_bytes=6700000, expected_map_output_bytes=6700000, materialized_bytes=6850012, expected_materialized_bytes=6850012, num_spill_files=15, expected_num_spill_files=15)
 """
 
-# TODO: make a function that can estimate output based on some distribution of keys/key lengths
+# the functions below assume that every key has the same length, see output_estimator.py
+# for keys and values whose sizes follow a distribution, or are those of any wordcount input
 
 def estimate_num_spill_files(num_words, key_num_bytes, value_num_bytes, mapreduce_task_io_sort_mb, mapreduce_map_sort_spill_percent):
     """
-    Computes the number of spill files that will be created by a single mapper.
+    Computes the number of spill files that will be created by a single mapper by
+    simulating its map output buffer, see map_output_buffer.py.
     """
-    # extra bytes added when each (k,v) pair is added to output buffer
-    KEY_VALUE_META_DATA_NUM_BYTES = 16
-
-    key_len_num_bytes = zero_compress.size_of_zero_compressed_int64(key_num_bytes)
-    value_len_num_bytes = zero_compress.size_of_zero_compressed_int64(value_num_bytes)
-
-    return math.ceil((num_words * (KEY_VALUE_META_DATA_NUM_BYTES + key_len_num_bytes + key_num_bytes + value_len_num_bytes + value_num_bytes)) /
-                    (util.MiB_to_bytes(mapreduce_task_io_sort_mb) * mapreduce_map_sort_spill_percent))
+    return map_output_buffer.num_spills(num_words, key_num_bytes, value_num_bytes,
+                                        mapreduce_task_io_sort_mb, mapreduce_map_sort_spill_percent)
 
 def estimate_map_output_bytes(num_words, key_num_bytes, value_num_bytes):
     """
@@ -135,6 +133,14 @@ if __name__=="__main__":
     NUM_WORDS_LIST = [10000, 50000]
     NUM_ASCII_CHARACTERS_PER_WORD = [1, 128]
 
+    TestCase = namedtuple("TestCase", ["num_reducers", "num_chars_per_word", "num_words"])
+
+    # by default, run every combination of the values above; parallel_runner.py can
+    # instead pass a subset of the cases to each container as a command line argument
+    test_cases = util.get_test_cases(TestCase, [TestCase(*test_case) for test_case in itertools.product(MAPREDUCE_JOB_REDUCES,
+                                                                                                         NUM_ASCII_CHARACTERS_PER_WORD,
+                                                                                                         NUM_WORDS_LIST)])
+
     Result = namedtuple("Result", ["num_reducers",
                                     "num_chars_per_word",
                                     "num_words",
@@ -145,63 +151,64 @@ if __name__=="__main__":
                                     "num_spill_files",
                                     "expected_num_spill_files"])
     results = list()
-
-    for num_reducers in MAPREDUCE_JOB_REDUCES:
-        for num_chars in NUM_ASCII_CHARACTERS_PER_WORD:
-            for num_words in NUM_WORDS_LIST:
-                util.hadoop_start_up()
-                util.hdfs_generate_custom_word_files([[chr(97 + (i % len(MAPREDUCE_JOB_REDUCES))) * num_chars for i in range(1, num_words + 1)]])
-
-                # things to record
-                num_spill_files = 0
-                estimated_num_spill_files = estimate_num_spill_files(num_words,
+    counters_by_job_id = dict()
+
+    # the environment is started once and only reset between test cases
+    with util.HadoopSession() as session:
+        for num_reducers, num_chars, num_words in test_cases:
+            session.reset()
+            util.hdfs_generate_custom_word_files([(chr(97 + (i % len(MAPREDUCE_JOB_REDUCES))) * num_chars for i in range(1, num_words + 1))])
+
+            # things to record
+            num_spill_files = 0
+            estimated_num_spill_files = estimate_num_spill_files(num_words,
+                                                                key_num_bytes(num_chars),
+                                                                VALUE_NUM_BYTES,
+                                                                MAPREDUCE_TASK_IO_SORT_MB,
+                                                                MAPREDUCE_MAP_SORT_SPILL_PERCENT)
+            estimated_map_output_bytes = estimate_map_output_bytes(num_words,
                                                                     key_num_bytes(num_chars),
-                                                                    VALUE_NUM_BYTES,
-                                                                    MAPREDUCE_TASK_IO_SORT_MB,
-                                                                    MAPREDUCE_MAP_SORT_SPILL_PERCENT)
-                map_output_bytes = 0
-                estimated_map_output_bytes = estimate_map_output_bytes(num_words,
-                                                                        key_num_bytes(num_chars),
-                                                                        VALUE_NUM_BYTES)
-                map_output_materialized_bytes = 0
-                estimated_map_output_materialized_bytes = estimate_map_output_materialized_bytes(num_words,
-                                                                                                    num_reducers,
-                                                                                                    key_num_bytes(num_chars),
-                                                                                                    VALUE_NUM_BYTES)
-
-                # use "-D property=value" to set mapreduce configuration properties from the command line
-                run_wordcount = util.execute_command("/usr/local/hadoop/bin/hadoop jar /usr/local/hadoop/share/hadoop/mapreduce/hadoop-mapreduce-examples-3.3.0-SNAPSHOT.jar wordcount -D mapreduce.job.reduces={} input output".format(num_reducers),
-                                                        stderr=subprocess.STDOUT)
-
-                for line in run_wordcount.decode().split('\n'):
-                    if "Map output bytes=" in line:
-                        map_output_bytes = int(line.split('=')[1])
-
-                    if "Map output materialized bytes=" in line:
-                        materialized_bytes = int(line.split('=')[1])
-
-                # for some reason, without this sleep, I get an error from yarn saying
-                # that it can't find the logs for the application id ..
-                time.sleep(5)
-
-                # write logs to file
-                LOG_FILE_PATH = util.yarn_write_logs_to_file(util.yarn_get_application_id())
-
-                with open(LOG_FILE_PATH, 'r') as file:
-                    for line in file:
-                        if "Finished spill" in line:
-                            num_spill_files += 1
-
-                util.hadoop_tear_down()
-
-                results.append(Result(num_reducers,
-                                        num_chars,
-                                        num_words,
-                                        map_output_bytes,
-                                        estimated_map_output_bytes,
-                                        materialized_bytes,
-                                        estimated_map_output_materialized_bytes,
-                                        num_spill_files,
-                                        estimated_num_spill_files))
+                                                                    VALUE_NUM_BYTES)
+            estimated_map_output_materialized_bytes = estimate_map_output_materialized_bytes(num_words,
+                                                                                                num_reducers,
+                                                                                                key_num_bytes(num_chars),
+                                                                                                VALUE_NUM_BYTES)
+
+            # use "-D property=value" to set mapreduce configuration properties from the command line
+            util.execute_command("/usr/local/hadoop/bin/hadoop jar /usr/local/hadoop/share/hadoop/mapreduce/hadoop-mapreduce-examples-3.3.0-SNAPSHOT.jar wordcount -D mapreduce.job.reduces={} input output".format(num_reducers),
+                                 stderr=subprocess.STDOUT)
+
+            # read every counter of the job from its job history file
+            application_id = util.yarn_get_latest_application_id()
+            if application_id is None:
+                util.print_red("no application was submitted to YARN, skipping this test case")
+                continue
+            job_id = job_history.job_id_from_application_id(application_id)
+            counters_by_job_id[job_id] = job_history.get_job_counters(job_id)
+            map_output_bytes = counters_by_job_id[job_id]["MAP_OUTPUT_BYTES"].total
+            materialized_bytes = counters_by_job_id[job_id]["MAP_OUTPUT_MATERIALIZED_BYTES"].total
+
+            # wait until yarn has aggregated the logs of the job, then write them to file
+            util.yarn_wait_for_logs(application_id)
+            LOG_FILE_PATH = util.yarn_write_logs_to_file(application_id)
+
+            with open(LOG_FILE_PATH, 'r') as file:
+                for line in file:
+                    if "Finished spill" in line:
+                        num_spill_files += 1
+
+            results.append(Result(num_reducers,
+                                    num_chars,
+                                    num_words,
+                                    map_output_bytes,
+                                    estimated_map_output_bytes,
+                                    materialized_bytes,
+                                    estimated_map_output_materialized_bytes,
+                                    num_spill_files,
+                                    estimated_num_spill_files))
+            util.print_result(results[-1])
 
     print(*results, sep='\n')
+
+    # the counters of every job, one row per job, see job_history.py
+    job_history.save_counters_table(job_history.counters_table(counters_by_job_id), "counters.npz")
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+"""
+Extracts the spill, shuffle and merge events that MapTask, Merger, Fetcher,
+MergeManagerImpl, InMemoryMapOutput and OnDiskMapOutput log during a job into a
+NumPy structured array (one row per event, one column per field), so that the
+logs of many jobs can be analyzed together instead of reading colour printed lines.
+For example, the line
+
+2019-06-16 23:15:21,554 INFO [main] org.apache.hadoop.mapred.Merger: passNo: 2 numSegments: 3 factor: 3
+
+becomes a "merge_pass" event with pass_no=2, num_segments=3 and factor=3. Fields
+that an event doesn't have are set to -1 (or "" for strings). The events are
+matched against the messages in the Hadoop source, see EVENTS below.
+
+Tables can be saved to (and loaded from) .npz files, or .parquet files if pyarrow
+is installed.
+
+Usage:
+    ./merge_events.py <output of "yarn logs"> [<table.npz or table.parquet>]
+"""
+import re
+import sys
+import mmap
+from collections import namedtuple
+
+import numpy as np
+
+# this module will be placed in the same directory as this file by Dockerfile "COPY"
+import log4j_parser
+
+EVENT_DTYPE = np.dtype([
+    ("timestamp", "i8"),            # milliseconds since the epoch
+    ("application_id", "U40"),
+    ("container", "U48"),
+    ("event", "U32"),               # name of the event, see EVENTS
+    ("map_id", "U48"),              # attempt id of the map whose output is shuffled
+    ("fetcher", "i8"),
+    ("spill", "i8"),
+    ("pass_no", "i8"),
+    ("factor", "i8"),
+    ("num_segments", "i8"),         # segments (or in-memory map outputs) being merged
+    ("total_segments", "i8"),
+    ("num_disk_segments", "i8"),    # on-disk map outputs being merged
+    ("bytes", "i8"),
+    ("compressed_bytes", "i8"),
+    ("commit_memory", "i8"),
+    ("used_memory", "i8"),
+    ("limit", "i8"),                # maxSingleShuffleLimit or mergeThreshold
+    ("to_disk", "i1"),              # 1 if a map output is shuffled to disk, 0 if to memory
+])
+
+# logger class, event name, message pattern, column of each group of the pattern
+Event = namedtuple("Event", ["logger", "name", "pattern", "columns"])
+
+EVENTS = [
+    # MapTask.java
+    Event("MapTask", "spill", r"Finished spill (\d+)", ["spill"]),
+
+    # Merger.java
+    Event("Merger", "merge", r"Merging (\d+) sorted segments", ["num_segments"]),
+    Event("Merger", "merge_pass", r"passNo: (\d+) numSegments: (\d+) factor: (\d+)", ["pass_no", "num_segments", "factor"]),
+    Event("Merger", "intermediate_merge", r"Merging (\d+) intermediate segments out of a total of (\d+)", ["num_segments", "total_segments"]),
+    Event("Merger", "last_merge_pass", r"Down to the last merge-pass, with (\d+) segments left of total size: (-?\d+) bytes", ["num_segments", "bytes"]),
+
+    # Fetcher.java, InMemoryMapOutput.java and OnDiskMapOutput.java
+    Event("Fetcher", "fetch", r"fetcher#(\d+) about to shuffle output of map (\S+) decomp: (\d+) len: (\d+) to (MEMORY|DISK)",
+          ["fetcher", "map_id", "bytes", "compressed_bytes", "to_disk"]),
+    Event("InMemoryMapOutput", "read_to_memory", r"Read (\d+) bytes from map-output for (\S+)", ["bytes", "map_id"]),
+    Event("OnDiskMapOutput", "read_to_disk", r"Read (\d+) bytes from map-output for (\S+)", ["bytes", "map_id"]),
+
+    # MergeManagerImpl.java
+    Event("MergeManagerImpl", "shuffle_to_disk", r"(\S+): Shuffling to disk since (\d+) is greater than maxSingleShuffleLimit \((\d+)\)",
+          ["map_id", "bytes", "limit"]),
+    Event("MergeManagerImpl", "close_in_memory_file",
+          r"closeInMemoryFile -> map-output of size: (\d+), inMemoryMapOutputs.size\(\) -> (\d+), commitMemory -> (\d+), usedMemory ->(\d+)",
+          ["bytes", "num_segments", "commit_memory", "used_memory"]),
+    Event("MergeManagerImpl", "in_memory_merge_triggered",
+          r"Starting inMemoryMerger's merge since commitMemory=(\d+) > mergeThreshold=(\d+)\. Current usedMemory=(\d+)",
+          ["commit_memory", "limit", "used_memory"]),
+    Event("MergeManagerImpl", "in_memory_merge", r"Initiating in-memory merge with (\d+) segments", ["num_segments"]),
+    Event("MergeManagerImpl", "in_memory_merge_complete", r"Merge of the (\d+) files in-memory complete\. Local file is \S+ of size (\d+)",
+          ["num_segments", "bytes"]),
+    Event("MergeManagerImpl", "memory_to_memory_merge", r"Initiating Memory-to-Memory merge with (\d+) segments of total-size: (\d+)",
+          ["num_segments", "bytes"]),
+    Event("MergeManagerImpl", "on_disk_merge", r"OnDiskMerger: We have\s+(\d+) map outputs on disk", ["num_disk_segments"]),
+    Event("MergeManagerImpl", "on_disk_merge_complete",
+          r"Finished merging (\d+) map output files on disk of total-size \d+\. Local output file is \S+ of size (\d+)",
+          ["num_disk_segments", "bytes"]),
+    Event("MergeManagerImpl", "final_merge", r"finalMerge called with (\d+) in-memory map-outputs and (\d+) on-disk map-outputs",
+          ["num_segments", "num_disk_segments"]),
+    Event("MergeManagerImpl", "final_merge_memory_to_disk", r"Merged (\d+) segments, (\d+) bytes to disk to satisfy reduce memory limit",
+          ["num_segments", "bytes"]),
+    Event("MergeManagerImpl", "final_merge_keep_in_memory", r"Keeping (\d+) segments, (\d+) bytes in memory for intermediate, on-disk merge",
+          ["num_segments", "bytes"]),
+    Event("MergeManagerImpl", "final_merge_from_disk", r"Merging (\d+) files, (\d+) bytes from disk", ["num_disk_segments", "bytes"]),
+    Event("MergeManagerImpl", "final_merge_from_memory", r"Merging (\d+) segments, (\d+) bytes from memory into reduce",
+          ["num_segments", "bytes"]),
+]
+
+# every logger above is in org.apache.hadoop.mapred or org.apache.hadoop.mapreduce.task.reduce
+LOGGER_PREFIX = "org.apache.hadoop.mapred"
+
+# converts the text of a group of a pattern to the value of its column
+CONVERTERS = {
+    "map_id": str,
+    "to_disk": lambda destination: int(destination == "DISK"),
+}
+
+# logger class -> [(compiled pattern, event name, column indices, converters)]
+EVENTS_BY_LOGGER = {}
+for event in EVENTS:
+    EVENTS_BY_LOGGER.setdefault(event.logger, []).append(
+        (re.compile(event.pattern), event.name,
+         [EVENT_DTYPE.names.index(column) for column in event.columns],
+         [CONVERTERS.get(column, int) for column in event.columns]))
+
+# a row where every field is missing, see parse_event()
+EMPTY_ROW = tuple("" if EVENT_DTYPE[name].kind == "U" else -1 for name in EVENT_DTYPE.names)
+
+def container_application_id(container):
+    """
+    Returns the id of the application a container belongs to, e.g.
+    "application_1562894051760_0001" for "container_1562894051760_0001_01_000002"
+    (or "container_e17_1562894051760_0001_01_000002"), or "" if container isn't a container id.
+    """
+    parts = container.split("_")
+    if len(parts) > 1 and parts[1].startswith("e"):
+        del parts[1]
+
+    if len(parts) < 3 or parts[0] != "container":
+        return ""
+
+    return "application_{}_{}".format(parts[1], parts[2])
+
+
+def parse_event(record, application_id="", container=""):
+    """
+    Returns the row of EVENT_DTYPE (a tuple) of the event logged in a Log4jRecord
+    (see log4j_parser), or None if the record isn't one of EVENTS.
+    """
+    events = EVENTS_BY_LOGGER.get(record.logger.rsplit(".", 1)[-1])
+    if events is None:
+        return None
+
+    for pattern, name, column_indices, converters in events:
+        match = pattern.search(record.line)
+        if match is None:
+            continue
+
+        row = list(EMPTY_ROW)
+        row[0:4] = record.timestamp, application_id, container, name
+        for index, convert, value in zip(column_indices, converters, match.groups()):
+            row[index] = convert(value)
+
+        return tuple(row)
+
+    return None
+
+
+def events_from_records(records, application_id="", container=""):
+    """
+    Returns the structured array (of EVENT_DTYPE) of the events logged in records,
+    an iterable of Log4jRecords, in the order they appear in records.
+    """
+    rows = [row for row in (parse_event(record, application_id, container) for record in records) if row is not None]
+    return np.array(rows, dtype=EVENT_DTYPE)
+
+
+def read_yarn_log_events(path):
+    """
+    Returns the structured array (of EVENT_DTYPE) of the events in the output of
+    "yarn logs" at path, sorted by timestamp. The container and application of
+    each event are taken from the header of the log file it was logged in.
+    """
+    tables = []
+
+    with open(path, 'rb') as file:
+        if file.seek(0, 2) != 0:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log_file:
+                for start, end in log4j_parser.index_yarn_log_sections(log_file):
+                    container = log4j_parser.yarn_log_section_container(log_file, start)
+                    records = log4j_parser.iter_records(log4j_parser.iter_section_lines(log_file, start, end), LOGGER_PREFIX)
+                    tables.append(events_from_records(records, container_application_id(container), container))
+
+    events = np.concatenate(tables) if tables else np.array([], dtype=EVENT_DTYPE)
+    return events[np.argsort(events["timestamp"], kind="mergesort")]
+
+
+def save_events(events, path):
+    """
+    Saves a table of events to path, as Parquet if path ends with ".parquet"
+    (which requires pyarrow) or as a compressed .npz file otherwise.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow
+        import pyarrow.parquet
+
+        table = pyarrow.Table.from_arrays([pyarrow.array(events[name].tolist()) for name in EVENT_DTYPE.names],
+                                          names=list(EVENT_DTYPE.names))
+        pyarrow.parquet.write_table(table, path)
+    else:
+        np.savez_compressed(path, events=events)
+
+
+def load_events(path):
+    """
+    Loads a table of events saved by save_events().
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet
+
+        columns = pyarrow.parquet.read_table(path).to_pydict()
+        return np.array(list(zip(*[columns[name] for name in EVENT_DTYPE.names])), dtype=EVENT_DTYPE)
+
+    with np.load(path) as table:
+        return table["events"]
+
+
+def print_summary(events):
+    """
+    Prints the number of occurrences of each event and the total of their bytes.
+    """
+    names, inverse, counts = np.unique(events["event"], return_inverse=True, return_counts=True)
+    total_bytes = np.bincount(inverse, weights=np.maximum(events["bytes"], 0), minlength=len(names))
+
+    print("{:30} {:>8} {:>16}".format("event", "count", "bytes"))
+    for name, count, num_bytes in zip(names, counts, total_bytes):
+        print("{:30} {:8} {:16}".format(name, count, int(num_bytes)))
+
+
+if __name__=="__main__":
+    if len(sys.argv) < 2:
+        print("usage: {} <output of \"yarn logs\"> [<table.npz or table.parquet>]".format(sys.argv[0]))
+        sys.exit(1)
+
+    events = read_yarn_log_events(sys.argv[1])
+    print_summary(events)
+
+    if len(sys.argv) > 2:
+        save_events(events, sys.argv[2])
@@ -1,40 +1,64 @@
 #!/usr/bin/env python3
 import subprocess
+import re
 from collections import namedtuple
 
-# this module will be placed in the same directory as this file by Dockerfile 'COPY'
+# these modules will be placed in the same directory as this file by Dockerfile 'COPY'
 import util
+import split_planner
 
 """
 Tests the number of map tasks launched by YARN based on number of input files, input file size,
 and HDFS block size. When a test case runs, the number of map tasks launched can be viewed under
 "run mapreduce wordcount" in the section titled "Job Counters". Note that tests are slow.
+The number of map tasks predicted by split_planner.py from a listing of the input is printed
+before each job, so that the planner can be checked against the launched map tasks.
+Test cases with many files (e.g. TestCase(10000, 0.001, "many small files")) are generated
+locally and uploaded with a single command by util.hdfs_generate_small_files().
 """
 if __name__=="__main__":
     TestCase = namedtuple("TestCase", ["num_files", "file_size_in_MiB", "description"])
 
-    test_cases = [
+    # parallel_runner.py can pass other test cases as a command line argument
+    test_cases = util.get_test_cases(TestCase, [
         TestCase(1, 1, "single file smaller than block size"),          # Launched map tasks=1
         TestCase(1, 20, "single file larger than block size"),          # Launched map tasks=2
         TestCase(2, 1, "two small files that fit into a single block"), # Launched map tasks=2
         TestCase(2, 20, "two files each larger than a block")           # Launched map tasks=4
-    ]
+    ])
 
-    for test_case in test_cases:
-        util.print_purple("*" * len(str(test_case)))
-        util.print_purple(test_case)
-        util.print_purple("*" * len(str(test_case)))
+    # above this number of files, the input is written locally and uploaded at once
+    MAX_FILES_UPLOADED_ONE_BY_ONE = 100
 
-        util.hadoop_start_up()
+    Result = namedtuple("Result", ["num_files", "file_size_in_MiB", "predicted_map_tasks", "launched_map_tasks"])
 
-        util.hdfs_generate_word_files(test_case.num_files, test_case.file_size_in_MiB)
+    # the environment is started once and only reset between test cases
+    with util.HadoopSession() as session:
+        for test_case in test_cases:
+            util.print_purple("*" * len(str(test_case)))
+            util.print_purple(test_case)
+            util.print_purple("*" * len(str(test_case)))
 
-        util.hadoop_print_configuration_property_values("dfs.block.size")
+            session.reset()
 
-        # run map reduce wordcount on input
-        util.print_blue("run mapreduce wordcount")
-        run_wordcount = subprocess.check_output(["su", "hadoop", "-c", "/usr/local/hadoop/bin/hadoop jar /usr/local/hadoop/share/hadoop/mapreduce/hadoop-mapreduce-examples-3.3.0-SNAPSHOT.jar wordcount input output"],
-                                                stderr=subprocess.STDOUT)
-        print(run_wordcount.decode())
+            if test_case.num_files > MAX_FILES_UPLOADED_ONE_BY_ONE:
+                util.hdfs_generate_small_files(test_case.num_files, int(util.MiB_to_bytes(test_case.file_size_in_MiB)))
+            else:
+                util.hdfs_generate_word_files(test_case.num_files, test_case.file_size_in_MiB, num_concurrent_uploads=test_case.num_files)
 
-        util.hadoop_tear_down()
+            util.hadoop_print_configuration_property_values("dfs.block.size")
+
+            # predict the number of map tasks from the sizes of the input files
+            util.print_blue("plan input splits")
+            listing = util.execute_command(util.HDFS + " dfs -ls -R /user/hadoop/input", stderr=subprocess.DEVNULL)
+            plan = split_planner.plan_hdfs_listing(listing.decode().splitlines(), "/user/hadoop/input")
+            split_planner.print_plan(plan)
+
+            # run map reduce wordcount on input
+            util.print_blue("run mapreduce wordcount")
+            run_wordcount = subprocess.check_output(["su", "hadoop", "-c", "/usr/local/hadoop/bin/hadoop jar /usr/local/hadoop/share/hadoop/mapreduce/hadoop-mapreduce-examples-3.3.0-SNAPSHOT.jar wordcount input output"],
+                                                    stderr=subprocess.STDOUT)
+            print(run_wordcount.decode())
+
+            launched_map_tasks = int(re.search(r'Launched map tasks=([0-9]+)', run_wordcount.decode()).group(1))
+            util.print_result(Result(test_case.num_files, test_case.file_size_in_MiB, plan.num_splits, launched_map_tasks))
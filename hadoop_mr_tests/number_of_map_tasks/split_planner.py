@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""
+Computes the input splits, and so the number of map tasks, that a job such as
+wordcount gets from its input files without running it. This reproduces
+getSplits() and listStatus() in
+hadoop-mapreduce-project/hadoop-mapreduce-client/hadoop-mapreduce-client-core/src/main/java/org/apache/hadoop/mapreduce/lib/input/FileInputFormat.java
+and isSplitable() in TextInputFormat.java:
+
+    - files whose name (or the name of a directory above them) starts with "_" or "." are ignored
+    - subdirectories are only listed if mapreduce.input.fileinputformat.input.dir.recursive is true
+    - splitSize = max(minSize, min(maxSize, blockSize)) where minSize is at least 1
+    - a file is cut into splits of splitSize bytes while the bytes left are more than
+      SPLIT_SLOP (1.1) times splitSize, and what is left is the last split
+    - a file compressed with a codec that can't be split (e.g. .gz) is a single split
+    - a file of 0 bytes is still a (empty) split
+
+The sizes of the files come from the output of "hdfs dfs -ls -R" or from arrays,
+and the splits of every file are computed at once with NumPy (a million files take
+about a tenth of a second, parsing their listing takes longer). Note that the old mapred API (org.apache.hadoop.mapred.FileInputFormat)
+also takes mapreduce.job.maps into account, and CombineFileInputFormat packs files
+together, neither of which is modeled here.
+
+Usage:
+    ./split_planner.py <output of "hdfs dfs -ls -R <input>"> <input> [<block size>]
+"""
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+SPLIT_SLOP = 1.1
+
+# dfs.block.size in hadoop_pseudodistributed_mode_container/hadoop/custom_configs/hdfs-site.xml
+# (the default of Hadoop is 128 MiB)
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+
+LONG_MAX_VALUE = (1 << 63) - 1
+
+# the extensions of the codecs in io.compression.codecs, and whether they are splittable
+# (implement SplittableCompressionCodec)
+CODEC_EXTENSIONS = {
+    ".deflate": False,
+    ".gz": False,
+    ".bz2": True,
+    ".lz4": False,
+    ".snappy": False,
+    ".zst": False,
+}
+CODEC_SUFFIXES = tuple(CODEC_EXTENSIONS)
+
+# the input files of a job, as they are after listStatus()
+InputFiles = namedtuple("InputFiles", ["paths", "lengths", "block_sizes", "splittable"])
+
+SplitPlan = namedtuple("SplitPlan", [
+    "num_files",
+    "num_splits",       # number of map tasks
+    "splits_per_file",
+    "split_lengths",    # length of every split, in the order of the files
+    "split_size",       # splitSize of each file
+])
+
+def is_hidden(name):
+    """
+    hiddenFileFilter.
+    """
+    return name.startswith("_") or name.startswith(".")
+
+
+def is_splittable(path):
+    """
+    TextInputFormat.isSplitable(): true if no codec matches the extension of the
+    file, or if the codec is splittable.
+    """
+    if not path.endswith(CODEC_SUFFIXES):
+        return True
+
+    return CODEC_EXTENSIONS[next(extension for extension in CODEC_EXTENSIONS if path.endswith(extension))]
+
+
+def parse_hdfs_listing(lines):
+    """
+    Parses the output of "hdfs dfs -ls -R" (or "hdfs dfs -ls") into a list of
+    (is directory, length, path). Lines that don't list a file or directory, such
+    as "Found 2 items", are skipped.
+    """
+    entries = []
+    for line in lines:
+        # permissions, replication, owner, group, size, date, time, path (which may contain spaces)
+        fields = line.split(None, 7)
+        if len(fields) < 8 or fields[0][0] not in "d-":
+            continue
+        entries.append((line[0] == "d", int(fields[4]), fields[7].rstrip("\n")))
+
+    return entries
+
+
+def list_input_files(entries, input_paths, block_size=DEFAULT_BLOCK_SIZE, recursive=False, ignore_subdirs=False):
+    """
+    Returns the InputFiles that listStatus() would return for input_paths (a path,
+    or a list of paths) given the entries of a recursive listing of them (see
+    parse_hdfs_listing()). Without recursion, a subdirectory of an input path is
+    returned as an input file of 0 bytes, unless ignore_subdirs is true
+    (mapreduce.input.fileinputformat.input.dir.nonrecursive.ignore.subdirs); a map
+    task given such a split fails because its path is not a file.
+    """
+    if isinstance(input_paths, str):
+        input_paths = [input_paths]
+    roots = [path.rstrip("/") for path in input_paths]
+
+    paths = []
+    lengths = []
+    for is_directory, length, path in entries:
+        for root in roots:
+            if path == root:
+                # an input path that is a file, a directory is listed by the lines that follow it
+                relative = path.rsplit("/", 1)[-1]
+                if is_directory:
+                    break
+            elif path.startswith(root) and path[len(root)] == "/":
+                relative = path[len(root) + 1:]
+            else:
+                continue
+
+            # hiddenFileFilter, applied to the file and (when recursing) to the directories above it
+            qualified = "/" + relative
+            if "/_" in qualified or "/." in qualified:
+                break
+
+            nested = "/" in relative
+            if is_directory:
+                if recursive or ignore_subdirs or nested:
+                    break
+                length = 0
+            elif nested and not recursive:
+                break
+
+            paths.append(path)
+            lengths.append(length)
+            break
+
+    return InputFiles(paths,
+                      np.array(lengths, dtype=np.int64),
+                      np.full(len(paths), block_size, dtype=np.int64),
+                      np.array([is_splittable(path) for path in paths], dtype=bool))
+
+
+def compute_split_size(block_sizes, min_split_size=1, max_split_size=LONG_MAX_VALUE):
+    """
+    computeSplitSize(), where minSize is at least getFormatMinSplitSize() (1).
+    """
+    min_size = max(1, min_split_size)
+    return np.maximum(min_size, np.minimum(max_split_size, np.asarray(block_sizes, dtype=np.int64)))
+
+
+def plan_splits(input_files, min_split_size=1, max_split_size=LONG_MAX_VALUE):
+    """
+    getSplits() for InputFiles. Returns a SplitPlan.
+
+    For a splittable file, the loop of getSplits() takes splits of splitSize bytes
+    while (double) bytesRemaining / splitSize > SPLIT_SLOP, so the number of full
+    splits k is the smallest one that leaves (length - k * splitSize) / splitSize
+    <= SPLIT_SLOP. k is first computed in floating point and then corrected with
+    the same double comparison as Java.
+    """
+    lengths = np.asarray(input_files.lengths, dtype=np.int64)
+    split_size = compute_split_size(input_files.block_sizes, min_split_size, max_split_size)
+
+    def more_splits(num_full_splits):
+        return (lengths - num_full_splits * split_size).astype(np.float64) / split_size.astype(np.float64) > SPLIT_SLOP
+
+    num_full_splits = np.maximum(np.ceil(lengths / split_size - SPLIT_SLOP), 0).astype(np.int64)
+    num_full_splits += more_splits(num_full_splits)
+    num_full_splits -= (num_full_splits > 0) & ~more_splits(np.maximum(num_full_splits - 1, 0))
+
+    splittable = np.asarray(input_files.splittable, dtype=bool) & (lengths > 0)
+    num_full_splits = np.where(splittable, num_full_splits, 0)
+    remaining = lengths - num_full_splits * split_size
+
+    # the full splits of each file, and what is left of it (the whole file if it isn't split,
+    # which can be 0 bytes)
+    splits_per_file = num_full_splits + 1
+    split_lengths = np.repeat(split_size, splits_per_file)
+    last_splits = np.cumsum(splits_per_file) - 1
+    split_lengths[last_splits] = remaining
+
+    return SplitPlan(len(lengths), int(splits_per_file.sum()), splits_per_file, split_lengths, split_size)
+
+
+def plan_hdfs_listing(lines, input_paths, block_size=DEFAULT_BLOCK_SIZE, min_split_size=1, max_split_size=LONG_MAX_VALUE,
+                      recursive=False, ignore_subdirs=False):
+    """
+    SplitPlan of a job whose input_paths are listed by the output of "hdfs dfs -ls -R".
+    """
+    input_files = list_input_files(parse_hdfs_listing(lines), input_paths, block_size, recursive, ignore_subdirs)
+    return plan_splits(input_files, min_split_size, max_split_size)
+
+
+def java_get_splits(lengths, block_sizes, splittable, min_split_size=1, max_split_size=LONG_MAX_VALUE):
+    """
+    Line by line port of the loop of getSplits(), used to check plan_splits().
+    """
+    min_size = max(1, min_split_size)
+    split_lengths = []
+    for length, block_size, can_split in zip(lengths, block_sizes, splittable):
+        if length != 0 and can_split:
+            split_size = max(min_size, min(max_split_size, block_size))
+            bytes_remaining = length
+            while float(bytes_remaining) / split_size > SPLIT_SLOP:
+                split_lengths.append(split_size)
+                bytes_remaining -= split_size
+            if bytes_remaining != 0:
+                split_lengths.append(bytes_remaining)
+        else:
+            split_lengths.append(length)
+
+    return split_lengths
+
+
+def print_plan(plan):
+    """
+    Prints the number of map tasks and how big their splits are.
+    """
+    print("{} files, {} splits (map tasks)".format(plan.num_files, plan.num_splits))
+    if plan.num_splits:
+        percentiles = np.percentile(plan.split_lengths, [0, 50, 90, 100])
+        print("split lengths: min {:.0f}, median {:.0f}, 90th percentile {:.0f}, max {:.0f} bytes".format(*percentiles))
+
+
+def verify():
+    """
+    Checks plan_splits() against the number of map tasks launched in run_test.py,
+    against the port of getSplits() for random files and configurations, and the
+    filtering of a listing.
+    """
+    MiB = 1024 * 1024
+
+    # num_files, file_size_in_MiB, launched map tasks (see run_test.py); util.hdfs_generate_word_files()
+    # writes words of 1000 bytes
+    for num_files, file_size_in_MiB, launched_map_tasks in [(1, 1, 1), (1, 20, 2), (2, 1, 2), (2, 20, 4)]:
+        lengths = np.full(num_files, file_size_in_MiB * MiB // 1000 * 1000)
+        plan = plan_splits(InputFiles(None, lengths, np.full(num_files, DEFAULT_BLOCK_SIZE), np.ones(num_files, dtype=bool)))
+        assert plan.num_splits == launched_map_tasks, (num_files, file_size_in_MiB, plan)
+
+    random_state = np.random.RandomState(0)
+    for block_size, min_split_size, max_split_size in [(16 * MiB, 1, LONG_MAX_VALUE), (128 * MiB, 1, LONG_MAX_VALUE),
+                                                       (1000, 1, 700), (1000, 3000, LONG_MAX_VALUE), (7, 0, 5)]:
+        split_size = int(compute_split_size(block_size, min_split_size, max_split_size))
+        # random lengths, and lengths right around the multiples of SPLIT_SLOP * splitSize
+        lengths = np.concatenate([random_state.randint(0, 50 * split_size, 3000),
+                                  [int(k * split_size + SPLIT_SLOP * split_size) + d for k in range(5) for d in range(-2, 3)],
+                                  [0, 1, split_size, 2 * split_size]])
+        block_sizes = np.full(len(lengths), block_size)
+        splittable = random_state.rand(len(lengths)) < 0.9
+
+        plan = plan_splits(InputFiles(None, lengths, block_sizes, splittable), min_split_size, max_split_size)
+        expected = java_get_splits(lengths.tolist(), block_sizes.tolist(), splittable.tolist(), min_split_size, max_split_size)
+        assert plan.split_lengths.tolist() == expected, (block_size, min_split_size, max_split_size)
+
+    listing = """Found 6 items
+drwxr-xr-x   - hadoop supergroup          0 2019-07-12 10:00 /user/hadoop/input/dir
+-rw-r--r--   1 hadoop supergroup   20971000 2019-07-12 10:00 /user/hadoop/input/dir/nested
+drwxr-xr-x   - hadoop supergroup          0 2019-07-12 10:00 /user/hadoop/input/_logs
+-rw-r--r--   1 hadoop supergroup   40000000 2019-07-12 10:00 /user/hadoop/input/_logs/history
+-rw-r--r--   1 hadoop supergroup          0 2019-07-12 10:00 /user/hadoop/input/_SUCCESS
+-rw-r--r--   1 hadoop supergroup   20971000 2019-07-12 10:00 /user/hadoop/input/input_file_0
+-rw-r--r--   1 hadoop supergroup   40000000 2019-07-12 10:00 /user/hadoop/input/input file 1.gz
+-rw-r--r--   1 hadoop supergroup          0 2019-07-12 10:00 /user/hadoop/input/empty
+-rw-r--r--   1 hadoop supergroup   40000000 2019-07-12 10:00 /user/hadoop/input2/input_file_2.bz2
+""".splitlines()
+    for recursive, ignore_subdirs, expected_paths, expected_num_splits in [
+            (False, False, ["input/dir", "input/input_file_0", "input/input file 1.gz", "input/empty"], 1 + 2 + 1 + 1),
+            (False, True, ["input/input_file_0", "input/input file 1.gz", "input/empty"], 2 + 1 + 1),
+            (True, False, ["input/dir/nested", "input/input_file_0", "input/input file 1.gz", "input/empty"], 2 + 2 + 1 + 1)]:
+        input_files = list_input_files(parse_hdfs_listing(listing), "/user/hadoop/input/", recursive=recursive, ignore_subdirs=ignore_subdirs)
+        assert input_files.paths == ["/user/hadoop/" + path for path in expected_paths], input_files.paths
+        assert plan_splits(input_files).num_splits == expected_num_splits
+
+    plan = plan_hdfs_listing(listing, ["/user/hadoop/input", "/user/hadoop/input2/input_file_2.bz2"])
+    assert plan.num_splits == 1 + 2 + 1 + 1 + 3, plan
+
+    print("verified the map tasks of run_test.py, random files and a listing")
+
+
+def benchmark(num_files):
+    """
+    Times planning the splits of num_files files with sizes from a few bytes to a few GiB,
+    and parsing and planning a listing of them.
+    """
+    random_state = np.random.RandomState(0)
+    lengths = (2 ** random_state.uniform(0, 32, num_files)).astype(np.int64)
+    input_files = InputFiles(None, lengths, np.full(num_files, DEFAULT_BLOCK_SIZE), np.ones(num_files, dtype=bool))
+
+    start = time.perf_counter()
+    plan = plan_splits(input_files)
+    print("planned {} splits of {} files in {:.3f} s".format(plan.num_splits, num_files, time.perf_counter() - start))
+
+    lines = ["-rw-r--r--   1 hadoop supergroup {:>10} 2019-07-12 10:00 /user/hadoop/input/part-{:08}".format(length, i)
+             for i, length in enumerate(lengths.tolist())]
+    start = time.perf_counter()
+    listing_plan = plan_hdfs_listing(lines, "/user/hadoop/input")
+    print("parsed and planned a listing of {} files in {:.3f} s".format(num_files, time.perf_counter() - start))
+    assert listing_plan.num_splits == plan.num_splits
+
+
+if __name__=="__main__":
+    if len(sys.argv) > 2:
+        with open(sys.argv[1]) as listing:
+            print_plan(plan_hdfs_listing(listing, sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_BLOCK_SIZE))
+    else:
+        verify()
+        benchmark(1000000)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""
+Runs the test cases of a test in parallel across several containers. Unlike
+build_and_run_test.sh, which runs a single container that executes every test case
+one after the other, this script takes a grid of test case parameters, splits the
+cases among N containers (each one being its own isolated pseudodistributed Hadoop
+"cluster"), runs the containers concurrently from a process pool and merges the
+results they report into a single table.
+
+Usage (from the hadoop_mr_tests directory, on the host):
+    ./parallel_runner.py <test_directory_name> '<json parameter grid>' [--workers N]
+
+For example:
+    ./parallel_runner.py map_output_materialized_bytes \
+        '{"num_reducers": [1, 2], "num_chars_per_word": [1, 128], "num_words": [10000, 50000]}' --workers 4
+
+The test's run_test.py receives its share of the cases as a json list in its first
+command line argument (see util.get_test_cases()) and reports one line per case with
+util.print_result(). The output of each container is saved to <test>_worker_<n>.log.
+"""
+import argparse
+import csv
+import itertools
+import json
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import util
+
+IMAGE = "wrenchproject/understanding-hadoop"
+
+def build_images(test_directory_name):
+    """
+    Builds the test-util image and the image of the given test, as done by build_and_run_test.sh.
+    """
+    subprocess.check_call(["docker", "image", "build", "-t", IMAGE + ":test-util", "."])
+    subprocess.check_call(["docker", "image", "build", "-t", IMAGE + ":" + test_directory_name, test_directory_name + "/"])
+
+
+def expand_grid(grid):
+    """
+    Returns the list of test cases (dicts) made of every combination of the
+    values in grid, a dict mapping each parameter name to a list of values.
+    """
+    return [dict(zip(grid.keys(), values)) for values in itertools.product(*grid.values())]
+
+
+def run_container(test_directory_name, worker, test_cases):
+    """
+    Runs the given test cases in a new container of the test's image and returns
+    the results it printed. The full output of the container is written to
+    <test_directory_name>_worker_<worker>.log.
+    """
+    container = subprocess.run(["docker", "container", "run", "--rm",
+                                "--privileged", "--security-opt", "seccomp=unconfined", "--security-opt", "apparmor=unconfined", "--cap-add=SYS_PTRACE",
+                                IMAGE + ":" + test_directory_name,
+                                "python3", "run_test.py", json.dumps(test_cases)],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = container.stdout.decode(errors="replace")
+
+    with open("{}_worker_{}.log".format(test_directory_name, worker), "w") as log_file:
+        log_file.write(output)
+
+    if container.returncode != 0:
+        util.print_red("worker {} exited with status {}".format(worker, container.returncode))
+
+    return util.parse_results(output)
+
+
+def run_in_parallel(test_directory_name, test_cases, num_workers):
+    """
+    Splits test_cases round robin among num_workers containers, runs the containers
+    concurrently and returns all of their results.
+    """
+    num_workers = min(num_workers, len(test_cases))
+    assignments = [test_cases[worker::num_workers] for worker in range(num_workers)]
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        workers = [executor.submit(run_container, test_directory_name, worker, assignment) for worker, assignment in enumerate(assignments)]
+        return [result for worker in workers for result in worker.result()]
+
+
+def print_table(results, file=sys.stdout):
+    """
+    Prints the results (dicts with the same keys) as a csv table.
+    """
+    if not results:
+        return
+
+    writer = csv.DictWriter(file, fieldnames=list(results[0].keys()))
+    writer.writeheader()
+    writer.writerows(results)
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Run the test cases of a test in parallel containers.")
+    parser.add_argument("test_directory_name", help="name of the directory that contains the test (without trailing '/')")
+    parser.add_argument("grid", help="json object mapping each test case parameter to a list of values")
+    parser.add_argument("--workers", type=int, default=2, help="number of containers to run at once")
+    parser.add_argument("--no-build", action="store_true", help="use the already built images")
+    parser.add_argument("--output", help="also write the results to this csv file")
+    args = parser.parse_args()
+
+    if not args.no_build:
+        build_images(args.test_directory_name)
+
+    test_cases = expand_grid(json.loads(args.grid))
+    util.print_purple("running {} test case(s) in {} container(s)".format(len(test_cases), min(args.workers, len(test_cases))))
+
+    results = run_in_parallel(args.test_directory_name, test_cases, args.workers)
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w", newline="") as csv_file:
+            print_table(results, csv_file)
@@ -16,3 +16,5 @@ docker cp $CONTAINER_ID:$CONTAINER_STRACE_OUTPUT_DIR $HOST_DEST_DIR
 echo "File containing trace from merge located at:"
 
 grep -rl "writing/merging records" strace_output
+
+echo "I/O per merge phase: ./strace_parser.py $HOST_DEST_DIR"
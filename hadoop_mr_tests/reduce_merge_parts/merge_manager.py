@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+
+"""
+Discrete event model of how a reduce task shuffles and merges map outputs, following
+hadoop-mapreduce-project/hadoop-mapreduce-client/hadoop-mapreduce-client-core/src/main/java/org/apache/hadoop/mapreduce/task/reduce/MergeManagerImpl.java
+(reserve(), closeInMemoryFile(), closeOnDiskFile(), InMemoryMerger, OnDiskMerger and finalMerge())
+and the merge passes of Merger.java. Given the sizes of the map outputs in the order they
+are fetched and the properties described in run_test.py, simulate_merge_manager() predicts
+which outputs are shuffled to memory or disk, when the InMemoryMerger and OnDiskMerger run,
+what the final merge feeds the reducer, and how many bytes are written to and read from disk,
+without running a job.
+
+Fetching is assumed to be instantaneous and map outputs arrive one time unit apart unless
+arrival times are given. Merges take (bytes merged / merge_bytes_per_second) time units, or
+no time at all by default, and each merger thread runs its merges one after the other.
+mapreduce.reduce.merge.inmem.threshold is not read by MergeManagerImpl in this version of
+Hadoop and the memory-to-memory merger (disabled by default) is not modeled.
+
+Running this file reproduces the outcomes of tests T1 - T9 of run_test.py and times a sweep
+over many configurations.
+"""
+import sys
+import time
+import heapq
+import bisect
+import itertools
+from collections import namedtuple, deque
+
+import numpy as np
+
+# Runtime.getRuntime().maxMemory() of a reduce task started with -Xmx100m
+MAX_MEMORY = 93323264
+
+# defaults from mapred-default.xml
+DEFAULT_PROPERTIES = {
+    "mapreduce.task.io.sort.factor": 10,
+    "mapreduce.reduce.shuffle.input.buffer.percent": 0.70,
+    "mapreduce.reduce.shuffle.memory.limit.percent": 0.25,
+    "mapreduce.reduce.shuffle.merge.percent": 0.66,
+    "mapreduce.reduce.input.buffer.percent": 0.0,
+}
+
+MergeManagerLimits = namedtuple("MergeManagerLimits", ["memory_limit", "max_single_shuffle_limit", "merge_threshold",
+                                                       "io_sort_factor", "max_in_mem_reduce"])
+
+# an event of the simulation, named after the events of merge_events.py where they have an equivalent
+MergeManagerEvent = namedtuple("MergeManagerEvent", ["time", "event", "num_segments", "bytes"])
+
+MergeManagerResult = namedtuple("MergeManagerResult", [
+    "num_shuffled_to_memory", "num_shuffled_to_disk",
+    "num_stalls",                   # reservations that had to wait for an in-memory merge to free memory
+    "num_in_memory_merges", "num_on_disk_merges", "num_final_intermediate_merges",
+    "final_memory_to_disk",         # whether in-memory outputs were merged to disk to satisfy the reduce memory limit
+    "final_in_memory_segments",     # in-memory map outputs fed to the reducer
+    "final_disk_segments",          # on-disk segments fed to the reducer by the last merge pass
+    "bytes_written", "bytes_read",  # local disk I/O of the shuffle and merges
+    "events"
+])
+
+def java_long_times_float(long_value, float_value):
+    """
+    Returns (long)(long_value * float_value) where float_value is a Java float, which
+    Java computes with float (not double) precision.
+    """
+    return int(np.float32(long_value) * np.float32(float_value))
+
+
+def merge_manager_limits(properties, max_memory=MAX_MEMORY):
+    """
+    Computes the limits of the MergeManagerImpl constructor (and getMaxInMemReduceLimit())
+    from properties, a dict of the properties in DEFAULT_PROPERTIES (missing ones take
+    their default value), for a reduce task whose Runtime.getRuntime().maxMemory() is max_memory.
+    Raises ValueError for the configurations MergeManagerImpl rejects.
+    """
+    properties = dict(DEFAULT_PROPERTIES, **properties)
+    for name in ["mapreduce.reduce.shuffle.input.buffer.percent", "mapreduce.reduce.shuffle.memory.limit.percent",
+                 "mapreduce.reduce.input.buffer.percent"]:
+        if not 0.0 <= float(properties[name]) <= 1.0:
+            raise ValueError("Invalid value for {}: {}".format(name, properties[name]))
+
+    memory_limit = java_long_times_float(max_memory, properties["mapreduce.reduce.shuffle.input.buffer.percent"])
+    max_single_shuffle_limit = min(java_long_times_float(memory_limit, properties["mapreduce.reduce.shuffle.memory.limit.percent"]),
+                                   (1 << 31) - 1)
+    merge_threshold = java_long_times_float(memory_limit, properties["mapreduce.reduce.shuffle.merge.percent"])
+
+    if max_single_shuffle_limit >= merge_threshold:
+        raise ValueError("Invalid configuration: maxSingleShuffleLimit should be less than mergeThreshold "
+                         "maxSingleShuffleLimit: {} mergeThreshold: {}".format(max_single_shuffle_limit, merge_threshold))
+
+    return MergeManagerLimits(memory_limit, max_single_shuffle_limit, merge_threshold,
+                              int(properties["mapreduce.task.io.sort.factor"]),
+                              java_long_times_float(memory_limit, properties["mapreduce.reduce.input.buffer.percent"]))
+
+
+def get_pass_factor(factor, pass_number, num_segments):
+    """
+    Same as getPassFactor() in Merger.java (see also map_merge_parts/pass_factor.py).
+    """
+    if pass_number > 1 or num_segments <= factor or factor == 1:
+        return factor
+
+    mod = (num_segments - 1) % (factor - 1)
+    if mod == 0:
+        return factor
+    return mod + 1
+
+
+def merge_disk_segments(factor, in_memory_segments, disk_segments):
+    """
+    Passes of the Merger.merge() call of finalMerge() that merges the on-disk segments,
+    preceded by in_memory_segments (sizes of the in-memory map outputs kept for this
+    merge), which only count towards the first pass. Returns (sizes of the segments of
+    each intermediate pass, sizes of the segments of the last pass); the last pass is
+    fed to the reducer and intermediate passes write their output to disk.
+    """
+    segments = list(in_memory_segments) + sorted(disk_segments)
+    num_in_memory = len(in_memory_segments)
+    intermediate_passes = []
+    pass_number = 1
+
+    while True:
+        pass_factor = get_pass_factor(factor, pass_number, len(segments) - num_in_memory)
+        if pass_number == 1:
+            pass_factor += num_in_memory
+
+        if len(segments) <= pass_factor:
+            return intermediate_passes, segments
+
+        merged, segments = segments[:pass_factor], segments[pass_factor:]
+        intermediate_passes.append(merged)
+        bisect.insort(segments, sum(merged))
+        pass_number += 1
+
+
+def simulate_merge_manager(map_output_sizes, properties, max_memory=MAX_MEMORY, arrival_times=None,
+                           merge_bytes_per_second=None):
+    """
+    Simulates the shuffle and merge of a reduce task that fetches map outputs of the
+    given sizes (in bytes, in fetch order) with the given properties (see
+    merge_manager_limits()) and returns a MergeManagerResult.
+    """
+    limits = merge_manager_limits(properties, max_memory)
+    if arrival_times is None:
+        arrival_times = range(len(map_output_sizes))
+
+    events = []
+    pending = []            # heap of (time, sequence number, handler, argument)
+    sequence = itertools.count()
+
+    # sorted lists of (size, id), as the TreeSets of MergeManagerImpl
+    in_memory_outputs = []
+    on_disk_outputs = []
+    stalled = deque()
+    state = {"now": 0, "used_memory": 0, "commit_memory": 0, "bytes_written": 0, "bytes_read": 0,
+             "to_memory": 0, "to_disk": 0, "stalls": 0, "in_memory_merges": 0, "on_disk_merges": 0}
+    ids = itertools.count()
+
+    def schedule(delay, handler, argument):
+        heapq.heappush(pending, (state["now"] + delay, next(sequence), handler, argument))
+
+    def merge_duration(num_bytes):
+        return num_bytes / merge_bytes_per_second if merge_bytes_per_second else 0
+
+    # a merger thread merges its pending inputs one list at a time
+    mergers = {name: {"queue": deque(), "busy": False} for name in ["in_memory", "on_disk"]}
+
+    def start_merge(name, inputs):
+        merger = mergers[name]
+        merger["queue"].append(inputs)
+        if not merger["busy"]:
+            run_next_merge(name)
+
+    def run_next_merge(name):
+        merger = mergers[name]
+        merger["busy"] = bool(merger["queue"])
+        if merger["busy"]:
+            inputs = merger["queue"].popleft()
+            event = "in_memory_merge" if name == "in_memory" else "on_disk_merge"
+            events.append(MergeManagerEvent(state["now"], event, len(inputs), sum(inputs)))
+            schedule(merge_duration(sum(inputs)), finish_merge, (name, inputs))
+
+    def finish_merge(argument):
+        name, inputs = argument
+        merged_size = sum(inputs)
+        state["bytes_written"] += merged_size
+
+        if name == "in_memory":
+            state["in_memory_merges"] += 1
+            state["used_memory"] -= merged_size
+        else:
+            state["on_disk_merges"] += 1
+            state["bytes_read"] += merged_size
+
+        close_on_disk_file(merged_size)
+        run_next_merge(name)
+
+        # fetchers waiting for memory (see waitForResource()) retry once an in-memory merge is done
+        if name == "in_memory":
+            for _ in range(len(stalled)):
+                reserve(stalled.popleft())
+
+    def close_in_memory_file(size):
+        bisect.insort(in_memory_outputs, (size, next(ids)))
+        events.append(MergeManagerEvent(state["now"], "close_in_memory_file", len(in_memory_outputs), size))
+        state["commit_memory"] += size
+
+        if state["commit_memory"] >= limits.merge_threshold:
+            events.append(MergeManagerEvent(state["now"], "in_memory_merge_triggered", len(in_memory_outputs), state["commit_memory"]))
+            inputs = [output_size for output_size, _ in in_memory_outputs]
+            del in_memory_outputs[:]
+            start_merge("in_memory", inputs)
+            state["commit_memory"] = 0
+
+    def close_on_disk_file(size):
+        bisect.insort(on_disk_outputs, (size, next(ids)))
+
+        if len(on_disk_outputs) >= 2 * limits.io_sort_factor - 1:
+            inputs = [output_size for output_size, _ in on_disk_outputs[:limits.io_sort_factor]]
+            del on_disk_outputs[:limits.io_sort_factor]
+            start_merge("on_disk", inputs)
+
+    def reserve(size):
+        if size > limits.max_single_shuffle_limit:
+            events.append(MergeManagerEvent(state["now"], "shuffle_to_disk", 1, size))
+            state["to_disk"] += 1
+            state["bytes_written"] += size
+            close_on_disk_file(size)
+        elif state["used_memory"] > limits.memory_limit:
+            events.append(MergeManagerEvent(state["now"], "stall", 1, size))
+            state["stalls"] += 1
+            stalled.append(size)
+        else:
+            state["to_memory"] += 1
+            state["used_memory"] += size
+            close_in_memory_file(size)
+
+    for arrival_time, size in zip(arrival_times, map_output_sizes):
+        heapq.heappush(pending, (arrival_time, next(sequence), reserve, size))
+
+    while pending:
+        state["now"], _, handler, argument = heapq.heappop(pending)
+        handler(argument)
+
+    if stalled:
+        raise RuntimeError("{} map outputs could not be reserved (usedMemory {} > memoryLimit {})".format(
+                           len(stalled), state["used_memory"], limits.memory_limit))
+
+    # finalMerge(): memory holds the in-memory outputs from smallest to largest
+    memory = [size for size, _ in in_memory_outputs]
+    disk = [size for size, _ in on_disk_outputs]
+    events.append(MergeManagerEvent(state["now"], "final_merge", len(memory), sum(memory)))
+
+    # segments required to vacate memory so that at most max_in_mem_reduce bytes are kept
+    memory_to_disk = []
+    while sum(memory) > limits.max_in_mem_reduce:
+        memory_to_disk.append(memory.pop(0))
+
+    final_memory_to_disk = bool(memory_to_disk) and limits.io_sort_factor > len(disk)
+    if final_memory_to_disk:
+        events.append(MergeManagerEvent(state["now"], "final_merge_memory_to_disk", len(memory_to_disk), sum(memory_to_disk)))
+        state["bytes_written"] += sum(memory_to_disk)
+        disk.append(sum(memory_to_disk))
+        memory_to_disk = []
+    elif memory_to_disk:
+        events.append(MergeManagerEvent(state["now"], "final_merge_keep_in_memory", len(memory_to_disk), sum(memory_to_disk)))
+
+    events.append(MergeManagerEvent(state["now"], "final_merge_from_disk", len(disk), sum(disk)))
+    events.append(MergeManagerEvent(state["now"], "final_merge_from_memory", len(memory), sum(memory)))
+
+    final_disk_segments = 0
+    num_final_intermediate_merges = 0
+    if disk or memory_to_disk:
+        intermediate_passes, last_pass = merge_disk_segments(limits.io_sort_factor, memory_to_disk, disk)
+        num_final_intermediate_merges = len(intermediate_passes)
+
+        # only the first pass reads the in-memory segments, from memory
+        disk_bytes_per_pass = [sum(segments) for segments in intermediate_passes]
+        if intermediate_passes:
+            disk_bytes_per_pass[0] -= sum(memory_to_disk)
+        for merged, disk_bytes in zip(intermediate_passes, disk_bytes_per_pass):
+            events.append(MergeManagerEvent(state["now"], "intermediate_merge", len(merged), sum(merged)))
+            state["bytes_read"] += disk_bytes
+            state["bytes_written"] += sum(merged)
+
+        final_disk_segments = len(last_pass) - (0 if intermediate_passes else len(memory_to_disk))
+        state["bytes_read"] += sum(last_pass) - (0 if intermediate_passes else sum(memory_to_disk))
+
+    return MergeManagerResult(state["to_memory"], state["to_disk"], state["stalls"],
+                              state["in_memory_merges"], state["on_disk_merges"], num_final_intermediate_merges,
+                              final_memory_to_disk, len(memory), final_disk_segments,
+                              state["bytes_written"], state["bytes_read"], events)
+
+
+# properties and tests of run_test.py, map outputs are (number of maps, size of each output)
+RUN_TEST_PROPERTIES = {
+    "mapreduce.task.io.sort.factor": 3,
+    "mapreduce.reduce.shuffle.input.buffer.percent": 0.1,
+    "mapreduce.reduce.shuffle.memory.limit.percent": 0.2,
+    "mapreduce.reduce.shuffle.merge.percent": 0.5,
+    "mapreduce.reduce.input.buffer.percent": 0.5,
+}
+
+ONE_MB = 1 << 20
+IFILE_TRAILER_BYTES = 6
+
+RUN_TEST_TESTS = {
+    "T1": (2, ONE_MB), "T2": (3, ONE_MB), "T3": (5, ONE_MB), "T4": (10, ONE_MB), "T5": (25, ONE_MB),
+    "T6": (10, ONE_MB // 2), "T7": (1, 3 * ONE_MB), "T8": (2, 3 * ONE_MB), "T9": (10, 3 * ONE_MB),
+}
+
+# outcomes described in run_test.py, as
+# (in-memory merges, on-disk merges, final in-memory segments, final disk segments, shuffled to disk)
+RUN_TEST_OUTCOMES = {
+    "T1": (0, 0, 2, 0, 0), "T2": (0, 0, 3, 0, 0), "T3": (1, 0, 0, 1, 0), "T4": (2, 0, 0, 2, 0), "T5": (5, 1, 0, 3, 0),
+    "T6": (1, 0, 1, 1, 0), "T7": (0, 0, 0, 1, 1), "T8": (0, 0, 0, 2, 2), "T9": (0, 3, 0, 3, 10),
+}
+
+def verify():
+    """
+    Checks that the simulation reproduces the outcomes of tests T1 - T9 described in run_test.py.
+    """
+    limits = merge_manager_limits(RUN_TEST_PROPERTIES)
+    print(limits)
+
+    for name, (num_maps, size) in sorted(RUN_TEST_TESTS.items()):
+        result = simulate_merge_manager([size + IFILE_TRAILER_BYTES] * num_maps, RUN_TEST_PROPERTIES)
+        outcome = (result.num_in_memory_merges, result.num_on_disk_merges, result.final_in_memory_segments,
+                   result.final_disk_segments, result.num_shuffled_to_disk)
+
+        print("{}: {}".format(name, result._replace(events=len(result.events))))
+        assert outcome == RUN_TEST_OUTCOMES[name], (name, outcome, RUN_TEST_OUTCOMES[name])
+
+    # T9 ends with 4 files on disk, which the final merge brings down to 3 with one intermediate merge
+    assert simulate_merge_manager([3 * ONE_MB] * 10, RUN_TEST_PROPERTIES).num_final_intermediate_merges == 1
+
+
+def benchmark(num_maps=100):
+    """
+    Times simulating num_maps map outputs of random sizes for every combination of a
+    grid of io.sort.factor, shuffle.merge.percent and reduce.input.buffer.percent values.
+    """
+    sizes = np.random.randint(ONE_MB // 4, 2 * ONE_MB, size=num_maps).tolist()
+    grid = list(itertools.product([2, 3, 5, 10, 25, 50, 100], [0.3, 0.4, 0.5, 0.66, 0.8, 0.9],
+                                  [0.0, 0.1, 0.25, 0.5, 0.75, 1.0], [0.05, 0.1, 0.2]))
+
+    start = time.perf_counter()
+    bytes_written = []
+    for factor, merge_percent, reduce_percent, memory_limit_percent in grid:
+        properties = dict(RUN_TEST_PROPERTIES, **{"mapreduce.task.io.sort.factor": factor,
+                                                  "mapreduce.reduce.shuffle.merge.percent": merge_percent,
+                                                  "mapreduce.reduce.input.buffer.percent": reduce_percent,
+                                                  "mapreduce.reduce.shuffle.memory.limit.percent": memory_limit_percent})
+        try:
+            bytes_written.append(simulate_merge_manager(sizes, properties).bytes_written)
+        except ValueError:
+            continue
+    elapsed = time.perf_counter() - start
+
+    print("{} configurations of {} map outputs simulated in {:.2f} s, bytes written to disk from {} to {}".format(
+          len(bytes_written), num_maps, elapsed, min(bytes_written), max(bytes_written)))
+
+
+if __name__=="__main__":
+    verify()
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
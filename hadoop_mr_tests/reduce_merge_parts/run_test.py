@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
+import sys
 import subprocess
-import time
 
-# this module will be placed in the same directory as this file by Dockerfile 'COPY'
+# these modules will be placed in the same directory as this file by Dockerfile 'COPY'
 import util
+import log4j_parser
+import merge_events
+import task_profiler
 
 """
 Test to determine how reduce tasks merge map output files.
@@ -82,8 +85,8 @@ if __name__=="__main__":
     }
 
     '''
-    Reduce Task Configuration based on MAPREDUCE_PROPERTIES
-    -------------------------------------------------------
+    Reduce Task Configuration based on MAPREDUCE_PROPERTIES (see merge_manager.merge_manager_limits())
+    -------------------------------------------------------------------------------------------------
     allocated memory: 1024 MB
     jvm heap size: 100 MB (a little less in practice as Runtime.getRuntime.maxMemory() returns 93323264 bytes)
     input buffer size: (93323264 * 0.1) = 9332326.4 bytes or about 9.3 MB
@@ -203,9 +206,16 @@ if __name__=="__main__":
     '''
     T9 = [["r" for j in range((3 * ONE_MB) // TOTAL_BYTES_PER_KV_PAIR)] for i in range(10)]
 
+    # merge_manager.py simulates the shuffle and merges of these tests (and any other configuration)
+    # without running a job and checks that it reproduces the results described above
+
     # set the test 
     test = T9
 
+    # set to "jfr" (or "hprof") to profile the map and reduce tasks with a sampling profiler
+    # (see task_profiler.py), whose collapsed stacks are written to /home/hadoop/profiles
+    profiler = None
+
     # -----------------------------------------------------------------------------------
     util.hadoop_start_up()
 
@@ -217,26 +227,33 @@ if __name__=="__main__":
                             "wordcount {} input output").format(" ".join(["-D {}={}".format(property, value) for property, value in MAPREDUCE_PROPERTIES.items()])),
                                 stderr=subprocess.STDOUT)
     '''
-    subprocess.check_output(("sudo -i -u hadoop /usr/local/hadoop/bin/hadoop jar /usr/local/hadoop/share/hadoop/mapreduce/hadoop-mapreduce-examples-3.3.0-SNAPSHOT.jar wordcount {} input output").format(" ".join(["-D {}={}".format(property, value) for property, value in MAPREDUCE_PROPERTIES.items()])), stderr=subprocess.STDOUT, shell=True)
+    subprocess.check_output(("sudo -i -u hadoop /usr/local/hadoop/bin/hadoop jar /usr/local/hadoop/share/hadoop/mapreduce/hadoop-mapreduce-examples-3.3.0-SNAPSHOT.jar wordcount {} input output").format(" ".join(["-D {}={}".format(property, value) for property, value in MAPREDUCE_PROPERTIES.items()] + ([task_profiler.profile_options(profiler)] if profiler else []))), stderr=subprocess.STDOUT, shell=True)
 
-    time.sleep(5)
+    # wait until yarn has aggregated the logs of the job, then write them to file
+    application_id = util.yarn_get_latest_application_id()
+    if application_id is None:
+        util.print_red("no application was submitted to YARN, there are no logs to read")
+        util.hadoop_tear_down()
+        sys.exit(1)
+    util.yarn_wait_for_logs(application_id)
+    LOG_FILE_PATH = util.yarn_write_logs_to_file(application_id)
 
-    # write logs to file
-    LOG_FILE_PATH = util.yarn_write_logs_to_file(util.yarn_get_application_id())
+    if profiler:
+        task_profiler.convert_profiles(task_profiler.yarn_fetch_profiles(application_id, profiler))
 
-    logs = []
+    # save the spill, shuffle and merge events of the job as a table for later analysis
+    events = merge_events.read_yarn_log_events(LOG_FILE_PATH)
+    merge_events.save_events(events, "/home/hadoop/merge_events.npz")
+    merge_events.print_summary(events)
 
-    with open(LOG_FILE_PATH, 'r') as file:
-        for line in file:
-            if "org.apache.hadoop.mapred" in line:
-                logs.append(line)
+    # merge the logs of "org.apache.hadoop.mapred*" loggers of every container by timestamp
+    sorted_logs = [record.line for record in log4j_parser.merge_yarn_log(LOG_FILE_PATH, "org.apache.hadoop.mapred")]
 
     util.hadoop_tear_down()
 
     # for this test, we only care about logs that pertain to the single reducer
     # so any logs recorded before the reduce task started is discarded
     reduce_start_index = 0
-    sorted_logs = util.sort_log4j_by_timestamp(logs)
     for index, line in enumerate(sorted_logs):
         if "ReduceTask.run() start" in line:
             reduce_start_index = index
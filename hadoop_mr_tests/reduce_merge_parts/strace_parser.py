@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+
+"""
+Parses the strace output of a reduce task (see get_strace_output.sh and the strace
+call in ReduceTask.java) into an I/O timeline: the number of calls and the bytes
+read and written per time bin, thread, merge phase, kind of file (category) and
+system call, as a NumPy structured array that can be saved to a .npz file.
+
+strace -ff writes one file per thread (output.<tid>) whose lines look like
+
+14:02:33.113342 read(412</tmp/hadoop-hadoop/nm-local-dir/.../map_3.out>, "..."..., 65536) = 65536
+
+The file descriptor of each call is decorated with its path (-y) or, for sockets,
+its addresses (-yy), so the calls are attributed to paths without tracking open and
+close. Paths are put in CATEGORIES by their names (fetched map outputs, merged
+files, spills, sockets of the shuffle or of HDFS...). The phase of a thread changes
+every time the thread prints one of MARKERS to stdout, e.g. "writing/merging
+records" is printed by Merger.writeFile() before every merge pass writes its output.
+The shuffle and reduce markers are printed by the main thread only, while the
+fetcher threads do the I/O of the shuffle, so until a thread prints a marker of its
+own its phase is the one of the process: the last of PROCESS_MARKERS printed by any
+thread, which are found in every file before the calls are parsed.
+
+The traces are read line by line and only the aggregates are kept, so the memory
+used depends on the number of bins, threads, phases and paths rather than on the
+size of the traces.
+
+The saved timeline can be rendered with the log events of the job by ../timeline.py.
+
+Usage:
+    ./strace_parser.py <strace output directory or files> [--bin <seconds>] [--save <timeline.npz>]
+"""
+import os
+import re
+import sys
+import mmap
+import bisect
+import argparse
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+# system calls that transfer bytes, whose return value is the number of bytes
+READ_SYSCALLS = {b"read", b"pread64", b"readv", b"preadv"}
+WRITE_SYSCALLS = {b"write", b"pwrite64", b"writev", b"pwritev"}
+
+# lines printed by the reduce task that start a new phase of the thread printing them
+MARKERS = [
+    (b"calling shuffleConsumerPlugin.run()", "shuffle"),   # ReduceTask.run()
+    (b"writing/merging records", "merge"),                 # Merger.writeFile()
+    (b"shuffleConsumerPlugin.run() returned", "reduce"),   # ReduceTask.run()
+]
+
+# markers that also start a phase of the threads that print no markers of their own
+PROCESS_MARKERS = [(marker, name) for marker, name in MARKERS if name != "merge"]
+
+# phase of a thread until it (or the process) prints a marker
+INITIAL_PHASE = "unmarked"
+
+# dfs.datanode.address and mapreduce.shuffle.port
+DATANODE_PORT = 9866
+SHUFFLE_PORT = 13562
+
+# the category of a path is the first one whose pattern matches it
+CATEGORIES = [
+    ("merged", r"\.merged$|/intermediate\.\d+$"),                 # MergeManagerImpl and Merger outputs
+    ("map output", r"/map_\d+\.out$|/file\.out$"),                # fetched map outputs, map output file
+    ("spill", r"/spill\d+\.out$"),
+    ("index", r"\.index$"),
+    ("hdfs", r"^TCP6?:\[.*:{}\]$".format(DATANODE_PORT)),         # the reduce output, sent to the datanode
+    ("shuffle", r"^TCP6?:\[.*:{}\]$".format(SHUFFLE_PORT)),       # map outputs fetched from the shuffle handler
+    ("socket", r"^(socket|TCP6?|UDP6?|UNIX|NETLINK):"),
+    ("pipe", r"^pipe:"),
+    ("log", r"/(stdout|stderr|syslog)$"),
+    ("classes", r"\.(jar|class|so(\.\d+)*)$"),
+    ("other", r""),
+]
+CATEGORY_PATTERNS = [(name, re.compile(pattern)) for name, pattern in CATEGORIES]
+
+TIMELINE_DTYPE = np.dtype([
+    ("time", "f8"),         # start of the bin, in seconds since the first traced call
+    ("thread", "U16"),      # thread id (suffix of the strace output file)
+    ("phase", "U32"),
+    ("category", "U16"),
+    ("syscall", "U16"),
+    ("calls", "i8"),
+    ("bytes", "i8"),        # bytes read or written, 0 for other system calls
+])
+
+# "[pid 123] " or "123 " prefix (without -ff), time (-t, -tt or -ttt), then either
+# the rest of a call that was interrupted ("resumed") or a call, whose first argument
+# is usually a file descriptor decorated with its path (which can contain ">" as in
+# "TCP:[1.2.3.4:5->6.7.8.9:10]"); the other arguments follow the match
+LINE = re.compile(rb"(?:\[pid +\d+\] |\d+ +)?(?P<time>[\d:.]+) "
+                  rb"(?:<\.\.\. (?P<resumed>\w+) resumed>|(?P<syscall>\w+)\((?:(?P<fd>\d+)<(?P<path>[^>]*(?:>(?!, |\))[^>]*)*)>)?)")
+
+# return value at the end of a call, possibly decorated with a path (openat) or
+# followed by an error ("-1 EAGAIN (Resource temporarily unavailable)"); the end of
+# line anchor skips ") = " in the strings of the arguments
+RESULT = re.compile(rb"\) += (-?\d+)(?:<(.*)>)?(?: [A-Z]\w* \(.*\))?$")
+
+UNFINISHED = b"<unfinished ...>"
+
+# totals of a path over the whole trace
+PathTotal = namedtuple("PathTotal", ["category", "calls", "bytes_read", "bytes_written"])
+
+
+def parse_time(time):
+    """
+    Seconds since midnight of a -t or -tt timestamp ("14:02:33.113342"), or seconds
+    since the epoch of a -ttt timestamp.
+    """
+    if b":" in time:
+        hours, minutes, seconds = time.split(b":")
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return float(time)
+
+
+def time_parser():
+    """
+    Returns a function equivalent to parse_time() that parses the hours and minutes
+    ("14:02:") of a -t or -tt timestamp only once per minute.
+    """
+    minutes = {}
+
+    def parse(time):
+        if time[2:3] != b":":
+            return float(time)
+        prefix = time[:6]
+        seconds = minutes.get(prefix)
+        if seconds is None:
+            seconds = minutes[prefix] = parse_time(prefix + b"0")
+        return seconds + float(time[6:])
+
+    return parse
+
+
+class StraceAggregator:
+    """
+    Accumulates the calls of one or more strace output files into per bin totals
+    and per path totals.
+    """
+    def __init__(self, bin_seconds=1.0):
+        self.bin_seconds = bin_seconds
+        # (bin, thread, phase, path, syscall) -> [calls, bytes], summed per category by timeline()
+        self.bins = defaultdict(lambda: [0, 0])
+        # path -> [calls, bytes read, bytes written]
+        self.paths = defaultdict(lambda: [0, 0, 0])
+        self.categories = {}
+        # thread -> [(time, phase)] in the order the phases started
+        self.phases = defaultdict(list)
+        # times and phases of the PROCESS_MARKERS printed by any thread, in time order
+        self.process_times = []
+        self.process_phases = []
+        self.num_lines = 0
+        self.num_unparsed_lines = 0
+
+    def category(self, path):
+        category = self.categories.get(path)
+        if category is None:
+            text = path.decode(errors="replace")
+            category = next(name for name, pattern in CATEGORY_PATTERNS if pattern.search(text))
+            self.categories[path] = category
+        return category
+
+    def add_process_markers(self, lines):
+        """
+        Adds the PROCESS_MARKERS printed to stdout in lines (of any thread), which must
+        be added before the calls of the threads that don't print them.
+        """
+        for line in lines:
+            match = LINE.match(line)
+            if match is None or match.group("syscall") not in WRITE_SYSCALLS:
+                continue
+            if match.group("fd") != b"1" and not (match.group("path") or b"").endswith(b"/stdout"):
+                continue
+
+            for marker, name in PROCESS_MARKERS:
+                if marker in line:
+                    time = parse_time(match.group("time"))
+                    position = bisect.bisect(self.process_times, time)
+                    self.process_times.insert(position, time)
+                    self.process_phases.insert(position, name)
+
+    def add_process_markers_of_file(self, path):
+        """
+        Adds the PROCESS_MARKERS of the strace output file at path. Only the lines
+        that contain a marker are parsed, which are found by searching the memory
+        mapped file, so this takes a fraction of the time of add_file().
+        """
+        lines = []
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as trace:
+                for marker, _ in PROCESS_MARKERS:
+                    position = trace.find(marker)
+                    while position != -1:
+                        start = trace.rfind(b"\n", 0, position) + 1
+                        end = trace.find(b"\n", position)
+                        lines.append(trace[start:end if end != -1 else len(trace)])
+                        position = trace.find(marker, position + len(marker))
+
+        self.add_process_markers(lines)
+
+    def add_file(self, path, thread=None):
+        """
+        Adds the calls traced in the strace output file at path, whose thread defaults
+        to the suffix of its name (output.<tid>).
+        """
+        if thread is None:
+            thread = os.path.basename(path).rsplit(".", 1)[-1]
+
+        with open(path, "rb") as lines:
+            self.add_lines(lines, thread)
+
+    def add_lines(self, lines, thread):
+        phase = INITIAL_PHASE
+        phase_counts = defaultdict(int)
+        self.phases[thread].append((None, phase))
+        # until the thread prints a marker, its phase follows the process markers
+        process_times = self.process_times
+        process_phases = self.process_phases
+        follows_process = bool(process_times)
+        # the call interrupted by "<unfinished ...>" and the path of its file descriptor
+        unfinished = {}
+        day_offset = 0
+        last_time = None
+
+        bins = self.bins
+        paths = self.paths
+        bin_seconds = self.bin_seconds
+        parse = time_parser()
+
+        for line in lines:
+            self.num_lines += 1
+            match = LINE.match(line)
+            if match is None:
+                # signals, "+++ exited with 0 +++"...
+                self.num_unparsed_lines += 1
+                continue
+
+            time = parse(match.group("time")) + day_offset
+            # -t and -tt timestamps wrap around at midnight
+            if last_time is not None and time < last_time - 43200:
+                day_offset += 86400
+                time += 86400
+            last_time = time
+
+            syscall, fd, path = match.group("syscall", "fd", "path")
+            args = line[match.end():].rstrip(b"\n")
+            if syscall is None:
+                syscall = match.group("resumed")
+                fd, path = unfinished.pop(syscall, (None, None))
+            elif args.endswith(UNFINISHED):
+                unfinished[syscall] = (fd, path)
+                continue
+
+            result = RESULT.search(args)
+            if result is None:
+                self.num_unparsed_lines += 1
+                continue
+            returned = int(result.group(1))
+
+            if syscall == b"openat":
+                # the path is the decoration of the returned file descriptor
+                path = result.group(2)
+                if path is None:
+                    continue
+            elif path is None:
+                self.num_unparsed_lines += 1
+                continue
+
+            num_bytes = 0
+            if syscall in READ_SYSCALLS:
+                num_bytes = max(returned, 0)
+                paths[path][1] += num_bytes
+            elif syscall in WRITE_SYSCALLS:
+                num_bytes = max(returned, 0)
+                paths[path][2] += num_bytes
+
+                if fd == b"1" or path.endswith(b"/stdout"):
+                    for marker, name in MARKERS:
+                        if marker in args:
+                            phase_counts[name] += 1
+                            phase = "{} {}".format(name, phase_counts[name]) if name == "merge" else name
+                            self.phases[thread].append((time, phase))
+                            follows_process = False
+            paths[path][0] += 1
+
+            if follows_process:
+                position = bisect.bisect(process_times, time)
+                phase = process_phases[position - 1] if position else INITIAL_PHASE
+
+            totals = bins[int(time // bin_seconds), thread, phase, path, syscall]
+            totals[0] += 1
+            totals[1] += num_bytes
+
+    def timeline(self):
+        """
+        Structured array (of TIMELINE_DTYPE) of the totals of each bin, sorted by time.
+        """
+        if not self.bins:
+            return np.array([], dtype=TIMELINE_DTYPE)
+
+        first_bin = int(self.start_time() // self.bin_seconds)
+        totals = defaultdict(lambda: [0, 0])
+        for (bin, thread, phase, path, syscall), (calls, num_bytes) in self.bins.items():
+            category_totals = totals[bin, thread, phase, self.category(path), syscall]
+            category_totals[0] += calls
+            category_totals[1] += num_bytes
+
+        rows = [((bin - first_bin) * self.bin_seconds, thread, phase, category, syscall.decode(), calls, num_bytes)
+                for (bin, thread, phase, category, syscall), (calls, num_bytes) in totals.items()]
+        timeline = np.array(rows, dtype=TIMELINE_DTYPE)
+        return timeline[np.argsort(timeline["time"], kind="mergesort")]
+
+    def start_time(self):
+        """
+        Start of the first bin, in seconds since midnight (or since the epoch for -ttt
+        timestamps), which is the time 0 of timeline().
+        """
+        return min(key[0] for key in self.bins) * self.bin_seconds if self.bins else 0.0
+
+    def path_totals(self):
+        """
+        PathTotal of every path that was read, written or opened, by path.
+        """
+        return {path.decode(errors="replace"): PathTotal(self.category(path), *totals)
+                for path, totals in self.paths.items()}
+
+
+def strace_files(paths):
+    """
+    The strace output files in paths, which can be files or directories.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if os.path.isfile(os.path.join(path, name))))
+        else:
+            files.append(path)
+    return files
+
+
+def parse_strace_files(paths, bin_seconds=1.0):
+    """
+    Returns the StraceAggregator of the strace output files (or directories of them) in paths.
+    """
+    aggregator = StraceAggregator(bin_seconds)
+    files = strace_files(paths)
+    for path in files:
+        aggregator.add_process_markers_of_file(path)
+    for path in files:
+        aggregator.add_file(path)
+    return aggregator
+
+
+def phase_totals(timeline):
+    """
+    Structured array of the calls and bytes of each (thread, phase, category,
+    syscall), with the time of its first and last bin.
+    """
+    keys = timeline[["thread", "phase", "category", "syscall"]]
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+    totals = np.zeros(len(unique_keys), dtype=[("thread", "U16"), ("phase", "U32"), ("category", "U16"), ("syscall", "U16"),
+                                               ("start", "f8"), ("end", "f8"), ("calls", "i8"), ("bytes", "i8")])
+    for name in ["thread", "phase", "category", "syscall"]:
+        totals[name] = unique_keys[name]
+    totals["calls"] = np.bincount(inverse, weights=timeline["calls"], minlength=len(unique_keys))
+    totals["bytes"] = np.bincount(inverse, weights=timeline["bytes"], minlength=len(unique_keys))
+    totals["start"] = np.inf
+    np.minimum.at(totals["start"], inverse, timeline["time"])
+    totals["end"] = -np.inf
+    np.maximum.at(totals["end"], inverse, timeline["time"])
+    return totals
+
+
+def print_summary(aggregator, timeline):
+    """
+    Prints the bytes read and written per phase and category, then the paths with
+    the most bytes.
+    """
+    print("{} lines, {} not parsed, {} threads".format(aggregator.num_lines, aggregator.num_unparsed_lines,
+                                                      len(aggregator.phases)))
+
+    print("{:>8} {:16} {:12} {:10} {:>10} {:>10} {:>10} {:>16}".format(
+        "thread", "phase", "category", "syscall", "start (s)", "end (s)", "calls", "bytes"))
+    for row in phase_totals(timeline):
+        print("{:>8} {:16} {:12} {:10} {:10.1f} {:10.1f} {:10} {:16}".format(
+            row["thread"], row["phase"], row["category"], row["syscall"], row["start"], row["end"],
+            int(row["calls"]), int(row["bytes"])))
+
+    print()
+    print("{:12} {:>16} {:>16}  path".format("category", "bytes read", "bytes written"))
+    paths = sorted(aggregator.path_totals().items(), key=lambda item: -(item[1].bytes_read + item[1].bytes_written))
+    for path, totals in paths[:20]:
+        print("{:12} {:16} {:16}  {}".format(totals.category, totals.bytes_read, totals.bytes_written, path))
+
+
+def verify():
+    """
+    Parses a small trace with every kind of line the parser handles.
+    """
+    lines = [
+        b'14:02:33.000100 openat(AT_FDCWD, "/tmp/nm/output/map_0.out", O_RDONLY) = 412</tmp/nm/output/map_0.out>\n',
+        b'14:02:33.000200 read(412</tmp/nm/output/map_0.out>, "abc"..., 65536) = 65536\n',
+        b'14:02:33.000300 read(412</tmp/nm/output/map_0.out>,  <unfinished ...>\n',
+        b'14:02:33.500000 <... read resumed>"x", 65536) = 100\n',
+        b'14:02:34.000000 write(1</tmp/logs/stdout>, "writing/merging records\\n", 24) = 24\n',
+        b'14:02:34.100000 write(413</tmp/nm/output/map_0.out.merged>, "a) = 5"..., 4096) = 4096\n',
+        b'14:02:34.200000 lseek(413</tmp/nm/output/map_0.out.merged>, 0, SEEK_SET) = 0\n',
+        b'14:02:34.300000 read(414<TCP:[127.0.0.1:40710->127.0.0.1:13562]>, "", 8192) = -1 EAGAIN (Resource temporarily unavailable)\n',
+        b'14:02:35.000000 write(415<TCP:[127.0.0.1:40712->127.0.0.1:9866]>, "data", 4) = 4\n',
+        b'14:02:35.500000 write(1</tmp/logs/stdout>, "writing/merging records\\n", 24) = 24\n',
+        b'+++ exited with 0 +++\n',
+    ]
+    aggregator = StraceAggregator(bin_seconds=1.0)
+    aggregator.add_lines(lines, "123")
+    timeline = aggregator.timeline()
+    totals = {(row["phase"], row["category"], row["syscall"]): (int(row["calls"]), int(row["bytes"]))
+              for row in phase_totals(timeline)}
+
+    assert totals[INITIAL_PHASE, "map output", "openat"] == (1, 0)
+    assert totals[INITIAL_PHASE, "map output", "read"] == (2, 65636)
+    assert totals["merge 1", "log", "write"] == (1, 24)
+    assert totals["merge 1", "merged", "write"] == (1, 4096)
+    assert totals["merge 1", "merged", "lseek"] == (1, 0)
+    assert totals["merge 1", "shuffle", "read"] == (1, 0)
+    assert totals["merge 1", "hdfs", "write"] == (1, 4)
+    assert totals["merge 2", "log", "write"] == (1, 24)
+    assert aggregator.num_unparsed_lines == 1
+    assert sorted(set(timeline["time"].tolist())) == [0.0, 1.0, 2.0]
+    assert [phase for _, phase in aggregator.phases["123"]] == [INITIAL_PHASE, "merge 1", "merge 2"]
+    assert aggregator.path_totals()["/tmp/nm/output/map_0.out"] == PathTotal("map output", 3, 65636, 0)
+
+    # the main thread prints the shuffle and reduce markers, a fetcher thread prints none
+    main_lines = [
+        b'14:02:30.000000 write(1</tmp/logs/stdout>, "calling shuffleConsumerPlugin.run()\\n", 36) = 36\n',
+        b'14:02:32.000000 write(1</tmp/logs/stdout>, "writing/merging records\\n", 24) = 24\n',
+        b'14:02:33.000000 write(1</tmp/logs/stdout>, "shuffleConsumerPlugin.run() returned\\n", 37) = 37\n',
+    ]
+    fetcher_lines = [
+        b'14:02:29.000000 read(20</usr/local/hadoop/share/hadoop/common/hadoop-common.jar>, "PK", 2) = 2\n',
+        b'14:02:30.500000 read(21<TCP:[127.0.0.1:40710->127.0.0.1:13562]>, "data", 8192) = 8192\n',
+        b'14:02:31.000000 write(22</tmp/nm/output/map_1.out>, "data", 8192) = 8192\n',
+        b'14:02:32.500000 read(21<TCP:[127.0.0.1:40710->127.0.0.1:13562]>, "data", 8192) = 100\n',
+        b'14:02:34.000000 write(23<TCP:[127.0.0.1:40712->127.0.0.1:9866]>, "data", 4) = 4\n',
+    ]
+    aggregator = StraceAggregator(bin_seconds=1.0)
+    aggregator.add_process_markers(fetcher_lines)
+    aggregator.add_process_markers(main_lines)
+    aggregator.add_lines(fetcher_lines, "124")
+    aggregator.add_lines(main_lines, "123")
+    totals = {(row["thread"], row["phase"], row["category"], row["syscall"]): (int(row["calls"]), int(row["bytes"]))
+              for row in phase_totals(aggregator.timeline())}
+
+    assert aggregator.process_phases == ["shuffle", "reduce"]
+    assert totals["124", INITIAL_PHASE, "classes", "read"] == (1, 2)
+    assert totals["124", "shuffle", "shuffle", "read"] == (2, 8292)
+    assert totals["124", "shuffle", "map output", "write"] == (1, 8192)
+    assert totals["124", "reduce", "hdfs", "write"] == (1, 4)
+    assert totals["123", "merge 1", "log", "write"] == (1, 24)
+    assert totals["123", "reduce", "log", "write"] == (1, 37)
+    assert [phase for _, phase in aggregator.phases["123"]] == [INITIAL_PHASE, "shuffle", "merge 1", "reduce"]
+    print("verified")
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="I/O timeline of the strace output of a reduce task")
+    parser.add_argument("paths", nargs="*", default=["strace_output"], help="strace output files or directories")
+    parser.add_argument("--bin", type=float, default=1.0, help="seconds per bin of the timeline")
+    parser.add_argument("--save", help=".npz file to save the timeline to")
+    parser.add_argument("--verify", action="store_true", help="parse a small trace and check the totals")
+    args = parser.parse_args()
+
+    if args.verify:
+        verify()
+        sys.exit(0)
+
+    aggregator = parse_strace_files(args.paths, args.bin)
+    timeline = aggregator.timeline()
+    print_summary(aggregator, timeline)
+
+    if args.save:
+        np.savez_compressed(args.save, timeline=timeline, start_time=aggregator.start_time(), bin_seconds=args.bin)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+"""
+Profiles the map and reduce task JVMs of a job with a sampling profiler, through
+the profiling support of MapReduce (mapreduce.task.profile): the JVMs of the
+selected tasks are started with mapreduce.task.profile.params, where %s is replaced
+by a file named profile.out in the log directory of the container, which YARN then
+aggregates with the other logs. Sampling costs far less than tracing every system
+call with strace (which is turned off in the reduce task while profiling), so the
+timing of the tasks is close to that of an unprofiled run.
+
+Two profilers are available:
+    jfr     (the default) Java Flight Recorder of the OpenJDK 11 installed by the
+            Dockerfile, on which the map and reduce tasks of the job are run
+            (JAVA_HOME in mapreduce.map.env and mapreduce.reduce.env), as the
+            recordings of the Oracle JDK 8 can't be read by the JFR API of later
+            JDKs. Stacks are recorded up to 256 frames deep (instead of 64), so that
+            the deep stacks of the merges and fetchers keep their root frames. The
+            recordings are converted by JfrCollapsedStacks.java with that API.
+    hprof   the HPROF agent of the Java 8 JDK of the image, sampling the stacks of
+            running threads every 10 ms, whose text output is converted to
+            collapsed stacks here, for profiles of the JVM that runs Hadoop itself
+
+The profiles of a finished job are extracted from the output of "yarn logs", one per
+container, and converted to collapsed stacks ("frame;frame;frame count" lines, root
+first), which flamegraph.pl, speedscope and similar tools render as flame graphs.
+
+Usage:
+    ./task_profiler.py <.jfr, or profile.out of hprof> [<output.collapsed>]
+"""
+import os
+import re
+import sys
+import shlex
+import subprocess
+from collections import Counter
+
+PROFILER_PARAMS = {
+    "jfr": "-XX:FlightRecorderOptions=stackdepth=256 "
+           "-XX:StartFlightRecording=settings=profile,dumponexit=true,filename=%s",
+    "hprof": "-agentlib:hprof=cpu=samples,interval=10,depth=64,thread=y,force=n,verbose=n,file=%s",
+}
+
+# the JDK that runs the tasks profiled with JFR and reads their recordings
+JFR_JAVA_HOME = "/usr/lib/jvm/java-11-openjdk-amd64"
+JFR_COLLAPSED_STACKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "JfrCollapsedStacks.java")
+
+# extension of the profile files fetched from the logs of each profiler
+PROFILE_EXTENSIONS = {"jfr": ".jfr", "hprof": ".hprof.txt"}
+
+PROFILE_LOG_FILE = "profile.out"
+PROFILES_DIRECTORY = "/home/hadoop/profiles"
+
+# methods whose share of the samples is printed by print_hot_paths()
+HOT_PATHS = [
+    "org.apache.hadoop.mapred.MapTask$MapOutputBuffer.sortAndSpill",
+    "org.apache.hadoop.mapred.MapTask$MapOutputBuffer.mergeParts",
+    "org.apache.hadoop.mapred.Merger$MergeQueue.merge",
+    "org.apache.hadoop.mapred.Merger.writeFile",
+    "org.apache.hadoop.mapreduce.task.reduce.Fetcher.copyFromHost",
+]
+
+HPROF_TRACE = re.compile(r"^TRACE (\d+):(?: \(thread=(\d+)\))?")
+HPROF_FRAME = re.compile(r"^\t([^(]+)")
+HPROF_THREAD = re.compile(r'^THREAD START \(obj=\w+, id = (\d+), name="([^"]*)"')
+HPROF_SAMPLE = re.compile(r"^\s*\d+\s+[\d.]+%\s+[\d.]+%\s+(\d+)\s+(\d+)\s")
+
+
+def profile_properties(profiler="jfr", maps="0-1", reduces="0-1"):
+    """
+    Job properties that profile the map and reduce tasks in the given ranges
+    (e.g. "0-2", or "" for none) with profiler.
+    """
+    properties = {
+        "mapreduce.task.profile": "true",
+        "mapreduce.task.profile.maps": maps,
+        "mapreduce.task.profile.reduces": reduces,
+        "mapreduce.task.profile.params": PROFILER_PARAMS[profiler],
+        # the reduce task doesn't attach strace to itself (see ReduceTask.run())
+        "mapreduce.reduce.strace": "false",
+    }
+    if profiler == "jfr":
+        properties["mapreduce.map.env"] = properties["mapreduce.reduce.env"] = "JAVA_HOME=" + JFR_JAVA_HOME
+
+    return properties
+
+
+def profile_options(profiler="jfr", maps="0-1", reduces="0-1"):
+    """
+    profile_properties() as "-D property=value" options of a "hadoop jar" command,
+    quoted for the shell.
+    """
+    return " ".join("-D " + shlex.quote("{}={}".format(property, value))
+                    for property, value in profile_properties(profiler, maps, reduces).items())
+
+
+def split_log_files(logs, log_file=PROFILE_LOG_FILE):
+    """
+    Returns {container id: contents} of the log files named log_file in the output
+    of "yarn logs". The contents are cut using the LogLength of each header, as they
+    can be binary (JFR recordings).
+    """
+    files = {}
+    header = "\nLogType:{}\n".format(log_file).encode()
+    position = logs.find(header)
+
+    while position != -1:
+        length_line = logs.find(b"LogLength:", position)
+        contents = logs.find(b"LogContents:\n", length_line) + len(b"LogContents:\n")
+        length = int(logs[length_line + len(b"LogLength:"):logs.find(b"\n", length_line)])
+
+        container_line = logs.rfind(b"Container: ", 0, position)
+        container = logs[container_line:logs.find(b"\n", container_line)].decode().split()[1] if container_line != -1 else ""
+        files[container] = logs[contents:contents + length]
+        position = logs.find(header, contents + length)
+
+    return files
+
+
+def yarn_fetch_profiles(application_id, profiler="jfr", directory=PROFILES_DIRECTORY):
+    """
+    Writes the profile of every profiled container of a finished application (whose
+    logs have been aggregated, see util.yarn_wait_for_logs()) to directory, as
+    <container id><extension>, and returns their paths.
+    """
+    import util
+
+    logs = util.execute_command("{} logs -applicationId {} -appOwner hadoop -log_files {}".format(
+        util.YARN, application_id, PROFILE_LOG_FILE), stderr=subprocess.DEVNULL)
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for container, contents in sorted(split_log_files(logs).items()):
+        path = os.path.join(directory, container + PROFILE_EXTENSIONS[profiler])
+        with open(path, "wb") as f:
+            f.write(contents)
+        paths.append(path)
+
+    return paths
+
+
+def hprof_collapsed_stacks(lines):
+    """
+    Counter of the collapsed stacks ("thread;frame;...;frame", root first) sampled
+    in the text output of HPROF with cpu=samples.
+    """
+    thread_names = {}
+    traces = {}
+    stacks = Counter()
+    trace = None
+    in_samples = False
+
+    for line in lines:
+        if in_samples:
+            sample = HPROF_SAMPLE.match(line)
+            if sample:
+                count, trace_id = sample.groups()
+                thread, frames = traces.get(trace_id, ("", []))
+                stack = [thread_names.get(thread, "thread " + thread)] if thread else []
+                stacks[";".join(stack + (frames[::-1] or ["<empty>"]))] += int(count)
+            elif line.startswith("CPU SAMPLES END"):
+                in_samples = False
+            continue
+
+        frame = HPROF_FRAME.match(line)
+        if frame and trace is not None:
+            traces[trace][1].append(frame.group(1))
+            continue
+
+        trace = None
+        match = HPROF_TRACE.match(line)
+        if match:
+            trace = match.group(1)
+            traces[trace] = (match.group(2) or "", [])
+        elif line.startswith("THREAD START"):
+            thread = HPROF_THREAD.match(line)
+            if thread:
+                thread_names[thread.group(1)] = thread.group(2)
+        elif line.startswith("CPU SAMPLES BEGIN"):
+            in_samples = True
+
+    return stacks
+
+
+def jfr_collapsed_stacks(recording, java_home=JFR_JAVA_HOME):
+    """
+    Counter of the collapsed stacks of the execution samples of a JFR recording,
+    printed by JfrCollapsedStacks.java, which is run from source by the java of
+    java_home (JDK 11 or later).
+    """
+    java = os.path.join(java_home, "bin", "java")
+    if not os.path.exists(java):
+        raise FileNotFoundError("{} (JDK 11 or later) is needed to read {}".format(java, recording))
+
+    output = subprocess.check_output([java, JFR_COLLAPSED_STACKS, recording])
+    return read_collapsed_stacks(output.decode().splitlines())
+
+
+def read_collapsed_stacks(lines):
+    """
+    Counter of collapsed stack lines ("frame;...;frame count").
+    """
+    stacks = Counter()
+    for line in lines:
+        if line.strip():
+            stack, count = line.rstrip("\n").rsplit(" ", 1)
+            stacks[stack] += int(count)
+    return stacks
+
+
+def collapsed_stacks(path):
+    """
+    Counter of the collapsed stacks of a profile, a JFR recording if path ends with
+    ".jfr" and the text output of HPROF otherwise.
+    """
+    if path.endswith(".jfr"):
+        return jfr_collapsed_stacks(path)
+
+    with open(path, errors="replace") as lines:
+        return hprof_collapsed_stacks(lines)
+
+
+def write_collapsed_stacks(stacks, path):
+    with open(path, "w") as f:
+        for stack, count in sorted(stacks.items()):
+            f.write("{} {}\n".format(stack, count))
+
+
+def print_hot_paths(stacks, hot_paths=HOT_PATHS, top=15):
+    """
+    Prints the methods with the most samples at the top of the stack, then the share
+    of the samples spent in (or under) each of hot_paths.
+    """
+    total = sum(stacks.values())
+    if total == 0:
+        print("no samples")
+        return
+
+    self_samples = Counter()
+    for stack, count in stacks.items():
+        self_samples[stack.rsplit(";", 1)[-1]] += count
+
+    print("{:>8} {:>7}  method".format("samples", "self"))
+    for method, count in self_samples.most_common(top):
+        print("{:8} {:6.1f}%  {}".format(count, 100 * count / total, method))
+
+    print("{:>8} {:>7}  hot path".format("samples", "total"))
+    for hot_path in hot_paths:
+        count = sum(count for stack, count in stacks.items() if hot_path in stack.split(";"))
+        print("{:8} {:6.1f}%  {}".format(count, 100 * count / total, hot_path))
+
+
+def convert_profiles(paths):
+    """
+    Writes the collapsed stacks of every profile next to it (<profile>.collapsed),
+    prints their hot paths and returns the paths of the collapsed stack files.
+    """
+    collapsed_paths = []
+    for path in paths:
+        print(path)
+        try:
+            stacks = collapsed_stacks(path)
+        except (OSError, subprocess.CalledProcessError, ValueError) as e:
+            print("unable to convert {}: {}".format(path, e))
+            continue
+
+        collapsed_path = path + ".collapsed"
+        write_collapsed_stacks(stacks, collapsed_path)
+        collapsed_paths.append(collapsed_path)
+        print_hot_paths(stacks)
+
+    return collapsed_paths
+
+
+def verify():
+    """
+    Converts a small HPROF output and reads collapsed stacks like those printed by
+    JfrCollapsedStacks.java.
+    """
+    hprof = [
+        'THREAD START (obj=50000170, id = 200001, name="main", group="main")\n',
+        'TRACE 300001: (thread=200001)\n',
+        '\torg.apache.hadoop.mapred.IFile$Writer.append(IFile.java:220)\n',
+        '\torg.apache.hadoop.mapred.MapTask$MapOutputBuffer.sortAndSpill(MapTask.java:1660)\n',
+        'TRACE 300002: (thread=200001)\n',
+        '\torg.apache.hadoop.util.QuickSort.sortInternal(QuickSort.java:Unknown line)\n',
+        '\torg.apache.hadoop.mapred.MapTask$MapOutputBuffer.sortAndSpill(MapTask.java:1625)\n',
+        'CPU SAMPLES BEGIN (total = 10) Fri Jul 12 01:14:37 2019\n',
+        'rank   self  accum   count trace method\n',
+        '   1 70.00% 70.00%       7 300002 org.apache.hadoop.util.QuickSort.sortInternal\n',
+        '   2 30.00% 100.00%      3 300001 org.apache.hadoop.mapred.IFile$Writer.append\n',
+        'CPU SAMPLES END\n',
+    ]
+    assert hprof_collapsed_stacks(hprof) == {
+        "main;org.apache.hadoop.mapred.MapTask$MapOutputBuffer.sortAndSpill;org.apache.hadoop.util.QuickSort.sortInternal": 7,
+        "main;org.apache.hadoop.mapred.MapTask$MapOutputBuffer.sortAndSpill;org.apache.hadoop.mapred.IFile$Writer.append": 3,
+    }
+
+    collapsed = ["main;org.apache.hadoop.mapred.ReduceTask.run;org.apache.hadoop.mapred.Merger.writeFile 2\n",
+                 "fetcher#1;org.apache.hadoop.mapreduce.task.reduce.Fetcher.run 1\n", "\n",
+                 "main;org.apache.hadoop.mapred.ReduceTask.run;org.apache.hadoop.mapred.Merger.writeFile 3\n"]
+    assert read_collapsed_stacks(collapsed) == {
+        "main;org.apache.hadoop.mapred.ReduceTask.run;org.apache.hadoop.mapred.Merger.writeFile": 5,
+        "fetcher#1;org.apache.hadoop.mapreduce.task.reduce.Fetcher.run": 1}
+
+    logs = (b"Container: container_1_0001_01_000002 on node_1\nLogAggregationType: AGGREGATED\n====\n"
+            b"LogType:profile.out\nLogLastModifiedTime:Fri Jul 12 01:14:37 +0000 2019\nLogLength:7\nLogContents:\n"
+            b"FLR\x00\nLo\nEnd of LogType:profile.out\n")
+    assert split_log_files(logs) == {"container_1_0001_01_000002": b"FLR\x00\nLo"}
+    print("verified")
+
+
+if __name__=="__main__":
+    if len(sys.argv) < 2:
+        print("usage: {} <.jfr, or profile.out of hprof> [<output.collapsed>] | --verify".format(sys.argv[0]))
+        sys.exit(1)
+
+    if sys.argv[1] == "--verify":
+        verify()
+        sys.exit(0)
+
+    stacks = collapsed_stacks(sys.argv[1])
+    print_hot_paths(stacks)
+    if len(sys.argv) > 2:
+        write_collapsed_stacks(stacks, sys.argv[2])
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+
+"""
+Renders the events of a job, the log events extracted by merge_events.py and the
+I/O timeline of a reduce task parsed by reduce_merge_parts/strace_parser.py, as a
+timeline in a single HTML file: one lane per kind of event (shuffle fetches,
+in-memory merges, on-disk merges, merge passes...) and container, one lane per kind
+of file read or written by the reduce task, and the merge phases of its threads.
+
+Lanes are downsampled to a fixed number of columns before anything is drawn: the
+events of a lane are counted per column (np.bincount), intervals such as merges are
+turned into the number of merges running during each column, and consecutive
+columns with the same value are drawn as a single rectangle. So the size of the page
+depends on the number of lanes and columns, not on the number of events, and traces
+of millions of events render as fast as small ones. Hovering a rectangle shows its
+time range and totals, the mouse wheel zooms in and out and dragging pans.
+
+Log timestamps are converted to the time of day to be aligned with the -tt
+timestamps of strace (which have no date), so runs spanning midnight are not aligned.
+
+Usage:
+    ./timeline.py [--events <events.npz or .parquet>] [--strace <timeline.npz>] [-o timeline.html] [--columns N]
+"""
+import sys
+import html
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+# these modules will be placed in the same directory as this file by Dockerfile 'COPY'
+import merge_events
+
+# lanes of log events: name, kind, and either the events counted per column ("points")
+# or the events that start and end each interval, paired in order ("intervals")
+LogLane = namedtuple("LogLane", ["name", "kind", "events"])
+
+LOG_LANES = [
+    LogLane("spills", "points", ["spill"]),
+    LogLane("shuffle fetches", "points", ["fetch", "shuffle_to_disk"]),
+    LogLane("shuffled bytes", "bytes", ["read_to_memory", "read_to_disk"]),
+    LogLane("in-memory merges", "intervals", ["in_memory_merge", "in_memory_merge_complete"]),
+    LogLane("on-disk merges", "intervals", ["on_disk_merge", "on_disk_merge_complete"]),
+    LogLane("merge passes", "points", ["merge", "merge_pass", "intermediate_merge", "last_merge_pass"]),
+    LogLane("final merge", "points", ["final_merge", "final_merge_memory_to_disk", "final_merge_keep_in_memory",
+                                      "final_merge_from_disk", "final_merge_from_memory"]),
+]
+
+# a lane ready to be drawn: values has one value per column, kind is "points",
+# "bytes", "intervals" or "phases" (then values are indices in labels)
+Lane = namedtuple("Lane", ["name", "kind", "values", "labels"])
+
+COLORS = {
+    "points": "#4c72b0",
+    "bytes": "#55a868",
+    "intervals": "#c44e52",
+    "read": "#55a868",
+    "write": "#dd8452",
+}
+PHASE_COLORS = {"unmarked": "#dddddd", "shuffle": "#8172b2", "merge": "#c44e52", "reduce": "#55a868"}
+
+LANE_HEIGHT = 22
+LANE_GAP = 6
+LABEL_WIDTH = 300
+AXIS_HEIGHT = 30
+
+
+def log_event_times(events):
+    """
+    Seconds since midnight of the timestamps of events, to be compared with the
+    times of strace.
+    """
+    return (events["timestamp"] % 86400000) / 1000.0
+
+
+def columns_of(times, start, end, num_columns):
+    """
+    Column of each time in [start, end) divided in num_columns columns.
+    """
+    columns = ((np.asarray(times, dtype=np.float64) - start) * (num_columns / max(end - start, 1e-9))).astype(np.int64)
+    return np.clip(columns, 0, num_columns - 1)
+
+
+def count_per_column(times, start, end, num_columns, weights=None):
+    return np.bincount(columns_of(times, start, end, num_columns), weights=weights, minlength=num_columns)
+
+
+def intervals_per_column(starts, ends, start, end, num_columns):
+    """
+    Number of intervals [starts[i], ends[i]] overlapping each column: +1 in the
+    column an interval starts, -1 in the column after it ends, summed once.
+    """
+    difference = np.zeros(num_columns + 1, dtype=np.int64)
+    np.add.at(difference, columns_of(starts, start, end, num_columns), 1)
+    np.add.at(difference, columns_of(ends, start, end, num_columns) + 1, -1)
+    return np.cumsum(difference)[:num_columns]
+
+
+def pair_intervals(times, is_start):
+    """
+    Pairs the i-th start with the i-th end (the merge threads run one merge at a
+    time); a start without an end lasts until the last time.
+    """
+    starts = times[is_start]
+    ends = times[~is_start]
+    last = times.max() if len(times) else 0.0
+    return starts, np.concatenate((ends[:len(starts)], np.full(max(len(starts) - len(ends), 0), last)))
+
+
+def factorize(strings):
+    """
+    (distinct strings in order of first appearance, index of each string in them),
+    with a dict rather than np.unique, which sorts the strings.
+    """
+    indices = {}
+    codes = np.fromiter((indices.setdefault(string, len(indices)) for string in strings.tolist()),
+                        dtype=np.int64, count=len(strings))
+    return np.array(sorted(indices, key=indices.get), dtype=strings.dtype), codes
+
+
+def log_lanes(events, start, end, num_columns):
+    """
+    Lanes of the log events (of merge_events.EVENT_DTYPE), per container.
+    """
+    lanes = []
+    times = log_event_times(events)
+    # compare integer codes rather than the strings of millions of events
+    event_names, event_codes = factorize(events["event"])
+    containers, container_codes = factorize(events["container"])
+
+    for container_code, container in sorted(enumerate(containers), key=lambda item: item[1]):
+        in_container = container_codes == container_code
+        for lane in LOG_LANES:
+            lane_codes = np.flatnonzero(np.isin(event_names, lane.events))
+            selected = in_container & np.isin(event_codes, lane_codes)
+            if not selected.any():
+                continue
+
+            name = "{} {}".format(container[-6:] if container else "", lane.name).strip()
+            if lane.kind == "intervals":
+                is_start = np.isin(event_codes[selected], np.flatnonzero(event_names == lane.events[0]))
+                starts, ends = pair_intervals(times[selected], is_start)
+                values = intervals_per_column(starts, ends, start, end, num_columns)
+            elif lane.kind == "bytes":
+                values = count_per_column(times[selected], start, end, num_columns, np.maximum(events["bytes"][selected], 0))
+            else:
+                values = count_per_column(times[selected], start, end, num_columns)
+            lanes.append(Lane(name, lane.kind, values, None))
+
+    return lanes
+
+
+def strace_lanes(timeline, strace_start, bin_seconds, start, end, num_columns):
+    """
+    Lanes of the strace timeline (of strace_parser.TIMELINE_DTYPE): the bytes read
+    and written per category of file, and the phases of each thread.
+    """
+    lanes = []
+    times = timeline["time"] + strace_start
+    is_read = np.isin(timeline["syscall"], ["read", "pread64", "readv", "preadv"])
+    is_write = np.isin(timeline["syscall"], ["write", "pwrite64", "writev", "pwritev"])
+
+    for category in np.unique(timeline["category"]):
+        in_category = timeline["category"] == category
+        for name, selected in [("read", in_category & is_read), ("write", in_category & is_write)]:
+            if timeline["bytes"][selected].sum() > 0:
+                values = count_per_column(times[selected], start, end, num_columns, timeline["bytes"][selected])
+                lanes.append(Lane("strace {} {}".format(category, name), name, values, None))
+
+    for thread in np.unique(timeline["thread"]):
+        rows = timeline[timeline["thread"] == thread]
+        labels, inverse = np.unique(rows["phase"], return_inverse=True)
+        if len(labels) < 2:
+            continue
+
+        # a phase lasts from its first bin to the end of its last bin
+        phase_starts = np.full(len(labels), np.inf)
+        np.minimum.at(phase_starts, inverse, rows["time"] + strace_start)
+        phase_ends = np.full(len(labels), -np.inf)
+        np.maximum.at(phase_ends, inverse, rows["time"] + strace_start + bin_seconds)
+
+        # the phase of a column is the last phase that started before the column ends
+        order = np.argsort(phase_starts, kind="mergesort")
+        column_ends = start + (np.arange(num_columns) + 1) * (end - start) / num_columns
+        latest = np.searchsorted(phase_starts[order], column_ends, side="left") - 1
+        values = np.where(latest >= 0, order[np.maximum(latest, 0)], -1)
+        # no phase after the end of the last one
+        values[column_ends - (end - start) / num_columns >= phase_ends.max()] = -1
+        lanes.append(Lane("thread {} phases".format(thread), "phases", values, list(labels)))
+
+    return lanes
+
+
+def runs(values):
+    """
+    (first column, number of columns, value) of each run of equal values.
+    """
+    values = np.asarray(values)
+    if len(values) == 0:
+        return []
+    boundaries = np.flatnonzero(values[1:] != values[:-1]) + 1
+    firsts = np.concatenate(([0], boundaries))
+    lengths = np.diff(np.concatenate((firsts, [len(values)])))
+    return zip(firsts.tolist(), lengths.tolist(), values[firsts].tolist())
+
+
+def format_quantity(value, kind):
+    if kind in ("bytes", "read", "write"):
+        for unit in ["B", "KiB", "MiB", "GiB"]:
+            if value < 1024 or unit == "GiB":
+                return "{:.1f} {}".format(value, unit)
+            value /= 1024
+    if kind == "intervals":
+        return "{} running".format(int(value))
+    return "{} events".format(int(value))
+
+
+def lane_svg(lane, y, seconds_per_column, start):
+    """
+    SVG rectangles of a lane, one per run of columns with the same (quantized) value,
+    each with a tooltip. Bars of "points" and "bytes" lanes are as high as the
+    value of their column relative to the maximum of the lane, intervals are
+    darker the more of them overlap.
+    """
+    elements = []
+    if lane.kind in ("phases", "intervals"):
+        quantized = lane.values
+    else:
+        maximum = max(float(np.max(lane.values)), 1e-9)
+        quantized = np.ceil(lane.values / maximum * LANE_HEIGHT).astype(np.int64)
+
+    for first, length, level in runs(quantized):
+        # no event in these columns, or no phase
+        if level < 0 or (level == 0 and lane.kind != "phases"):
+            continue
+
+        begin = start + first * seconds_per_column
+        time_range = "{:.3f} s - {:.3f} s".format(begin, begin + length * seconds_per_column)
+        if lane.kind == "phases":
+            label = lane.labels[level]
+            color = PHASE_COLORS.get(label.split()[0], "#999999")
+            title = "{}: {}".format(label, time_range)
+            height = LANE_HEIGHT
+        else:
+            values = lane.values[first:first + length]
+            total = values.sum() if lane.kind != "intervals" else values.max()
+            color = COLORS[lane.kind]
+            title = "{}: {} ({})".format(lane.name, format_quantity(total, lane.kind), time_range)
+            height = LANE_HEIGHT if lane.kind == "intervals" else level
+
+        elements.append('<rect x="{}" y="{}" width="{}" height="{}" fill="{}"{}><title>{}</title></rect>'.format(
+            first, y + LANE_HEIGHT - height, length, height, color,
+            ' fill-opacity="{:.2f}"'.format(min(1.0, 0.4 + 0.2 * level)) if lane.kind == "intervals" else "",
+            html.escape(title)))
+
+    return elements
+
+
+def axis_ticks(start, end, num_ticks=10):
+    """
+    Round tick times between start and end, relative to start.
+    """
+    duration = max(end - start, 1e-9)
+    step = 10 ** np.floor(np.log10(duration / num_ticks))
+    for multiple in [1, 2, 5, 10]:
+        if duration / (step * multiple) <= num_ticks:
+            step *= multiple
+            break
+    return np.arange(0, duration + step / 2, step)
+
+
+def render_html(lanes, start, end, num_columns, title="timeline"):
+    """
+    HTML page of the lanes: a label column and a plot, whose horizontal viewBox the
+    script changes to zoom and pan.
+    """
+    height = AXIS_HEIGHT + len(lanes) * (LANE_HEIGHT + LANE_GAP)
+    seconds_per_column = (end - start) / num_columns
+
+    labels = []
+    plot = []
+    for i, lane in enumerate(lanes):
+        y = AXIS_HEIGHT + i * (LANE_HEIGHT + LANE_GAP)
+        labels.append('<text x="{}" y="{}" text-anchor="end" font-size="12">{}</text>'.format(
+            LABEL_WIDTH - 8, y + LANE_HEIGHT - 6, html.escape(lane.name)))
+        plot.append('<line x1="0" x2="{}" y1="{}" y2="{}" stroke="#eeeeee" vector-effect="non-scaling-stroke"/>'.format(
+            num_columns, y + LANE_HEIGHT, y + LANE_HEIGHT))
+        plot.extend(lane_svg(lane, y, seconds_per_column, 0.0))
+
+    ticks = []
+    for tick in axis_ticks(start, end).tolist():
+        column = tick / seconds_per_column
+        plot.append('<line x1="{0}" x2="{0}" y1="{1}" y2="{2}" stroke="#cccccc" vector-effect="non-scaling-stroke"/>'.format(
+            column, AXIS_HEIGHT - 5, height))
+        ticks.append('<text class="tick" data-column="{}" y="{}" font-size="11" text-anchor="middle">{:g} s</text>'.format(
+            column, AXIS_HEIGHT - 10, tick))
+
+    return TEMPLATE.format(title=html.escape(title), width=LABEL_WIDTH + num_columns, height=height,
+                           label_width=LABEL_WIDTH, num_columns=num_columns,
+                           labels="\n".join(labels), ticks="\n".join(ticks), plot="\n".join(plot))
+
+
+TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body style="font-family: sans-serif">
+<h3>{title}</h3>
+<p>Scroll to zoom, drag to pan, hover for totals.</p>
+<svg id="timeline" width="{width}" height="{height}">
+<g>{labels}</g>
+<g id="ticks">{ticks}</g>
+<svg id="plot" x="{label_width}" width="{num_columns}" height="{height}" viewBox="0 0 {num_columns} {height}" preserveAspectRatio="none">
+{plot}
+</svg>
+</svg>
+<script>
+var plot = document.getElementById("plot"), total = {num_columns}, height = {height}, labelWidth = {label_width};
+var view = {{x: 0, width: total}}, drag = null;
+function update() {{
+  plot.setAttribute("viewBox", view.x + " 0 " + view.width + " " + height);
+  document.querySelectorAll(".tick").forEach(function (tick) {{
+    var x = (tick.getAttribute("data-column") - view.x) / view.width * total;
+    tick.setAttribute("x", labelWidth + x);
+    tick.style.display = x < 0 || x > total ? "none" : "";
+  }});
+}}
+plot.addEventListener("wheel", function (event) {{
+  event.preventDefault();
+  var at = view.x + (event.clientX - plot.getBoundingClientRect().left) / total * view.width;
+  var width = Math.min(total, Math.max(total / 1000, view.width * (event.deltaY > 0 ? 1.25 : 0.8)));
+  view.x = Math.min(total - width, Math.max(0, at - (at - view.x) * width / view.width));
+  view.width = width;
+  update();
+}});
+plot.addEventListener("mousedown", function (event) {{ drag = {{x: event.clientX, viewX: view.x}}; }});
+window.addEventListener("mouseup", function () {{ drag = null; }});
+window.addEventListener("mousemove", function (event) {{
+  if (!drag) return;
+  view.x = Math.min(total - view.width, Math.max(0, drag.viewX - (event.clientX - drag.x) / total * view.width));
+  update();
+}});
+update();
+</script>
+</body>
+</html>
+"""
+
+
+def render_timeline(events=None, strace=None, num_columns=1000, title="timeline"):
+    """
+    HTML timeline of a table of log events (merge_events.EVENT_DTYPE) and/or of a
+    strace timeline, given as (timeline, start time, bin seconds) as saved by
+    strace_parser.py.
+    """
+    starts, ends = [], []
+    if events is not None and len(events):
+        times = log_event_times(events)
+        starts.append(times.min())
+        ends.append(times.max())
+    if strace is not None and len(strace[0]):
+        timeline, strace_start, bin_seconds = strace
+        starts.append(strace_start + timeline["time"].min())
+        ends.append(strace_start + timeline["time"].max() + bin_seconds)
+    if not starts:
+        raise ValueError("no events to render")
+
+    start, end = min(starts), max(ends)
+    end = max(end, start + 1e-3)
+
+    lanes = []
+    if events is not None and len(events):
+        lanes.extend(log_lanes(events, start, end, num_columns))
+    if strace is not None and len(strace[0]):
+        lanes.extend(strace_lanes(strace[0], strace[1], strace[2], start, end, num_columns))
+
+    return render_html(lanes, start, end, num_columns, title)
+
+
+def load_strace_timeline(path):
+    """
+    (timeline, start time, bin seconds) saved by strace_parser.py --save.
+    """
+    with np.load(path) as table:
+        return table["timeline"], float(table["start_time"]), float(table["bin_seconds"])
+
+
+def benchmark(num_events):
+    """
+    Renders num_events synthetic log events and prints how long it took and the size
+    of the page, which doesn't grow with num_events.
+    """
+    import time
+
+    rng = np.random.RandomState(0)
+    events = np.zeros(num_events, dtype=merge_events.EVENT_DTYPE)
+    events["timestamp"] = 1560726921000 + np.sort(rng.randint(0, 600000, num_events))
+    events["container"] = rng.choice(["container_1_0001_01_000002", "container_1_0001_01_000003"], num_events)
+    events["event"] = rng.choice(["fetch", "read_to_memory", "in_memory_merge", "in_memory_merge_complete",
+                                  "merge_pass", "spill"], num_events)
+    events["bytes"] = rng.randint(0, 1 << 20, num_events)
+
+    start = time.perf_counter()
+    page = render_timeline(events, num_columns=1000)
+    print("{} events: rendered in {:.2f} s, {} KiB".format(num_events, time.perf_counter() - start, len(page) // 1024))
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="HTML timeline of the log events and strace I/O of a job")
+    parser.add_argument("--events", help="table of log events saved by merge_events.py")
+    parser.add_argument("--strace", help="timeline saved by strace_parser.py --save")
+    parser.add_argument("-o", "--output", default="timeline.html")
+    parser.add_argument("--columns", type=int, default=1000, help="columns each lane is downsampled to")
+    parser.add_argument("--benchmark", type=int, metavar="NUM_EVENTS", help="render synthetic events")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        sys.exit(0)
+
+    if not args.events and not args.strace:
+        parser.error("--events and/or --strace is required")
+
+    events = merge_events.load_events(args.events) if args.events else None
+    strace = load_strace_timeline(args.strace) if args.strace else None
+
+    with open(args.output, "w") as f:
+        f.write(render_timeline(events, strace, args.columns, title=args.events or args.strace))
+    print("timeline written to {}".format(args.output))
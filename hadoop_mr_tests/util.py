@@ -5,6 +5,21 @@ import subprocess
 import shutil
 import re
 import datetime
+import time
+import json
+import uuid
+import atexit
+import threading
+import urllib.request
+import urllib.error
+from collections import namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# these modules will be placed in the same directory as this file by Dockerfile 'COPY'
+import input_generator
+import log4j_parser
+import hadoop_configuration
+import webhdfs
 
 def print_purple(a, **kwargs): print("\033[95m{}\033[00m".format(a), **kwargs)
 def print_red(a, **kwargs): print("\033[91m{}\033[00m".format(a), **kwargs)
@@ -16,11 +31,76 @@ def bytes_to_MiB(bytes): return bytes / (1024 * 1024)
 # the directory to write any input files to before they are added to HDFS
 INPUT_DIRECTORY = "/home/hadoop/input"
 
+# the HDFS directory, relative to /user/hadoop, that jobs read their input from
+HDFS_INPUT_DIRECTORY = "input"
+
+# prefix of the lines printed by print_result(), used by parallel_runner.py to
+# collect results from the output of a test container
+RESULT_PREFIX = "RESULT: "
+
 # paths to hadoop java apps
 HADOOP_HOME = "/usr/local/hadoop"
 HADOOP = HADOOP_HOME + "/bin/hadoop"
 HDFS = HADOOP_HOME + "/bin/hdfs"
 YARN = HADOOP_HOME + "/bin/yarn"
+JPS = "/usr/local/java/bin/jps"
+
+# base url of the ResourceManager REST API
+RESOURCE_MANAGER_URL = "http://localhost:8088/ws/v1/cluster"
+
+# once an application is in one of these states, it won't change anymore
+YARN_FINAL_APPLICATION_STATES = {"FINISHED", "FAILED", "KILLED"}
+
+# log aggregation statuses after which no more logs will be aggregated
+YARN_FINAL_LOG_AGGREGATION_STATUSES = {"DISABLED", "SUCCEEDED", "FAILED", "TIME_OUT"}
+
+# the daemons that make up a pseudodistributed cluster and the commands
+# used to (re)start each one of them individually
+HADOOP_DAEMONS = {
+    "NameNode": HDFS + " --daemon start namenode",
+    "DataNode": HDFS + " --daemon start datanode",
+    "SecondaryNameNode": HDFS + " --daemon start secondarynamenode",
+    "ResourceManager": YARN + " --daemon start resourcemanager",
+    "NodeManager": YARN + " --daemon start nodemanager"
+}
+
+def get_test_cases(TestCase, default_test_cases):
+    """
+    Returns the test cases passed to a run_test.py script as a json list of objects
+    in its first command line argument (this is how parallel_runner.py assigns cases to
+    a container), each converted to the namedtuple TestCase. Raises ValueError if a
+    case misses a field of TestCase or has one that TestCase doesn't have, rather than
+    letting the test fail later on a None. If no argument is given, default_test_cases
+    is returned.
+    """
+    if len(sys.argv) < 2:
+        return default_test_cases
+
+    test_cases = json.loads(sys.argv[1])
+    for test_case in test_cases:
+        missing = [field for field in TestCase._fields if field not in test_case]
+        unknown = [field for field in test_case if field not in TestCase._fields]
+        if missing or unknown:
+            raise ValueError("test case {} doesn't match the fields of {}: missing {}, unknown {}".format(
+                test_case, TestCase.__name__, missing, unknown))
+
+    return [TestCase(**test_case) for test_case in test_cases]
+
+
+def print_result(result):
+    """
+    Prints the namedtuple result as a single json line prefixed with RESULT_PREFIX
+    so that it can be parsed from the test output with parse_results().
+    """
+    print(RESULT_PREFIX + json.dumps(result._asdict()), flush=True)
+
+
+def parse_results(output):
+    """
+    Returns the list of results (as dicts) printed with print_result() in output.
+    """
+    return [json.loads(line[len(RESULT_PREFIX):]) for line in output.splitlines() if line.startswith(RESULT_PREFIX)]
+
 
 def make_input_directory():
     """
@@ -38,97 +118,283 @@ def make_input_directory():
         print("Script failed..")
         sys.exit()
 
-def hdfs_generate_custom_word_files(*word_lists):
+# WebHDFS client used for HDFS operations instead of "hdfs dfs", created on first use
+WEBHDFS_CLIENT = None
+
+
+def get_webhdfs_client():
+    """
+    Returns the WebHdfsClient, acting as the hadoop user, that is shared by every
+    HDFS operation (and its pool of connections to the NameNode and the DataNode).
+    """
+    global WEBHDFS_CLIENT
+    if WEBHDFS_CLIENT is None:
+        WEBHDFS_CLIENT = webhdfs.WebHdfsClient(user="hadoop")
+    return WEBHDFS_CLIENT
+
+
+def hdfs_put_chunks(chunks, hdfs_path):
+    """
+    Streams the bytes yielded by chunks into the file hdfs_path in HDFS with a
+    WebHDFS CREATE request, so nothing is written to local disk and no JVM is
+    started. Returns the number of bytes uploaded.
+    """
+    print_purple("webhdfs: ", end='')
+    print("CREATE " + hdfs_path)
+
+    return get_webhdfs_client().create(hdfs_path, chunks)
+
+
+def hdfs_put_chunks_with_cli(chunks, hdfs_path):
+    """
+    Same as hdfs_put_chunks() but pipes the chunks into "hdfs dfs -put - hdfs_path".
+    Returns the number of bytes uploaded.
+    """
+    command = HDFS + " dfs -put - " + hdfs_path
+    print_purple("executing: ", end='')
+    print(command)
+
+    process = subprocess.Popen(["su", "hadoop", "-c", command], stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    num_bytes = 0
+    for chunk in chunks:
+        process.stdin.write(chunk)
+        num_bytes += len(chunk)
+
+    process.stdin.close()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+    return num_bytes
+
+
+def hdfs_put_files(files, num_concurrent_uploads=1):
+    """
+    Given a list of (file name, chunks) pairs, streams each file into
+    HDFS_INPUT_DIRECTORY in HDFS with hdfs_put_chunks(), uploading up to
+    num_concurrent_uploads files at a time. Returns the number of bytes uploaded
+    for each file.
+    """
+    get_webhdfs_client().mkdirs(HDFS_INPUT_DIRECTORY)
+
+    with ThreadPoolExecutor(max_workers=num_concurrent_uploads) as executor:
+        uploads = [executor.submit(hdfs_put_chunks, chunks, HDFS_INPUT_DIRECTORY + "/" + file_name) for file_name, chunks in files]
+        return [upload.result() for upload in uploads]
+
+
+def hdfs_generate_custom_word_files(*word_lists, num_concurrent_uploads=1):
     """
     Given a list of list of strings, generates a file with the contents
     of each list and adds them to HDFS. For example,
     calling hdfs_generate_word_files([["ab", "cd"], ["ef", "gh"]])
-    will add two files with the contents "ab\ncd\n" and "ef\n\gh\n"
-    respectively to hdfs.
+    will add two files with the contents "ab\ncd" and "ef\ngh"
+    respectively to hdfs. The inner lists can also be generators, in which
+    case the words are never held in memory all at once. The files are streamed
+    straight into HDFS, num_concurrent_uploads at a time.
     """
-    make_input_directory()
-
-    # create the file
+    # create the files
     print_red("generating word {} file(s)".format(len(*word_lists)))
 
-    os.chdir(INPUT_DIRECTORY)
-    for file_num, word_list in enumerate(*word_lists):
-        FILE = "input_file_{}".format(file_num)
-        with open(FILE, "w") as f:
-            words = "\n".join(word_list)
-            for word in words:
-                f.write(word)
-
-        print("Generated {} with {} words".format(FILE, len(word_list)))
+    files = [("input_file_{}".format(file_num), input_generator.word_list_chunks(word_list))
+                for file_num, word_list in enumerate(*word_lists)]
 
-    # add the file to hdfs
-    generate_input = execute_command(HDFS + " dfs -put " + INPUT_DIRECTORY, stderr=subprocess.DEVNULL)
-    print(generate_input.decode())
+    for (FILE, _), num_bytes in zip(files, hdfs_put_files(files, num_concurrent_uploads)):
+        print("Generated {} with {} bytes".format(FILE, num_bytes))
 
 def hdfs_generate_word_file(num_characters_per_word, num_words):
     """
     Generates a single file named "input_file" containing num_words number of words
-    where each character contains num_characters_per_word number of characters (not including \n) in
-    INPUT_DIRECTORY, then adds this file to HDFS.
+    where each character contains num_characters_per_word number of characters (not including \n)
+    and streams it into HDFS_INPUT_DIRECTORY in HDFS.
     For example, calling "path = generate_character_file(2,2)" will generate a file
-    INPUT_DIRECTORY/input_file with the contents "rr\\nrr\\n", then place it in HDFS.
+    input/input_file with the contents "rr\\nrr\\n" in HDFS.
     """
-    make_input_directory()
-
     # create the file
     print_red("generating word file")
 
-    os.chdir(INPUT_DIRECTORY)
-    FILE = "input_file"
-    with open(FILE, "w") as f:
-        words = [("r" * num_characters_per_word) + "\n" for w in range(num_words)]
-        for word in words:
-            f.write(word)
+    hdfs_put_files([("input_file", input_generator.cycled_word_chunks(["r" * num_characters_per_word], num_words))])
 
     print("Generated word file with {0} {1} character words".format(num_words, num_characters_per_word))
 
-    # add the file to HDFS
-    generate_input = execute_command(HDFS + " dfs -put " + INPUT_DIRECTORY, stderr=subprocess.DEVNULL)
-    print(generate_input.decode())
 
-
-def hdfs_generate_word_files(num_files, file_size_in_MiB):
+def hdfs_generate_word_files(num_files, file_size_in_MiB, num_concurrent_uploads=1):
     """
-    Generates num_files file(s) each of size file_size_in_MiB in INPUT_DIRECTORY,
-    then adds the files to HDFS. Each file contains the same word. For example
-    "path = generate_word_files(2, 2)" will generate two files, each being 2 MiB
-    and containing all the same word (each word is 'w' repeated some number of
+    Generates num_files file(s) each of size file_size_in_MiB and streams them into
+    HDFS_INPUT_DIRECTORY in HDFS, num_concurrent_uploads at a time. Each file contains
+    the same word. For example "path = generate_word_files(2, 2)" will generate two files,
+    each being 2 MiB and containing all the same word (each word is 'w' repeated some number of
     times such that we get the desired file size).
     """
-    make_input_directory()
-
     # create the files
     print_red("generating word files")
 
-    os.chdir(INPUT_DIRECTORY)
     WORD_SIZE = 1000 # characters
-    for i in range(num_files):
-        with open("input_file_{}".format(i), "w") as f:
-            words = [("w" * (WORD_SIZE - 1)) + '\n' for w in range(MiB_to_bytes(file_size_in_MiB) // WORD_SIZE)]
-            for word in words:
-                f.write(word)
+    files = [("input_file_{}".format(i),
+                input_generator.cycled_word_chunks(["w" * (WORD_SIZE - 1)], MiB_to_bytes(file_size_in_MiB) // WORD_SIZE))
+                for i in range(num_files)]
+    hdfs_put_files(files, num_concurrent_uploads)
 
     print("Input files generated: {}, File Size: {} MiB".format(num_files, file_size_in_MiB))
 
-    # add the files to HDFS
-    generate_inputs = execute_command(HDFS + " dfs -put " + INPUT_DIRECTORY, stderr=subprocess.DEVNULL)
-    print(generate_inputs.decode())
+
+def hdfs_generate_small_files(num_files, file_size, num_threads=8):
+    """
+    Generates num_files files of file_size bytes each (lines of 'w's) into
+    HDFS_INPUT_DIRECTORY in HDFS, for inputs made of tens of thousands of files.
+    Uploading them one at a time would take a request (or a JVM) per file, so they
+    are written to INPUT_DIRECTORY by input_generator.write_small_files() and
+    uploaded with a single "hdfs dfs -copyFromLocal -t" of the directory, which
+    copies num_threads files at a time (at most twice the number of processors, see
+    CopyCommands.CopyFromLocal, "-put" has no -t in this version of Hadoop). Returns
+    the number of seconds spent writing and uploading the files.
+    """
+    print_red("generating {} small files".format(num_files))
+
+    start = time.perf_counter()
+    make_input_directory()
+    input_generator.write_small_files(INPUT_DIRECTORY, num_files, file_size, num_threads=num_threads)
+    write_seconds = time.perf_counter() - start
+
+    # INPUT_DIRECTORY is named like HDFS_INPUT_DIRECTORY, so it is merged into it;
+    # -d skips the temporary ._COPYING_ file (and the rename) of every file
+    start = time.perf_counter()
+    execute_command("{} dfs -copyFromLocal -f -d -t {} {} /user/hadoop".format(
+        HDFS, min(num_threads, 2 * os.cpu_count()), INPUT_DIRECTORY))
+    upload_seconds = time.perf_counter() - start
+    shutil.rmtree(INPUT_DIRECTORY)
+
+    print("Input files generated: {}, File Size: {} bytes, written in {:.2f} s, uploaded in {:.2f} s".format(
+        num_files, file_size, write_seconds, upload_seconds))
+    return write_seconds, upload_seconds
+
+
+# the time it took to execute a command with execute_command() and its exit status
+CommandLatency = namedtuple("CommandLatency", ["command", "seconds", "returncode", "persistent_shell"])
+
+
+class HadoopShell:
+    """
+    A bash process running as the "hadoop" user that executes commands one after the
+    other, so that "su" and bash are started once instead of once per command.
+
+    Each command is written to the stdin of the shell followed by a command that
+    prints a marker, unique to the command, and its exit status; its output is
+    everything the shell prints before the marker. Commands run in a subshell so that
+    they can't change the working directory or the environment of the next ones, and
+    with their stdin redirected from /dev/null so that they can't read the commands
+    that follow them. Commands are executed one at a time, even if run() is called
+    from several threads. The shell is started when the first command is run, started
+    again if it exits, and closed when the interpreter exits.
+    """
+    def __init__(self):
+        self.process = None
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def start(self):
+        self.process = subprocess.Popen(["su", "hadoop", "-c", "bash"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+        self.process = None
+
+    def read_output(self, marker):
+        """
+        Reads the output of the shell until the line "<marker> <exit status>" and
+        returns what came before it (without the newline printed before the marker)
+        and the exit status.
+        """
+        marker = b"\n" + marker + b" "
+        output = bytearray()
+        while True:
+            chunk = os.read(self.process.stdout.fileno(), 1 << 16)
+            if not chunk:
+                raise subprocess.SubprocessError("the hadoop shell exited")
+            output += chunk
+
+            # the marker line is the last thing printed before the next command is written
+            if output.endswith(b"\n"):
+                end = output.rfind(marker, max(0, len(output) - len(chunk) - len(marker) - 16))
+                if end != -1:
+                    return bytes(output[:end]), int(output[end + len(marker):-1])
+
+    def run(self, command, stderr=None):
+        """
+        Executes command like subprocess.check_output(["su", "hadoop", "-c", command], stderr=stderr),
+        where stderr is None, subprocess.DEVNULL or subprocess.STDOUT, and returns its output.
+        """
+        redirect = {None: "", subprocess.DEVNULL: " 2>/dev/null", subprocess.STDOUT: " 2>&1"}[stderr]
+        marker = "hadoop_shell_{}".format(uuid.uuid4().hex)
+        script = "(\n{}\n){} </dev/null\nprintf '\\n{} %d\\n' $?\n".format(command, redirect, marker)
+
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self.start()
+            self.process.stdin.write(script.encode())
+            self.process.stdin.flush()
+            output, returncode = self.read_output(marker.encode())
+
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command, output)
+        return output
+
+
+# commands are run by a single persistent shell, unless this is set to False
+USE_PERSISTENT_SHELL = True
+HADOOP_SHELL = HadoopShell()
+
+# every command executed by execute_command(), see print_command_latencies()
+COMMAND_LATENCIES = []
 
 
 def execute_command(command, **kwargs):
     """
     Wrapper around subprocess.check_output().
-    Executes command by spawning a process to be run as the "hadoop" user
-    and waiting for it to return its output.
+    Executes command as the "hadoop" user and waits for it to return its output.
+    Unless USE_PERSISTENT_SHELL is False or kwargs has other arguments than stderr,
+    the command is run by HADOOP_SHELL instead of spawning "su" for it. The time
+    it took is recorded in COMMAND_LATENCIES.
     """
     print_purple("executing: ", end='')
     print(command)
-    return subprocess.check_output(["su", "hadoop", "-c", command], **kwargs)
+
+    persistent_shell = USE_PERSISTENT_SHELL and set(kwargs) <= {"stderr"}
+    start = time.perf_counter()
+    returncode = 0
+    try:
+        if persistent_shell:
+            return HADOOP_SHELL.run(command, **kwargs)
+        return subprocess.check_output(["su", "hadoop", "-c", command], **kwargs)
+    except subprocess.CalledProcessError as e:
+        returncode = e.returncode
+        raise
+    finally:
+        COMMAND_LATENCIES.append(CommandLatency(command, time.perf_counter() - start, returncode, persistent_shell))
+
+
+def print_command_latencies(latencies=None):
+    """
+    Prints how many commands were executed with execute_command() and how long
+    they took, per program (e.g. "hdfs dfs", "yarn application"), followed by the
+    WebHDFS requests per operation (e.g. "webhdfs MKDIRS") unless latencies are given.
+    """
+    seconds_by_program = defaultdict(list)
+    if latencies is None:
+        latencies = COMMAND_LATENCIES
+        if WEBHDFS_CLIENT is not None:
+            for latency in WEBHDFS_CLIENT.latencies:
+                seconds_by_program["webhdfs " + latency.op].append(latency.seconds)
+
+    for latency in latencies:
+        words = latency.command.split()
+        seconds_by_program[" ".join([os.path.basename(words[0])] + words[1:2])].append(latency.seconds)
+
+    print_red("command latencies")
+    for program, seconds in sorted(seconds_by_program.items(), key=lambda item: -sum(item[1])):
+        print("{}: {} commands, {:.2f} seconds in total, {:.3f} mean, {:.3f} max".format(
+            program, len(seconds), sum(seconds), sum(seconds) / len(seconds), max(seconds)))
 
 
 def hadoop_start_up():
@@ -159,13 +425,13 @@ def hadoop_start_up():
     # if we are correctly running in pseudodistributed mode, we should see the following:
     # Jps, ResourceManager, SecondaryNameNode, NodeManager, DataNode, NameNode
     print_red("currently running jvms")
-    jps = execute_command("/usr/local/java/bin/jps", stderr=subprocess.DEVNULL)
+    jps = execute_command(JPS, stderr=subprocess.DEVNULL)
     print(jps.decode())
 
-    # create directory for hadoop user in hdfs at /user/hadoop
+    # create directory for hadoop user in hdfs at /user/hadoop, WebHDFS requests are
+    # retried until the namenode (just started by start-dfs.sh) accepts them
     print_red("creating hdfs folder for the hadoop user")
-    execute_command(HDFS + " dfs -mkdir /user", stderr=subprocess.DEVNULL)
-    execute_command(HDFS + " dfs -mkdir /user/hadoop", stderr=subprocess.DEVNULL)
+    get_webhdfs_client().mkdirs("/user/hadoop")
     print("/user/hadoop created in hdfs \n")
 
 
@@ -189,7 +455,7 @@ def hadoop_tear_down():
     # show currently running jvms
     # if we are correctly running in pseudodistributed mode, we should see the following: Jps, ResourceManager, SecondaryNameNode, NodeManager, DataNode, NameNode
     print_red("check that no jvms running hadoop daemons are present")
-    jps = execute_command("/usr/local/java/bin/jps", stderr=subprocess.DEVNULL)
+    jps = execute_command(JPS, stderr=subprocess.DEVNULL)
     print(jps.decode())
 
     # cleanup
@@ -197,28 +463,204 @@ def hadoop_tear_down():
     rm_tmp = subprocess.check_output(["rm", "-rf", "/tmp/hadoop-hadoop", "/tmp/hadoop-yarn-hadoop"])
 
 
-def hadoop_print_configuration_property_values(*properties):
+def hadoop_get_running_daemons():
+    """
+    Returns the set of names of the jvms currently listed by jps
+    (e.g. {"NameNode", "DataNode", "ResourceManager", ...}).
+    """
+    jps = execute_command(JPS, stderr=subprocess.DEVNULL)
+
+    # each line of jps output is "<pid> <main class name>"
+    return {tokens[1] for tokens in map(str.split, jps.decode().splitlines()) if len(tokens) == 2}
+
+
+def hadoop_health_check():
+    """
+    Checks that every daemon in HADOOP_DAEMONS is running using jps and starts
+    only the ones that are missing instead of restarting the whole environment.
+    Returns the list of daemons that had to be started.
+    """
+    running_daemons = hadoop_get_running_daemons()
+    missing_daemons = [daemon for daemon in HADOOP_DAEMONS if daemon not in running_daemons]
+
+    for daemon in missing_daemons:
+        print_red("{} is not running, starting it".format(daemon))
+        execute_command(HADOOP_DAEMONS[daemon], stderr=subprocess.DEVNULL)
+
+    # a restarted namenode comes back up in safe mode, in which case hdfs is read only
+    if "NameNode" in missing_daemons or "DataNode" in missing_daemons:
+        execute_command(HDFS + " dfsadmin -safemode wait", stderr=subprocess.DEVNULL)
+
+    return missing_daemons
+
+
+def hdfs_reset_user_directory():
+    """
+    Removes everything under /user/hadoop in HDFS (inputs and outputs of previous
+    jobs, hidden files included) by deleting the directory and creating it again,
+    which takes two WebHDFS requests.
+    """
+    print_red("resetting hdfs folder for the hadoop user")
+    client = get_webhdfs_client()
+    client.delete("/user/hadoop", recursive=True)
+    client.mkdirs("/user/hadoop")
+
+
+def yarn_kill_active_applications():
     """
-    Prints the configuration values for the given properties.
+    Kills any YARN application that has not yet finished so that it can't
+    interfere with the next job. Returns the list of killed application ids.
+    """
+    yarn_app_list = execute_command(YARN + " application -list -appStates NEW,NEW_SAVING,SUBMITTED,ACCEPTED,RUNNING",
+                                    stderr=subprocess.DEVNULL)
+    application_ids = re.findall(r'application_[0-9]+_[0-9]+', yarn_app_list.decode())
+
+    # "yarn application -kill" takes several applications at once
+    if application_ids:
+        print_red("killing {}".format(" ".join(application_ids)))
+        execute_command(YARN + " application -kill " + " ".join(application_ids), stderr=subprocess.DEVNULL)
+
+    return application_ids
+
+
+class HadoopSession:
+    """
+    Context manager that keeps a single pseudodistributed Hadoop environment
+    running for several test cases instead of formatting the namenode and
+    restarting every daemon for each one of them. For example:
+
+    with util.HadoopSession() as session:
+        for test_case in test_cases:
+            session.reset()
+            ...
+
+    reset() health checks the daemons (restarting only those that died),
+    kills unfinished YARN applications and clears /user/hadoop in HDFS.
+    The time each reset took, in seconds, is recorded in reset_times.
+    """
+    def __init__(self):
+        self.reset_times = []
+
+    def __enter__(self):
+        hadoop_start_up()
+        return self
+
+    def reset(self):
+        start = time.perf_counter()
+
+        hadoop_health_check()
+        yarn_kill_active_applications()
+        hdfs_reset_user_directory()
+
+        self.reset_times.append(time.perf_counter() - start)
+        return self.reset_times[-1]
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        hadoop_tear_down()
+        return False
+
+
+def hadoop_get_configuration_property_value(property):
+    """
+    Returns the value of a configuration property according to GetConf, which starts a JVM.
+    Returns None if the property is not set.
+    """
+    try:
+        property_value = execute_command(HADOOP + " org.apache.hadoop.hdfs.tools.GetConf -confKey " + property, stderr=subprocess.DEVNULL)
+    except subprocess.CalledProcessError:
+        return None
+    return property_value.decode().strip()
+
+
+def hadoop_print_configuration_property_values(*properties, overrides=(), compare_with_getconf=False):
+    """
+    Prints the configuration values for the given properties, as seen by a job run
+    with the given "-D" overrides. The values are read from the configuration files
+    by hadoop_configuration.py. If compare_with_getconf is True, the values of GetConf
+    are also read and the properties whose value differs are printed (GetConf only
+    loads the core and hdfs resources, so it doesn't know mapred and yarn properties).
     """
     print_red("configuration property values")
 
     # get the property value and print it to stdout
+    configuration = hadoop_configuration.get_configuration(overrides)
     for property in properties:
-        property_value = execute_command(HADOOP + " org.apache.hadoop.hdfs.tools.GetConf -confKey " + property, stderr=subprocess.DEVNULL)
-        print("property: {}, value: {}".format(property, property_value.decode()))
+        print("property: {}, value: {}".format(property, configuration.get_trimmed(property)))
+
+    if compare_with_getconf:
+        getconf_values = {property: hadoop_get_configuration_property_value(property) for property in properties}
+        hadoop_configuration.print_mismatches(hadoop_configuration.compare_values(configuration, getconf_values))
 
 
 def yarn_get_application_id():
     """
-    Returns the applicationId with state FINISHED.
+    Returns the most recently submitted applicationId with state FINISHED.
     """
     # get the list of applications with state FINISHED from YARN
     yarn_app_list = execute_command(YARN + " application -list -appStates FINISHED", stderr=subprocess.DEVNULL)
 
-    # extract the only application_id that should be there
-    application_id = re.search(r'application_[0-9]+_[0-9]+', yarn_app_list.decode())
-    return application_id.group()
+    # when a HadoopSession is reused, there will be one finished application per
+    # previous test case, so pick the one with the highest (cluster timestamp, sequence number)
+    application_ids = re.findall(r'application_[0-9]+_[0-9]+', yarn_app_list.decode())
+    return max(application_ids, key=lambda application_id: tuple(map(int, application_id.split('_')[1:])))
+
+
+def yarn_get_application_report(application_id):
+    """
+    Returns the report of the given application (a dict containing, among other
+    things, "state", "finalStatus" and "logAggregationStatus") from the ResourceManager REST API.
+    """
+    with urllib.request.urlopen(RESOURCE_MANAGER_URL + "/apps/" + application_id) as response:
+        return json.loads(response.read().decode())["app"]
+
+
+def yarn_get_latest_application_id():
+    """
+    Returns the id of the most recently submitted application, whatever its state,
+    using the ResourceManager REST API. Unlike yarn_get_application_id(), this also
+    finds an application whose state hasn't been updated to FINISHED yet. Returns
+    None if the ResourceManager has no applications.
+    """
+    with urllib.request.urlopen(RESOURCE_MANAGER_URL + "/apps") as response:
+        # "apps" is null rather than an empty list when there are no applications
+        apps = (json.loads(response.read().decode())["apps"] or {}).get("app") or []
+
+    if not apps:
+        return None
+    return max((app["id"] for app in apps), key=lambda application_id: tuple(map(int, application_id.split('_')[1:])))
+
+
+def yarn_wait_for_logs(application_id, timeout=120, initial_delay=0.1, max_delay=2):
+    """
+    Polls the ResourceManager REST API until the given application has completed and
+    the aggregation of its logs is done, so that "yarn logs" can return all of them.
+    The delay between polls starts at initial_delay seconds and doubles up to max_delay.
+    Returns the number of seconds spent waiting, or raises TimeoutError after timeout seconds.
+    """
+    start = time.perf_counter()
+    delay = initial_delay
+
+    while True:
+        try:
+            report = yarn_get_application_report(application_id)
+            if (report["state"] in YARN_FINAL_APPLICATION_STATES and
+                    report.get("logAggregationStatus") in YARN_FINAL_LOG_AGGREGATION_STATUSES):
+                break
+        except urllib.error.URLError:
+            # the application may not be known by the ResourceManager yet
+            report = None
+
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("logs of {} not available after {} seconds".format(application_id, timeout))
+
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+    waited = time.perf_counter() - start
+    print_red("logs of {} available after waiting {:.2f} seconds (log aggregation status: {})".format(
+        application_id, waited, report["logAggregationStatus"]))
+
+    return waited
 
 
 def yarn_write_logs_to_file(application_id):
@@ -284,8 +726,7 @@ def is_log4j_output_prefixed_with_date(line):
 def sort_log4j_by_timestamp(lines):
     """
     Takes in as input a list of lines generated from map reduce and returns a new
-    list with the logs sorted by timestamp.
+    list with the logs sorted by timestamp. See log4j_parser.sort_file() to
+    filter and sort the lines of a log file in a single pass.
     """
-    lines_by_timestamp = [(log4j_get_iso8601_datetime(line), line) for line in lines if is_log4j_output_prefixed_with_date(line)]
-    lines_by_timestamp = sorted(lines_by_timestamp, key=lambda line: line[0])
-    return [line[1] for line in lines_by_timestamp]
+    return log4j_parser.sort_lines(lines)
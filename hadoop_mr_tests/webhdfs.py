@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+"""
+Client of the WebHDFS REST API of the NameNode, so that HDFS operations don't have
+to start a JVM ("hdfs dfs ...") each. Requests are sent over HTTP/1.1 connections that
+are kept alive and reused, one pool per host (the NameNode and the DataNode), so a
+series of operations doesn't open a new connection for each one either.
+
+Files are created in two steps, as described in the WebHDFS documentation: the NameNode
+answers "PUT ?op=CREATE" with a redirect (307) to a DataNode, to which the contents are
+then sent, with chunked transfer encoding when they are given as an iterable of chunks,
+so that files of any size are streamed without knowing their length in advance.
+
+The NameNode may not accept requests right after it has been started (connections are
+refused, or it is in safe mode), so the requests to it are retried for a while.
+
+Errors are raised as WebHdfsError, with the Java exception of the RemoteException
+returned by the server.
+
+Running this file creates, lists, summarizes and deletes small files in HDFS and
+compares the time it takes with "hdfs dfs": ./webhdfs.py [number of files]
+"""
+import sys
+import json
+import time
+import threading
+import http.client
+import urllib.parse
+from collections import namedtuple, defaultdict
+
+# these modules will be placed in the same directory as this file by Dockerfile 'COPY'
+import hadoop_configuration
+
+WEBHDFS_PREFIX = "/webhdfs/v1"
+
+# the exceptions of a NameNode that is starting up, after which requests can be retried
+RETRIABLE_EXCEPTIONS = {"RetriableException", "SafeModeException", "StandbyException"}
+
+# a file or directory of list_status(), path_suffix is its name in the listed directory
+FileStatus = namedtuple("FileStatus", ["path_suffix", "type", "length", "block_size", "replication",
+                                       "modification_time", "permission", "owner", "group"])
+
+ContentSummary = namedtuple("ContentSummary", ["directory_count", "file_count", "length", "space_consumed"])
+
+# the time it took to execute a request, status is the HTTP status of the response
+RequestLatency = namedtuple("RequestLatency", ["op", "path", "seconds", "status"])
+
+
+class WebHdfsError(OSError):
+    """
+    Error returned by WebHDFS, exception is the simple name of the Java exception.
+    """
+    def __init__(self, status, exception, message):
+        super().__init__("{} {}: {}".format(status, exception, message))
+        self.status = status
+        self.exception = exception
+        self.message = message
+
+
+def namenode_http_address():
+    """
+    Returns the (host, port) of the HTTP server of the NameNode according to
+    dfs.namenode.http-address, with localhost instead of the wildcard address.
+    """
+    host, port = hadoop_configuration.get_configuration().get_trimmed("dfs.namenode.http-address", "0.0.0.0:9870").rsplit(":", 1)
+    return ("localhost" if host == "0.0.0.0" else host), int(port)
+
+
+class ConnectionPool:
+    """
+    Idle HTTP connections per (host, port), which are taken by one request at a time.
+    """
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = defaultdict(list)
+
+    def get(self, host, port):
+        with self.lock:
+            if self.idle[host, port]:
+                return self.idle[host, port].pop()
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def put(self, connection):
+        with self.lock:
+            self.idle[connection.host, connection.port].append(connection)
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+
+class WebHdfsClient:
+    """
+    WebHDFS client acting as user (simple authentication). Relative paths are
+    relative to /user/<user>, like the paths given to "hdfs dfs".
+    """
+    def __init__(self, address=None, user="hadoop", retry_timeout=60, pool=None):
+        self.host, self.port = address if address is not None else namenode_http_address()
+        self.user = user
+        self.retry_timeout = retry_timeout
+        self.pool = pool if pool is not None else ConnectionPool()
+        self.latencies = []
+
+    def absolute_path(self, path):
+        return path if path.startswith("/") else "/user/{}/{}".format(self.user, path)
+
+    def url(self, path, op, **parameters):
+        parameters = dict(parameters, op=op)
+        parameters["user.name"] = self.user
+        query = urllib.parse.urlencode(sorted((name, str(value).lower() if isinstance(value, bool) else value)
+                                              for name, value in parameters.items() if value is not None))
+        return WEBHDFS_PREFIX + urllib.parse.quote(self.absolute_path(path)) + "?" + query
+
+    def send(self, method, host, port, url, body=None, headers=None):
+        """
+        Sends a request on a pooled connection and returns (status, headers, body) of
+        the response, which is read completely so that the connection can be reused.
+        A connection that the server has closed since it was last used is replaced once.
+        """
+        for attempt in range(2):
+            connection = self.pool.get(host, port)
+            try:
+                connection.request(method, url, body=body, headers=headers or {},
+                                   encode_chunked=body is not None and not isinstance(body, (bytes, bytearray)))
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                connection.close()
+                # a body that is an iterator can only be sent once
+                if attempt == 1 or not (body is None or isinstance(body, (bytes, bytearray))):
+                    raise
+                continue
+            except Exception:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self.pool.put(connection)
+            return response.status, response.headers, data
+
+    def namenode_request(self, method, path, op, **parameters):
+        """
+        Sends a request without a body to the NameNode, retrying until retry_timeout
+        if the NameNode refuses the connection or is starting up. Returns the status,
+        headers and body of the response, or raises WebHdfsError.
+        """
+        url = self.url(path, op, **parameters)
+        start = time.perf_counter()
+        delay = 0.1
+        while True:
+            try:
+                status, headers, data = self.send(method, self.host, self.port, url)
+            except ConnectionRefusedError:
+                if time.perf_counter() - start > self.retry_timeout:
+                    raise
+            else:
+                try:
+                    check_response(status, data)
+                    self.latencies.append(RequestLatency(op, path, time.perf_counter() - start, status))
+                    return status, headers, data
+                except WebHdfsError as e:
+                    if e.exception not in RETRIABLE_EXCEPTIONS or time.perf_counter() - start > self.retry_timeout:
+                        self.latencies.append(RequestLatency(op, path, time.perf_counter() - start, status))
+                        raise
+            time.sleep(delay)
+            delay = min(delay * 2, 2)
+
+    def namenode_json(self, method, path, op, **parameters):
+        return json.loads(self.namenode_request(method, path, op, **parameters)[2].decode())
+
+    def mkdirs(self, path, permission=None):
+        """
+        Creates a directory and its missing parents ("hdfs dfs -mkdir -p").
+        """
+        return self.namenode_json("PUT", path, "MKDIRS", permission=permission)["boolean"]
+
+    def create(self, path, data, overwrite=True, permission=None, block_size=None, replication=None):
+        """
+        Creates (or overwrites) a file with the given contents, bytes or an iterable of
+        chunks of bytes, which are streamed to the DataNode. Returns the number of bytes sent.
+        """
+        start = time.perf_counter()
+        _, headers, _ = self.namenode_request("PUT", path, "CREATE", overwrite=overwrite, permission=permission,
+                                              blocksize=block_size, replication=replication)
+        location = urllib.parse.urlsplit(headers["Location"])
+
+        num_bytes = [0]
+        if isinstance(data, (bytes, bytearray)):
+            body = data
+            num_bytes[0] = len(data)
+        else:
+            def body_chunks():
+                for chunk in data:
+                    if chunk:
+                        num_bytes[0] += len(chunk)
+                        yield chunk
+            body = body_chunks()
+
+        status, _, response = self.send("PUT", location.hostname, location.port, location.path + "?" + location.query,
+                                        body=body, headers={"Content-Type": "application/octet-stream"})
+        self.latencies.append(RequestLatency("CREATE (data)", path, time.perf_counter() - start, status))
+        check_response(status, response)
+        return num_bytes[0]
+
+    def list_status(self, path):
+        """
+        FileStatus of each file and directory in a directory, or of a file.
+        """
+        statuses = self.namenode_json("GET", path, "LISTSTATUS")["FileStatuses"]["FileStatus"]
+        return [FileStatus(status["pathSuffix"], status["type"], status["length"], status["blockSize"],
+                           status["replication"], status["modificationTime"], status["permission"],
+                           status["owner"], status["group"]) for status in statuses]
+
+    def delete(self, path, recursive=False):
+        """
+        Deletes a file or a directory, without moving it to the trash. Returns False
+        if there was nothing to delete.
+        """
+        return self.namenode_json("DELETE", path, "DELETE", recursive=recursive)["boolean"]
+
+    def get_content_summary(self, path):
+        """
+        Number of directories and files under a path and their length ("hdfs dfs -count").
+        """
+        summary = self.namenode_json("GET", path, "GETCONTENTSUMMARY")["ContentSummary"]
+        return ContentSummary(summary["directoryCount"], summary["fileCount"], summary["length"], summary["spaceConsumed"])
+
+    def close(self):
+        self.pool.close()
+
+
+def check_response(status, data):
+    """
+    Raises WebHdfsError if the status of a response is an error.
+    """
+    if status < 400:
+        return
+
+    try:
+        remote_exception = json.loads(data.decode())["RemoteException"]
+        raise WebHdfsError(status, remote_exception["exception"], remote_exception["message"])
+    except (ValueError, KeyError):
+        raise WebHdfsError(status, "HTTP {}".format(status), data.decode(errors="replace"))
+
+
+def print_latencies(latencies):
+    """
+    Prints the number of requests of each operation and how long they took.
+    """
+    seconds_by_op = defaultdict(list)
+    for latency in latencies:
+        seconds_by_op[latency.op].append(latency.seconds)
+
+    for op, seconds in sorted(seconds_by_op.items()):
+        print("{}: {} requests, {:.2f} seconds in total, {:.4f} mean".format(op, len(seconds), sum(seconds),
+                                                                         sum(seconds) / len(seconds)))
+
+
+def benchmark(num_files):
+    """
+    Creates num_files small files in a directory with WebHDFS, lists, summarizes and
+    deletes it, then does the same with "hdfs dfs" (one command per file), which is
+    what util used to do. Must be run as a user that can "su hadoop".
+    """
+    import util
+
+    client = WebHdfsClient()
+    directory = "webhdfs_benchmark"
+
+    start = time.perf_counter()
+    client.mkdirs(directory)
+    for i in range(num_files):
+        client.create("{}/file_{}".format(directory, i), "file {}\n".format(i).encode())
+    assert len(client.list_status(directory)) == num_files
+    assert client.get_content_summary(directory).file_count == num_files
+    assert client.delete(directory, recursive=True)
+    webhdfs_seconds = time.perf_counter() - start
+    print_latencies(client.latencies)
+
+    start = time.perf_counter()
+    util.execute_command(util.HDFS + " dfs -mkdir -p " + directory)
+    for i in range(num_files):
+        util.hdfs_put_chunks_with_cli(["file {}\n".format(i).encode()], "{}/file_{}".format(directory, i))
+    util.execute_command(util.HDFS + " dfs -ls " + directory)
+    util.execute_command(util.HDFS + " dfs -count " + directory)
+    util.execute_command(util.HDFS + " dfs -rm -r -skipTrash " + directory)
+    cli_seconds = time.perf_counter() - start
+
+    print("{} files: WebHDFS {:.2f} seconds, hdfs dfs {:.2f} seconds".format(num_files, webhdfs_seconds, cli_seconds))
+
+
+if __name__=="__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
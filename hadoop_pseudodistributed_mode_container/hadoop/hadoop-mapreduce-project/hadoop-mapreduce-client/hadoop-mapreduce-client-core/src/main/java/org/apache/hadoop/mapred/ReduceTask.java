@@ -388,10 +388,13 @@ public class ReduceTask extends Task {
     // pid_string is formatted as, <pid>@computer-name, pulling out just pid
     pid_string = pid_string.split("@")[0];
 
-    // output file of system call trace will be created for each process
+    // output file of system call trace will be created for each process,
+    // with microsecond timestamps (-tt) and the paths and socket addresses of
+    // file descriptors (-yy), as parsed by reduce_merge_parts/strace_parser.py
     ProcessBuilder proc_builder = new ProcessBuilder("/usr/bin/strace",
-            "-ff", "-t", "-y", "-s", "300",
-            "-p", pid_string, "-e", "trace=read,write,openat",
+            "-ff", "-tt", "-yy", "-s", "300",
+            "-p", pid_string, "-e",
+            "trace=read,write,openat,pread64,pwrite64,readv,writev,lseek,fsync,fdatasync",
             "-o", "/home/hadoop/strace_output/output");
 
     /*
@@ -399,10 +402,14 @@ public class ReduceTask extends Task {
     proc_builder.redirectError(strace_stderr);
     */
 
-    try {
-      Process proc = proc_builder.start();
-    } catch (Exception e) {
-      e.printStackTrace();
+    // strace slows the task down a lot, so it is not started when the task is
+    // profiled instead (see hadoop_mr_tests/task_profiler.py)
+    if (job.getBoolean("mapreduce.reduce.strace", true)) {
+      try {
+        Process proc = proc_builder.start();
+      } catch (Exception e) {
+        e.printStackTrace();
+      }
     }
 
     System.out.println("calling shuffleConsumerPlugin.run()");
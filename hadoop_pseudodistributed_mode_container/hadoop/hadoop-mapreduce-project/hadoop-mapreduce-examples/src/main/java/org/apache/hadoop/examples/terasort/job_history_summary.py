@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 #
 # Licensed to the Apache Software Foundation (ASF) under one
 # or more contributor license agreements.  See the NOTICE file
@@ -16,85 +16,133 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""
+Summarizes the job history file (.jhist) of a job: the output bytes, shuffle finish
+and finish time of every reduce, then the number of running maps, shuffling, merging
+and running reduces during each second of the job.
+
+The history file must be in the JSON format (mapreduce.jobhistory.jhist.format=json),
+which has one event per line. Lines are streamed and only the events of successful
+task attempts are parsed, then the timeline is computed with difference arrays: +1 in
+the second an attempt enters a phase and -1 in the second it leaves it, summed once.
+
+Usage: job_history_summary.py [job.jhist]   (reads standard input by default)
+"""
+
 import re
 import sys
+import json
+
+import numpy as np
+
+JSON_VERSION = b"Avro-Json"
+
+# the fields of the events of successful attempts, which come before their counters
+TASK_ID = re.compile(rb'"taskid":"([^"]*)"')
+ATTEMPT_ID = re.compile(rb'"attemptId":"([^"]*)"')
+START_TIME = re.compile(rb'"startTime":(\d+)')
+SHUFFLE_FINISH_TIME = re.compile(rb'"shuffleFinishTime":(\d+)')
+SORT_FINISH_TIME = re.compile(rb'"sortFinishTime":(\d+)')
+FINISH_TIME = re.compile(rb'"finishTime":(\d+)')
+
+MAP_ATTEMPT_STARTED = b'{"type":"MAP_ATTEMPT_STARTED"'
+MAP_ATTEMPT_FINISHED = b'{"type":"MAP_ATTEMPT_FINISHED"'
+REDUCE_ATTEMPT_STARTED = b'{"type":"REDUCE_ATTEMPT_STARTED"'
+REDUCE_ATTEMPT_FINISHED = b'{"type":"REDUCE_ATTEMPT_FINISHED"'
+TASK_FINISHED = b'{"type":"TASK_FINISHED"'
+
+REDUCE_OUTPUT_GROUP = "org.apache.hadoop.mapreduce.FileSystemCounter"
+REDUCE_OUTPUT_COUNTER = "HDFS_BYTES_WRITTEN"
+
+
+def read_events(lines):
+  """
+  Returns the start and finish times (in seconds) of the successful attempts of a
+  job, the task of each reduce attempt and the HDFS bytes written by each reduce task.
+  """
+  map_start = {}
+  map_finish = {}
+  reduce_start = {}
+  # attempt id -> (shuffle finish, sort finish, finish)
+  reduce_finish = {}
+  reduce_task = {}
+  reduce_bytes = {}
+
+  lines = iter(lines)
+  version = next(lines, b"").rstrip()
+  if version != JSON_VERSION:
+    raise ValueError("not a JSON job history file (version {!r}), run the job with "
+                     "-D mapreduce.jobhistory.jhist.format=json".format(version))
+
+  for line in lines:
+    if line.startswith(MAP_ATTEMPT_STARTED):
+      map_start[ATTEMPT_ID.search(line).group(1)] = int(START_TIME.search(line).group(1)) // 1000
+    elif line.startswith(MAP_ATTEMPT_FINISHED):
+      map_finish[ATTEMPT_ID.search(line).group(1)] = int(FINISH_TIME.search(line).group(1)) // 1000
+    elif line.startswith(REDUCE_ATTEMPT_STARTED):
+      reduce_start[ATTEMPT_ID.search(line).group(1)] = int(START_TIME.search(line).group(1)) // 1000
+    elif line.startswith(REDUCE_ATTEMPT_FINISHED):
+      attempt = ATTEMPT_ID.search(line).group(1)
+      reduce_task[attempt] = TASK_ID.search(line).group(1).decode()
+      reduce_finish[attempt] = (int(SHUFFLE_FINISH_TIME.search(line).group(1)) // 1000,
+                                int(SORT_FINISH_TIME.search(line).group(1)) // 1000,
+                                int(FINISH_TIME.search(line).group(1)) // 1000)
+    elif line.startswith(TASK_FINISHED) and b'"taskType":"REDUCE"' in line:
+      task = next(iter(json.loads(line.decode())["event"].values()))
+      for group in task["counters"]["groups"]:
+        if group["name"] == REDUCE_OUTPUT_GROUP:
+          for counter in group["counts"]:
+            if counter["name"] == REDUCE_OUTPUT_COUNTER:
+              reduce_bytes[task["taskid"]] = counter["value"]
+
+  return map_start, map_finish, reduce_start, reduce_finish, reduce_task, reduce_bytes
+
+
+def running(starts, ends, start_time, num_seconds):
+  """
+  Number of intervals [start, end) that contain each second of the job.
+  """
+  return np.cumsum(np.bincount(starts - start_time, minlength=num_seconds + 1) -
+                   np.bincount(ends - start_time, minlength=num_seconds + 1))[:num_seconds]
+
+
+def summarize(lines, out):
+  map_start, map_finish, reduce_start, reduce_finish, reduce_task, reduce_bytes = read_events(lines)
+
+  # attempts that started and finished successfully
+  maps = [attempt for attempt in map_finish if attempt in map_start]
+  reduces = [attempt for attempt in reduce_finish if attempt in reduce_start]
+  map_times = np.array([(map_start[attempt], map_finish[attempt]) for attempt in maps], dtype=np.int64).reshape(-1, 2)
+  reduce_times = np.array([(reduce_start[attempt],) + reduce_finish[attempt] for attempt in reduces],
+                          dtype=np.int64).reshape(-1, 4)
+
+  if not maps and not reduces:
+    raise ValueError("the job has no successful task attempts")
+  start_time = min(np.concatenate((map_times[:, 0], reduce_times[:, 0])))
+  end_time = max(np.concatenate((map_times[:, 1], reduce_times[:, 3])))
+  num_seconds = end_time - start_time
+
+  reduce_times_by_task = {reduce_task[attempt]: times for attempt, times in zip(reduces, reduce_times.tolist())}
+
+  out.write("Name reduce-output-bytes shuffle-finish reduce-finish\n")
+  for task in sorted(reduce_bytes):
+    if task in reduce_times_by_task:
+      _, shuffle_finish, _, finish = reduce_times_by_task[task]
+      out.write("{} {} {} {}\n".format(task, reduce_bytes[task], shuffle_finish - start_time, finish - start_time))
+  out.write("\n")
+
+  timeline = np.column_stack((np.arange(num_seconds),
+                              running(map_times[:, 0], map_times[:, 1], start_time, num_seconds),
+                              running(reduce_times[:, 0], reduce_times[:, 1], start_time, num_seconds),
+                              running(reduce_times[:, 1], reduce_times[:, 2], start_time, num_seconds),
+                              running(reduce_times[:, 2], reduce_times[:, 3], start_time, num_seconds)))
+  out.write("time maps shuffle merge reduce\n")
+  out.writelines("{} {} {} {} {}\n".format(*row) for row in timeline.tolist())
+
 
-pat = re.compile('(?P<name>[^=]+)="(?P<value>[^"]*)" *')
-counterPat = re.compile('(?P<name>[^:]+):(?P<value>[^,]*),?')
-
-def parse(tail):
-  result = {}
-  for n,v in re.findall(pat, tail):
-    result[n] = v
-  return result
-
-mapStartTime = {}
-mapEndTime = {}
-reduceStartTime = {}
-reduceShuffleTime = {}
-reduceSortTime = {}
-reduceEndTime = {}
-reduceBytes = {}
-
-for line in sys.stdin:
-  words = line.split(" ",1)
-  event = words[0]
-  attrs = parse(words[1])
-  if event == 'MapAttempt':
-    if attrs.has_key("START_TIME"):
-      mapStartTime[attrs["TASKID"]] = int(attrs["START_TIME"])/1000
-    elif attrs.has_key("FINISH_TIME"):
-      mapEndTime[attrs["TASKID"]] = int(attrs["FINISH_TIME"])/1000
-  elif event == 'ReduceAttempt':
-    if attrs.has_key("START_TIME"):
-      reduceStartTime[attrs["TASKID"]] = int(attrs["START_TIME"]) / 1000
-    elif attrs.has_key("FINISH_TIME"):
-      reduceShuffleTime[attrs["TASKID"]] = int(attrs["SHUFFLE_FINISHED"])/1000
-      reduceSortTime[attrs["TASKID"]] = int(attrs["SORT_FINISHED"])/1000
-      reduceEndTime[attrs["TASKID"]] = int(attrs["FINISH_TIME"])/1000
-  elif event == 'Task':
-    if attrs["TASK_TYPE"] == "REDUCE" and attrs.has_key("COUNTERS"):
-      for n,v in re.findall(counterPat, attrs["COUNTERS"]):
-        if n == "File Systems.HDFS bytes written":
-          reduceBytes[attrs["TASKID"]] = int(v)
-
-runningMaps = {}
-shufflingReduces = {}
-sortingReduces = {}
-runningReduces = {}
-startTime = min(reduce(min, mapStartTime.values()),
-                reduce(min, reduceStartTime.values()))
-endTime = max(reduce(max, mapEndTime.values()),
-              reduce(max, reduceEndTime.values()))
-
-reduces = reduceBytes.keys()
-reduces.sort()
-
-print "Name reduce-output-bytes shuffle-finish reduce-finish"
-for r in reduces:
-  print r, reduceBytes[r], reduceShuffleTime[r] - startTime,
-  print reduceEndTime[r] - startTime
-
-print
-
-for t in range(startTime, endTime):
-  runningMaps[t] = 0
-  shufflingReduces[t] = 0
-  sortingReduces[t] = 0
-  runningReduces[t] = 0
-
-for map in mapStartTime.keys():
-  for t in range(mapStartTime[map], mapEndTime[map]):
-    runningMaps[t] += 1
-for reduce in reduceStartTime.keys():
-  for t in range(reduceStartTime[reduce], reduceShuffleTime[reduce]):
-    shufflingReduces[t] += 1
-  for t in range(reduceShuffleTime[reduce], reduceSortTime[reduce]):
-    sortingReduces[t] += 1
-  for t in range(reduceSortTime[reduce], reduceEndTime[reduce]):
-    runningReduces[t] += 1
-
-print "time maps shuffle merge reduce"
-for t in range(startTime, endTime):
-  print t - startTime, runningMaps[t], shufflingReduces[t], sortingReduces[t], 
-  print runningReduces[t]
+if __name__ == "__main__":
+  if len(sys.argv) > 1:
+    with open(sys.argv[1], "rb") as f:
+      summarize(f, sys.stdout)
+  else:
+    summarize(sys.stdin.buffer, sys.stdout)